@@ -0,0 +1,412 @@
+import os
+import time
+import threading
+import functools
+import itertools
+from collections import defaultdict
+from datetime import datetime
+from flask import request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import select, func, cast, or_, BigInteger
+from app import app, db
+from models import Sale, SaleItem, Product, Category, Employee
+import rollups
+from routes import report_dates
+
+# numpy يُستورد مع أول بناء للمكعب، فلا يبطئ بدء كل عامل وكل أمر CLI
+np = None
+
+EPOCH = datetime(1970, 1, 1)
+LOAD_CHUNK = 100_000  # sale lines converted to arrays at a time
+# معرّفات الأسطر الناقصة قرب القمة تُفحص مجدداً هذه المدة، فسطر بمعرّف
+# أصغر حُفظت معاملته متأخرة لا يضيع
+CUBE_SETTLE_SECONDS = 60
+GAP_SPAN = 100_000  # how far below the top id missing ids are tracked
+BUILD_RETRY_AFTER = 5  # seconds a client waits before asking again while the cube is built
+DELETED_LABEL = 'محذوف'  # اسم منتج أو موظف حُذف بعد البيع
+
+# أعمدة سطر البيع في الذاكرة؛ المنتج والموظف رموز كثيفة وليست معرّفات
+COLUMNS = (
+    ('sale', 'int32'),
+    ('product', 'int32'),
+    ('employee', 'int16'),
+    ('ts', 'int64'),  # Sale.created_at in seconds since the epoch
+    ('quantity', 'int32'),
+    ('cents', 'int64'),  # SaleItem.total_price * 100
+)
+ROW = None  # صف الاستعلام كما يصل من قاعدة البيانات، قبل الترميز
+
+
+def _import_numpy():
+    """Import numpy on first use; raises ImportError when it is not installed"""
+    global np, ROW
+    if np is None:
+        import numpy
+        ROW = numpy.dtype([('item', 'int64')] + [(name, 'int64') for name, _ in COLUMNS])
+        np = numpy
+
+
+def epoch_seconds(moment):
+    return int((moment - EPOCH).total_seconds())
+
+
+class _Dictionary:
+    """Dense codes 0..n-1 for database ids, looked up through an array indexed by id"""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.ids = np.empty(0, dtype=np.int64)  # code -> id
+        self._codes = np.empty(0, dtype=dtype)  # id -> code, -1 when unseen
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, ids):
+        if not len(ids):
+            return np.empty(0, dtype=self.dtype)
+        top = int(ids.max())
+        if top >= len(self._codes):
+            codes = np.full(max(top + 1, 2 * len(self._codes)), -1, dtype=self.dtype)
+            codes[:len(self._codes)] = self._codes
+            self._codes = codes
+        codes = self._codes[ids]
+        unseen = codes < 0
+        if unseen.any():
+            new = np.unique(ids[unseen])
+            self._codes[new] = np.arange(len(self.ids), len(self.ids) + len(new))
+            self.ids = np.concatenate([self.ids, new])
+            codes = self._codes[ids]
+        return codes
+
+
+class SalesCube:
+    """Columnar in-memory copy of sale lines for the dashboard charts.
+
+    A refresh only reads lines with a SaleItem.id above the highest one
+    it has seen; products are re-read when their
+    updated_at moves, which keeps category changes current. Each worker
+    keeps its own copy, built on a background thread started by the first
+    request that needs it, and queries work on a snapshot so they never
+    wait for a refresh.
+
+    On PostgreSQL ids are not committed in order, so ids missing just
+    below the top are looked up again on every refresh for
+    CUBE_SETTLE_SECONDS; sales are never edited or deleted.
+    """
+
+    def __init__(self, refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._arrays = None
+        self._loaded = False
+        self._builder = None
+        self._builder_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        self._lock = threading.Lock()
+        self._builder_lock = threading.Lock()
+        self._builder = None
+
+    def _reset(self):
+        _import_numpy()
+        self._arrays = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+        self._size = 0
+        self.last_item_id = 0
+        self._gaps = np.empty(0, dtype=np.int64)  # missing item ids, rechecked until settled
+        self._gaps_since = np.empty(0, dtype=np.float64)
+        self.products = _Dictionary(np.int32)
+        self.employees = _Dictionary(np.int16)
+        self.categories = _Dictionary(np.int32)
+        self.categories.encode(np.zeros(1, dtype=np.int64))  # الرمز 0: بدون تصنيف
+        self._product_category = np.empty(0, dtype=np.int32)
+        self._products_seen = None
+
+    def __len__(self):
+        return self._size if self._arrays is not None else 0
+
+    # ==========================
+    # التحميل والتحديث
+    # ==========================
+    def refresh(self, force=False):
+        """Load new sale lines unless the last refresh is recent; returns lines added"""
+        with self._lock:
+            if self._arrays is None:
+                self._reset()
+            elif not force and time.monotonic() - self.refreshed_at < self.refresh_interval:
+                return 0
+            added = self._load_lines()
+            self._load_products()
+            self.refreshed_at = time.monotonic()
+            self._loaded = True
+            return added
+
+    def ready(self):
+        """True once the first load finished; until then make sure one runs on a background thread"""
+        if self._loaded:
+            return True
+        with self._builder_lock:
+            if self._builder is None or not self._builder.is_alive():
+                self._builder = threading.Thread(target=self._build, name='sales-cube-build', daemon=True)
+                self._builder.start()
+        return False
+
+    def _build(self):
+        with app.app_context():
+            try:
+                self.refresh(force=True)
+            except Exception:
+                app.logger.exception('sales cube build failed')
+                with self._lock:
+                    self._arrays = None  # المحاولة التالية تبدأ من الصفر
+
+    def rebuild(self):
+        with self._lock:
+            self._arrays = None
+        return self.refresh(force=True)
+
+    def _load_lines(self):
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            seconds = func.floor(func.extract('epoch', Sale.created_at))
+        elif dialect == 'sqlite':
+            seconds = func.strftime('%s', Sale.created_at)
+        else:
+            raise NotImplementedError(f'لا يوجد دعم للتحليلات على {dialect}')
+
+        # مؤشر DBAPI مباشرة: صفوف SQLAlchemy أبطأ بعدة مرات في التحويل إلى مصفوفات،
+        # والحد الأعلى يُقرأ من نفس الاتصال حتى لا نتجاوز أسطراً لم يرها بعد
+        added = 0
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self._compile(select(func.coalesce(func.max(SaleItem.id), 0))))
+            last_item_id = cursor.fetchone()[0]
+            cursor.close()
+            if last_item_id <= self.last_item_id and not len(self._gaps):
+                return 0
+
+            wanted = (SaleItem.id > self.last_item_id) & (SaleItem.id <= last_item_id)
+            if len(self._gaps):
+                wanted = or_(wanted, SaleItem.id.in_(self._gaps.tolist()))
+            floor = max(self.last_item_id, last_item_id - GAP_SPAN)
+            seen = []
+
+            if dialect == 'postgresql':
+                cursor = connection.cursor('sales_cube')  # مؤشر على الخادم بدل جلب كل الصفوف
+                cursor.itersize = LOAD_CHUNK
+            else:
+                cursor = connection.cursor()
+            cursor.execute(self._compile(
+                select(SaleItem.id, SaleItem.sale_id, SaleItem.product_id, Sale.employee_id,
+                       cast(seconds, BigInteger), SaleItem.quantity,
+                       cast(func.round(SaleItem.total_price * 100), BigInteger))
+                .join(Sale, Sale.id == SaleItem.sale_id)
+                .where(wanted)
+            ))
+            while len(rows := np.fromiter(itertools.islice(cursor, LOAD_CHUNK), dtype=ROW)):
+                # الأسطر قرب القمة، والناقصة سابقاً التي ظهرت الآن
+                seen.append(rows['item'][(rows['item'] > floor) | (rows['item'] <= self.last_item_id)])
+                self._append(rows)
+                added += len(rows)
+            cursor.close()
+        finally:
+            connection.close()
+        self._track_gaps(floor, last_item_id, np.concatenate(seen) if seen else np.empty(0, dtype=np.int64))
+        self.last_item_id = last_item_id
+        return added
+
+    def _track_gaps(self, floor, top, seen):
+        """Remember ids in (floor, top] that were not there, and forget old or found ones"""
+        now = time.monotonic()
+        keep = ~np.isin(self._gaps, seen) & (self._gaps_since > now - CUBE_SETTLE_SECONDS)
+        new = np.setdiff1d(np.arange(floor + 1, top + 1, dtype=np.int64), seen, assume_unique=True)
+        self._gaps = np.concatenate([self._gaps[keep], new])
+        self._gaps_since = np.concatenate([self._gaps_since[keep], np.full(len(new), now)])
+
+    @staticmethod
+    def _compile(stmt):
+        return str(stmt.compile(db.engine, compile_kwargs={'literal_binds': True}))
+
+    def _append(self, rows):
+        count = len(rows)
+        if self._size + count > len(self._arrays['sale']):
+            capacity = max(self._size + count, 2 * len(self._arrays['sale']))
+            for name, array in self._arrays.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self._size] = array[:self._size]
+                self._arrays[name] = grown
+        rows['product'] = self.products.encode(rows['product'])
+        rows['employee'] = self.employees.encode(rows['employee'])
+        for name, array in self._arrays.items():
+            array[self._size:self._size + count] = rows[name]
+        self._size += count
+
+    def _load_products(self):
+        query = select(Product.id, func.coalesce(Product.category_id, 0), Product.updated_at)
+        if self._products_seen is not None:
+            query = query.where(Product.updated_at >= self._products_seen)
+        rows = db.session.execute(query).all()
+        ids, category_ids, updated = zip(*rows) if rows else ((), (), ())
+        codes = self.products.encode(np.array(ids, dtype=np.int64))
+        categories = self.categories.encode(np.array(category_ids, dtype=np.int64))
+        # منتج ظهر في سطر بيع قبل أن نقرأه يبقى بدون تصنيف حتى التحديث التالي
+        if len(self._product_category) < len(self.products):
+            grown = np.zeros(len(self.products), dtype=np.int32)
+            grown[:len(self._product_category)] = self._product_category
+            self._product_category = grown
+        self._product_category[codes] = categories
+        self._products_seen = max((moment for moment in updated if moment), default=self._products_seen)
+
+    # ==========================
+    # الاستعلامات
+    # ==========================
+    def _lines(self, start, end):
+        """Columns of the lines sold in [start, end)"""
+        with self._lock:
+            size = self._size
+            arrays = {name: array[:size] for name, array in self._arrays.items()}
+        ts = arrays['ts']
+        mask = (ts >= epoch_seconds(start)) & (ts < epoch_seconds(end))
+        return {name: array[mask] for name, array in arrays.items()}
+
+    @staticmethod
+    def _distinct_sales(lines):
+        """Index of one line per sale, for counting transactions"""
+        _, first = np.unique(lines['sale'], return_index=True)
+        return first
+
+    def top_products(self, start, end, k=10, by='revenue'):
+        """[(product_id, revenue, quantity)] for the k best sellers by revenue or quantity"""
+        lines = self._lines(start, end)
+        size = len(self.products)
+        revenue = np.bincount(lines['product'], weights=lines['cents'], minlength=size)
+        quantity = np.bincount(lines['product'], weights=lines['quantity'], minlength=size)
+        key = quantity if by == 'quantity' else revenue
+        k = min(k, int(np.count_nonzero(key)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-key, k - 1)[:k]
+        top = top[np.lexsort((self.products.ids[top], -key[top]))]
+        return [(int(self.products.ids[code]), round(float(revenue[code]) / 100, 2), int(quantity[code])) for code in top]
+
+    def heatmap(self, start, end):
+        """Revenue and transactions by weekday (Monday first) and hour, as 7x24 lists"""
+        lines = self._lines(start, end)
+        ts = lines['ts']
+        # 1970-01-01 كان يوم خميس
+        buckets = ((ts // 86400 + 3) % 7) * 24 + ts // 3600 % 24
+        revenue = np.round(np.bincount(buckets, weights=lines['cents'], minlength=7 * 24) / 100, 2)
+        sales = np.bincount(buckets[self._distinct_sales(lines)], minlength=7 * 24)
+        return revenue.reshape(7, 24).tolist(), sales.reshape(7, 24).tolist()
+
+    def cashiers(self, start, end):
+        """[(employee_id, revenue, transactions, quantity)] by revenue, highest first"""
+        lines = self._lines(start, end)
+        size = len(self.employees)
+        revenue = np.bincount(lines['employee'], weights=lines['cents'], minlength=size)
+        quantity = np.bincount(lines['employee'], weights=lines['quantity'], minlength=size)
+        sales = np.bincount(lines['employee'][self._distinct_sales(lines)], minlength=size)
+        order = np.argsort(-revenue, kind='stable')
+        return [(int(self.employees.ids[code]), round(float(revenue[code]) / 100, 2), int(sales[code]), int(quantity[code]))
+                for code in order if sales[code]]
+
+    def category_mix(self, start, end):
+        """[(category_id or None, revenue, quantity)] by revenue, highest first"""
+        lines = self._lines(start, end)
+        with self._lock:
+            product_category = self._product_category
+        category = product_category[lines['product']]
+        size = len(self.categories)
+        revenue = np.bincount(category, weights=lines['cents'], minlength=size)
+        quantity = np.bincount(category, weights=lines['quantity'], minlength=size)
+        order = np.argsort(-revenue, kind='stable')
+        return [(int(self.categories.ids[code]) or None, round(float(revenue[code]) / 100, 2), int(quantity[code]))
+                for code in order if quantity[code] or revenue[code]]
+
+
+cube = SalesCube(refresh_interval=app.config['ANALYTICS_REFRESH_INTERVAL'])
+
+
+# ==========================
+# نقاط /api/analytics
+# ==========================
+def analytics_view(view):
+    """Check permission and dependencies, refresh the cube and pass the report period"""
+    @functools.wraps(view)
+    def wrapper():
+        if not current_user.has_permission('view_reports'):
+            return jsonify({'error': 'ليس لديك صلاحية'}), 403
+        try:
+            start_date, end_date = report_dates()
+        except ValueError:
+            return jsonify({'error': 'التاريخ غير صحيح'}), 400
+        try:
+            _import_numpy()
+        except ImportError:  # التحليلات تعمل فقط مع numpy
+            return jsonify({'error': 'التحليلات تتطلب تثبيت مكتبة numpy'}), 503
+        if not cube.ready():
+            # البناء الأول على سجل كبير يستغرق وقتاً؛ الطلب لا ينتظره
+            return jsonify({'status': 'building'}), 202, {'Retry-After': str(BUILD_RETRY_AFTER)}
+        cube.refresh()
+        payload = view(*rollups.day_range(start_date, end_date))
+        return jsonify({'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(), **payload})
+    return wrapper
+
+
+def _names(columns, ids):
+    """{id: remaining columns}; an id deleted since the sale maps to DELETED_LABEL"""
+    names = defaultdict(lambda: (DELETED_LABEL,) + (None,) * (len(columns) - 2))
+    names.update((row[0], row[1:]) for row in db.session.execute(select(*columns).where(columns[0].in_(ids))))
+    return names
+
+
+@app.route('/api/analytics/top_products')
+@login_required
+@analytics_view
+def analytics_top_products(start, end):
+    k = min(request.args.get('k', 10, type=int), 100)
+    by = 'quantity' if request.args.get('by') == 'quantity' else 'revenue'
+    top = cube.top_products(start, end, k=k, by=by)
+    names = _names((Product.id, Product.name_ar, Product.sku), [row[0] for row in top])
+    return {'by': by, 'products': [
+        {'id': product_id, 'name': names[product_id][0], 'sku': names[product_id][1],
+         'revenue': revenue, 'quantity': quantity}
+        for product_id, revenue, quantity in top
+    ]}
+
+
+@app.route('/api/analytics/heatmap')
+@login_required
+@analytics_view
+def analytics_heatmap(start, end):
+    revenue, transactions = cube.heatmap(start, end)
+    return {'revenue': revenue, 'transactions': transactions}
+
+
+@app.route('/api/analytics/cashiers')
+@login_required
+@analytics_view
+def analytics_cashiers(start, end):
+    rows = cube.cashiers(start, end)
+    names = _names((Employee.id, Employee.full_name), [row[0] for row in rows])
+    return {'cashiers': [
+        {'id': employee_id, 'name': names[employee_id][0], 'revenue': revenue,
+         'transactions': transactions, 'quantity': quantity,
+         'average_sale': round(revenue / transactions, 2)}
+        for employee_id, revenue, transactions, quantity in rows
+    ]}
+
+
+@app.route('/api/analytics/categories')
+@login_required
+@analytics_view
+def analytics_categories(start, end):
+    rows = cube.category_mix(start, end)
+    names = _names((Category.id, Category.name_ar), [row[0] for row in rows if row[0]])
+    total = sum(row[1] for row in rows) or 1
+    return {'categories': [
+        {'id': category_id, 'name': names[category_id][0] if category_id else None,
+         'revenue': revenue, 'quantity': quantity, 'share': round(revenue / total, 4)}
+        for category_id, revenue, quantity in rows
+    ]}
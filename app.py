@@ -1,5 +1,6 @@
 import os
 import logging
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
@@ -31,6 +32,21 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['INVOICE_RENDER_WORKERS'] = int(os.environ.get("INVOICE_RENDER_WORKERS", 2))
+app.config['INVOICE_RENDER_TIMEOUT'] = 15  # seconds
+app.config['INVOICE_STORE_MAX_BYTES'] = 200 * 1024 * 1024  # 200MB of cached PDFs
+app.config['IMAGE_WORKERS'] = int(os.environ.get("IMAGE_WORKERS", 2))
+app.config['PRINCIPAL_CACHE_TTL'] = 60  # seconds
+app.config['CACHE_VERSION_INTERVAL'] = 5  # seconds before other workers see a deactivation or new category (polled on SQLite)
+app.config['METRICS_ENABLED'] = os.environ.get("METRICS_ENABLED", "1") != "0"
+app.config['METRICS_TOKEN'] = os.environ.get("METRICS_TOKEN")  # Bearer token for the Prometheus scraper
+app.config['STORE_CODE'] = os.environ.get("STORE_CODE", "01")  # part of every invoice number
+app.config['INVOICE_BLOCK_SIZE'] = 100  # invoice numbers leased per worker at a time
+app.config['LEDGER_HOT_MONTHS'] = 3  # months of movements kept live, the current one included
+app.config['ANALYTICS_REFRESH_INTERVAL'] = 30  # seconds between reads of new sale lines for the charts
+app.config['COMPRESS_MIN_SIZE'] = 1024  # bytes; smaller HTML/JSON bodies are sent as they are
+app.config['LIVE_BROKER'] = os.environ.get("LIVE_BROKER")  # local or postgres; defaults to the database's
+app.config['LIVE_STREAM_SECONDS'] = 300  # a dashboard stream holds a worker thread this long, then reconnects
 
 # ==========================
 # 3️⃣ تهيئة SQLAlchemy و Migrate و LoginManager
@@ -45,20 +61,67 @@ login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import Employee
-    return Employee.query.get(int(user_id))
+    from caches import load_principal
+    return load_principal(user_id)
 
 # ==========================
 # 4️⃣ استيراد المسارات بعد تهيئة app
 # ==========================
+# الاستيراد لا يلمس قاعدة البيانات ولا ينشئ عمليات أو خيوطاً، لذلك يمكن
+# لـ gunicorn --preload تحميله مرة في العملية الرئيسية ثم نسخه للعمال
 from routes import *
+import instrumentation  # /metrics وتوقيت الطلبات
+import benchmarks  # أوامر القياس: flask bench-checkout
+import seed_data  # flask seed-data
+import catalog  # /api/catalog لمزامنة كتالوج نقاط البيع
+import ledger  # flask archive-movements وقراءة الأشهر المؤرشفة
+import stock_history  # flask stock-checkpoint و /api/stock_as_of
+import analytics  # /api/analytics لرسوم لوحة التحكم
+import live  # /dashboard/stream لتحديث لوحة التحكم مباشرة
+
+
+def _after_fork_in_child():
+    # اتصالات العملية الأم لا تُستخدم في العامل؛ كل عامل يفتح اتصالاته
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def create_app(config=None):
+    """Return the fully registered application.
+
+    Routes bind to the module-level `app` because every module imports it,
+    so this only applies `config` overrides. It is the entry point for
+    gunicorn (`main:app` or `app:create_app()`) and is safe with --preload.
+    """
+    if config:
+        app.config.update(config)
+    return app
+
 
 # ==========================
 # 5️⃣ إنشاء الجداول وحساب المدير الافتراضي أو تعديل بياناته
 # ==========================
-with app.app_context():
+@app.cli.command('bootstrap')
+def bootstrap():
+    """Create the schema of an empty database and the default admin account.
+
+    An empty database gets every table and is stamped at the latest
+    migration; an existing one is left to `flask db upgrade`, which the
+    deploy runs right after this. Run once per deploy (or after pointing
+    DATABASE_URL at a new database), not on every worker boot.
+    """
     import models
-    db.create_all()
+    from flask_migrate import stamp
+    from sqlalchemy import inspect
+    if not inspect(db.engine).get_table_names():
+        # قاعدة جديدة: الجداول من النماذج مباشرة، والمراجعات تُعتبر مطبقة
+        db.create_all()
+        ledger.ensure_partitions()
+        stamp()
 
     from models import Employee
     admin = Employee.query.filter_by(username='admin').first()
@@ -75,7 +138,7 @@ with app.app_context():
         )
         db.session.add(admin)
         db.session.commit()
-        print("تم إنشاء حساب المدير الافتراضي")
+        click.echo("تم إنشاء حساب المدير الافتراضي")
     else:
         # السماح بتعديل بيانات المدير الموجود بالفعل إذا رغبت
         admin.email = 'admin@pos.com'
@@ -83,4 +146,4 @@ with app.app_context():
         admin.role = 'admin'
         admin.is_active = True
         db.session.commit()
-        print("تم تحديث بيانات المدير الافتراضي إذا كانت تحتاج تعديل")
+        click.echo("تم تحديث بيانات المدير الافتراضي إذا كانت تحتاج تعديل")
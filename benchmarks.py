@@ -0,0 +1,753 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import subprocess
+import statistics
+import threading
+import click
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select, update, text
+from app import app, db
+from models import Employee, Product, Category, Sale, SaleItem, InventoryMovement, STOCK_MOVEMENT_TYPES
+from checkout import checkout, ingest_sales, InsufficientStock, MAX_BATCH_SALES
+from search_index import ProductSearchIndex
+from stock_history import stock_as_of, catalog_valuation
+from analytics import SalesCube
+import utils
+
+BENCH_SKU_PREFIX = 'BENCH-'
+STRESS_SKU_PREFIX = 'STRESS-'
+
+ARABIC_WORDS = ['أرز', 'سكر', 'زيت', 'زيتون', 'شاي', 'قهوة', 'حليب', 'جبنة', 'عصير', 'مياه',
+                'معكرونة', 'دقيق', 'عدس', 'فول', 'تونة', 'صابون', 'شامبو', 'منظف', 'مناديل',
+                'بسكويت', 'شوكولاتة', 'مربى', 'عسل', 'خبز', 'زبدة', 'بيض', 'دجاج', 'لحم',
+                'أبيض', 'أحمر', 'كبير', 'صغير', 'عائلي', 'طبيعي', 'مستورد', 'بلدي', 'خفيف']
+ENGLISH_WORDS = ['rice', 'sugar', 'oil', 'olive', 'tea', 'coffee', 'milk', 'cheese', 'juice',
+                 'water', 'pasta', 'flour', 'soap', 'shampoo', 'tissues', 'biscuits', 'honey']
+
+
+class StatementCounter:
+    """Count the SQL statements the engine executes while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(limit, label='block'):
+    """Fail when the wrapped block runs more than `limit` SQL statements.
+
+    Lazy loads inside a loop show up as a count that grows with the
+    number of rows, so budgets are checked against data with many rows.
+    """
+    with StatementCounter(db.engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise QueryBudgetExceeded(f'{label}: {counter.count} استعلام والحد {limit}')
+
+
+@contextmanager
+def scratch_invoice_dir():
+    """Render invoice PDFs into a temporary directory instead of static/invoices"""
+    saved, utils.INVOICE_DIR = utils.INVOICE_DIR, tempfile.mkdtemp(prefix='bench-invoices-')
+    try:
+        yield utils.INVOICE_DIR
+    finally:
+        shutil.rmtree(utils.INVOICE_DIR, ignore_errors=True)
+        utils.INVOICE_DIR = saved
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _bench_employee():
+    employee = Employee.query.filter_by(role='admin').first()
+    if employee is None:
+        raise click.ClickException('لا يوجد حساب مدير؛ شغّل flask bootstrap لإنشائه')
+    return employee
+
+
+def _bench_products(count):
+    """Make sure `count` benchmark products with plenty of stock exist"""
+    existing = Product.query.filter(Product.sku.like(f'{BENCH_SKU_PREFIX}%')).count()
+    for n in range(existing, count):
+        db.session.add(Product(
+            name=f'Bench product {n}',
+            name_ar=f'منتج قياس {n}',
+            sku=f'{BENCH_SKU_PREFIX}{n:06d}',
+            barcode=f'999{n:09d}',
+            price=10,
+            quantity=10_000_000,
+            is_active=True
+        ))
+    db.session.commit()
+    return [p.id for p in Product.query.filter(Product.sku.like(f'{BENCH_SKU_PREFIX}%'))
+            .order_by(Product.id).limit(count)]
+
+
+@app.cli.command('bench-checkout')
+@click.option('--sizes', default='1,10,50,200', help='أحجام السلة مفصولة بفواصل')
+@click.option('--runs', default=20, help='عدد عمليات البيع لكل حجم')
+@click.option('--yes', is_flag=True, help='تخطي التأكيد (يكتب مبيعات حقيقية في قاعدة البيانات)')
+def bench_checkout(sizes, runs, yes):
+    """Measure /api/process_sale checkout latency per basket size.
+
+    Writes real sales, so run it against a scratch database.
+    """
+    if not yes:
+        click.confirm(f'سيتم إنشاء مبيعات تجريبية في {db.engine.url.render_as_string()}، متابعة؟',
+                      abort=True)
+
+    sizes = [int(size) for size in sizes.split(',')]
+    employee_id = _bench_employee().id
+    product_ids = _bench_products(max(sizes))
+
+    click.echo(f'{"lines":>6} {"p50 ms":>9} {"p95 ms":>9} {"stmts":>6}')
+    for size in sizes:
+        cart = [{'product_id': pid, 'quantity': 1, 'price': 10} for pid in product_ids[:size]]
+        timings = []
+        statements = []
+        for _ in range(runs):
+            with StatementCounter(db.engine) as counter:
+                started = time.perf_counter()
+                checkout(cart, employee_id=employee_id)
+                db.session.commit()
+                timings.append((time.perf_counter() - started) * 1000)
+            statements.append(counter.count)
+        click.echo(f'{size:>6} {statistics.median(timings):>9.2f} '
+                   f'{_percentile(timings, 95):>9.2f} {max(statements):>6}')
+
+
+@app.cli.command('bench-ingest')
+@click.option('--sales', 'sale_count', default=5000, help='عدد المبيعات المؤجلة')
+@click.option('--lines', default=5, help='عدد البنود في كل عملية بيع')
+@click.option('--batch', default=500, help='عدد المبيعات في كل طلب')
+@click.option('--yes', is_flag=True, help='تخطي التأكيد (يكتب مبيعات حقيقية في قاعدة البيانات)')
+def bench_ingest(sale_count, lines, batch, yes):
+    """Replay an offline backlog through the batch ingestion path, then replay it again.
+
+    The second pass must return every sale as a duplicate without
+    writing anything.
+    """
+    if not yes:
+        click.confirm(f'سيتم إنشاء مبيعات تجريبية في {db.engine.url.render_as_string()}، متابعة؟',
+                      abort=True)
+    batch = min(batch, MAX_BATCH_SALES)
+    employee_id = _bench_employee().id
+    product_ids = _bench_products(max(lines * 4, 20))
+    rng = random.Random(1)
+    run = f'{time.time_ns():x}'
+    backlog = [{
+        'client_key': f'bench-{run}-{n}',
+        'items': [{'product_id': pid, 'quantity': 1} for pid in rng.sample(product_ids, lines)],
+        'payment_method': 'cash',
+    } for n in range(sale_count)]
+
+    sales_before = Sale.query.count()
+    for label in ('first', 'replay'):
+        statuses = {}
+        with StatementCounter(db.engine) as counter:
+            started = time.perf_counter()
+            for offset in range(0, sale_count, batch):
+                for result in ingest_sales(backlog[offset:offset + batch], employee_id):
+                    statuses[result['status']] = statuses.get(result['status'], 0) + 1
+            elapsed = time.perf_counter() - started
+        click.echo(f'{label:>7}: {elapsed:.2f}s, {sale_count / elapsed:.0f} sales/s, '
+                   f'{counter.count / sale_count:.1f} stmts/sale, {statuses}')
+
+    written = Sale.query.count() - sales_before
+    if written != sale_count:
+        raise click.ClickException(f'تم إنشاء {written} عملية بيع والمتوقع {sale_count}')
+
+
+@app.cli.command('stress-stock')
+@click.option('--threads', default=16, help='عدد الكاشيرات المتزامنين')
+@click.option('--sales', default=200, help='عدد عمليات البيع لكل كاشير')
+@click.option('--products', 'product_count', default=5, help='عدد المنتجات المتنافس عليها')
+@click.option('--stock', default=1000, help='المخزون الابتدائي لكل منتج')
+@click.option('--yes', is_flag=True, help='تخطي التأكيد (يكتب مبيعات حقيقية في قاعدة البيانات)')
+def stress_stock(threads, sales, product_count, stock, yes):
+    """Hammer a few products from many threads and audit the stock afterwards.
+
+    Every cart touches several of the same hot products in random order,
+    so lost updates, oversells and lock-order deadlocks all show up as
+    a failed audit. Run it against SQLite and a local Postgres.
+    """
+    if not yes:
+        click.confirm(f'سيتم إنشاء مبيعات تجريبية في {db.engine.url.render_as_string()}، متابعة؟',
+                      abort=True)
+
+    employee_id = _bench_employee().id
+    product_ids = []
+    for n in range(product_count):
+        sku = f'{STRESS_SKU_PREFIX}{n:03d}'
+        product = Product.query.filter_by(sku=sku).first()
+        if product is None:
+            product = Product(name=f'Stress product {n}', name_ar=f'منتج ضغط {n}',
+                              sku=sku, price=1, quantity=0, is_active=True)
+            db.session.add(product)
+            db.session.flush()
+        product_ids.append(product.id)
+    db.session.execute(update(Product).where(Product.id.in_(product_ids)).values(quantity=stock))
+    db.session.commit()
+    high_water = db.session.query(func.coalesce(func.max(SaleItem.id), 0)).scalar()
+
+    outcome = {'sold': 0, 'insufficient': 0, 'errors': []}
+    lock = threading.Lock()
+
+    def cashier(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            for _ in range(sales):
+                chosen = rng.sample(product_ids, k=rng.randint(1, len(product_ids)))
+                cart = [{'product_id': pid, 'quantity': rng.randint(1, 3)} for pid in chosen]
+                try:
+                    checkout(cart, employee_id=employee_id)
+                    db.session.commit()
+                    key = 'sold'
+                except InsufficientStock:
+                    db.session.rollback()
+                    key = 'insufficient'
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        outcome['errors'].append(repr(e))
+                    continue
+                with lock:
+                    outcome[key] += 1
+
+    workers = [threading.Thread(target=cashier, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    db.session.expire_all()
+    sold = dict(db.session.query(SaleItem.product_id, func.sum(SaleItem.quantity))
+                .filter(SaleItem.id > high_water, SaleItem.product_id.in_(product_ids))
+                .group_by(SaleItem.product_id))
+    problems = []
+    for product in Product.query.filter(Product.id.in_(product_ids)):
+        expected = stock - (sold.get(product.id) or 0)
+        last_movement = (InventoryMovement.query.filter_by(product_id=product.id)
+                         .order_by(InventoryMovement.id.desc()).first())
+        if product.quantity != expected or product.quantity < 0:
+            problems.append(f'{product.sku}: الكمية {product.quantity} والمتوقع {expected}')
+        elif last_movement and sold.get(product.id) and last_movement.new_quantity != product.quantity:
+            problems.append(f'{product.sku}: آخر حركة {last_movement.new_quantity} والكمية {product.quantity}')
+
+    click.echo(f'{outcome["sold"]} sold, {outcome["insufficient"]} insufficient, '
+               f'{len(outcome["errors"])} errors in {elapsed:.2f}s '
+               f'({outcome["sold"] / elapsed:.0f} sales/s)')
+    for error in outcome['errors'][:5]:
+        click.echo(f'  error: {error}')
+    for problem in problems:
+        click.echo(f'  audit: {problem}')
+    if outcome['errors'] or problems:
+        raise click.ClickException('فشل اختبار الضغط')
+    click.echo('audit ok: no lost updates, no oversells')
+
+
+def _hot_path_queries():
+    """(label, query, should_use_index) for the filters the views rely on"""
+    end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    start = end - timedelta(days=30)
+    return [
+        ('sales_report (func.date, before)',
+         Sale.query.filter(func.date(Sale.created_at) >= start.date(),
+                           func.date(Sale.created_at) < end.date()), False),
+        ('sales_report (half-open range)',
+         Sale.query.filter(Sale.created_at >= start, Sale.created_at < end), True),
+        ('dashboard recent sales',
+         Sale.query.order_by(Sale.created_at.desc()).limit(10), True),
+        ('logs by type',
+         InventoryMovement.query.filter(InventoryMovement.movement_type == 'out')
+         .order_by(InventoryMovement.created_at.desc()).limit(20), True),
+        ('movements of a product',
+         InventoryMovement.query.filter(InventoryMovement.product_id == 1), True),
+        ('items of a sale',
+         SaleItem.query.filter(SaleItem.sale_id == 1), True),
+        ('sales of a product',
+         SaleItem.query.filter(SaleItem.product_id == 1), True),
+        ('active products by name',
+         Product.query.filter(Product.is_active == True).order_by(Product.name_ar).limit(20), True),
+    ]
+
+
+def _explain(query):
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        plan = [row[-1] for row in rows]
+        full_scan = any(line.startswith('SCAN') and 'USING' not in line for line in plan)
+    else:
+        plan = [row[0] for row in db.session.execute(text(f'EXPLAIN {sql}')).all()]
+        full_scan = any('Seq Scan' in line for line in plan)
+    return plan, full_scan
+
+
+@app.cli.command('explain-hot-paths')
+def explain_hot_paths():
+    """Print query plans for the hot date and foreign key filters.
+
+    Fails when a filter that should be index-backed falls back to a full
+    table scan. Postgres may still prefer a sequential scan on tiny
+    tables, so check it against a realistically sized database.
+    """
+    regressions = []
+    for label, query, should_use_index in _hot_path_queries():
+        plan, full_scan = _explain(query)
+        status = 'FULL SCAN' if full_scan else 'index'
+        click.echo(f'{label}: {status}')
+        for line in plan:
+            click.echo(f'    {line}')
+        if should_use_index and full_scan:
+            regressions.append(label)
+    if regressions:
+        raise click.ClickException(f'استعلامات بدون فهرس: {", ".join(regressions)}')
+
+
+@app.cli.command('bench-search')
+@click.option('--products', 'product_count', default=200_000, help='حجم الكتالوج الاصطناعي')
+@click.option('--queries', default=5000, help='عدد عمليات البحث')
+@click.option('--seed', default=1, help='بذرة التوليد')
+def bench_search(product_count, queries, seed):
+    """Measure in-memory product search latency on a synthetic catalog.
+
+    Does not touch the database.
+    """
+    rng = random.Random(seed)
+    index = ProductSearchIndex()
+    names = []
+    started = time.perf_counter()
+    for product_id in range(1, product_count + 1):
+        name_ar = ' '.join(rng.sample(ARABIC_WORDS, 3)) + f' {rng.randint(100, 999)}'
+        names.append(name_ar)
+        index.upsert(product_id, name_ar, ' '.join(rng.sample(ENGLISH_WORDS, 2)),
+                     f'62{product_id:011d}', f'SKU-{product_id:07d}')
+    click.echo(f'indexed {len(index)} products in {time.perf_counter() - started:.1f}s')
+
+    samples = []
+    for _ in range(queries):
+        name = rng.choice(names)
+        start = rng.randrange(0, len(name) - 3)
+        query = rng.choice([
+            name[start:start + rng.randint(3, 8)],
+            name[:2],
+            f'62{rng.randint(1, product_count):011d}',
+            name.replace('ة', 'ه').replace('أ', 'ا'),
+        ])
+        started = time.perf_counter()
+        index.search(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    click.echo(f'p50 {_percentile(samples, 50):.2f} ms, p95 {_percentile(samples, 95):.2f} ms, '
+               f'p99 {_percentile(samples, 99):.2f} ms')
+
+
+@app.cli.command('bench-stock-as-of')
+@click.option('--dates', 'date_count', default=5, help='عدد التواريخ العشوائية')
+@click.option('--seed', default=1, help='بذرة اختيار التواريخ')
+@click.option('--verify/--no-verify', default=True, help='مقارنة النتيجة بإعادة تطبيق السجل كاملاً')
+def bench_stock_as_of(date_count, seed, verify):
+    """Time whole-catalog stock valuation at random dates within the ledger.
+
+    --verify checks stock_as_of for every product against a replay of the
+    whole live ledger from its first movement, which only holds for a
+    ledger that starts from zero stock (as seed-data writes it) and has
+    no archived months, and checks the valuation's units against it.
+    """
+    table = InventoryMovement.__table__
+    oldest, newest = db.session.execute(select(func.min(table.c.created_at), func.max(table.c.created_at))).one()
+    if oldest is None:
+        raise click.ClickException('سجل الحركات فارغ')
+    rng = random.Random(seed)
+    click.echo(f'{"as of":<17} {"seconds":>8} {"base":>18} {"units":>12} {"value":>18}  check')
+    for _ in range(date_count):
+        at = oldest + (newest - oldest) * rng.random()
+        started = time.perf_counter()
+        report = catalog_valuation(at)
+        elapsed = time.perf_counter() - started
+        check = '-'
+        if verify:
+            quantities, _ = stock_as_of(at)
+            expected = dict(db.session.execute(
+                select(table.c.product_id, func.sum(table.c.new_quantity - table.c.previous_quantity))
+                .where(table.c.created_at < at, table.c.movement_type.in_(STOCK_MOVEMENT_TYPES))
+                .group_by(table.c.product_id)).all())
+            wrong = sum(1 for product_id in set(expected) | set(quantities)
+                        if expected.get(product_id, 0) != quantities.get(product_id, 0))
+            if wrong:
+                check = f'{wrong} products differ'
+            else:
+                check = 'ok' if sum(expected.values()) == report['units'] else 'units differ'
+        base = report['base']
+        source = f'{base["direction"]} #{base["checkpoint"]}' if base['checkpoint'] else f'{base["direction"]} live'
+        click.echo(f'{at:%Y-%m-%d %H:%M} {elapsed:>8.2f} {source:>18} {report["units"]:>12} '
+                   f'{report["value"]:>18,.2f}  {check}')
+
+
+@app.cli.command('bench-analytics')
+@click.option('--days', default=30, help='طول الفترة المستعلم عنها بالأيام، حتى آخر عملية بيع')
+@click.option('--runs', default=5, help='عدد مرات تشغيل كل تقرير من الذاكرة')
+def bench_analytics(days, runs):
+    """Time loading the sales cube and its reports against the same GROUP BY in SQL.
+
+    The SQL side of the heatmap is left out since it needs dialect date
+    functions; the other reports are checked against their SQL result.
+    """
+    cube = SalesCube()
+    started = time.perf_counter()
+    lines = cube.refresh()
+    click.echo(f'loaded {lines} sale lines in {time.perf_counter() - started:.1f}s')
+    newest = db.session.execute(select(func.max(Sale.created_at))).scalar()
+    if newest is None:
+        raise click.ClickException('لا توجد مبيعات')
+    end = newest + timedelta(seconds=1)
+    start = end - timedelta(days=days)
+
+    revenue = func.sum(SaleItem.total_price)
+    lines_in_period = select(revenue).join_from(SaleItem, Sale) \
+        .where(Sale.created_at >= start, Sale.created_at < end)
+    reports = {
+        'top_products': (
+            lambda: [row[:2] for row in cube.top_products(start, end)],
+            lines_in_period.add_columns(SaleItem.product_id).group_by(SaleItem.product_id)
+            .order_by(revenue.desc(), SaleItem.product_id).limit(10),
+        ),
+        'heatmap': (lambda: cube.heatmap(start, end), None),
+        'cashiers': (
+            lambda: {row[0]: row[1] for row in cube.cashiers(start, end)},
+            lines_in_period.add_columns(Sale.employee_id).group_by(Sale.employee_id),
+        ),
+        'categories': (
+            lambda: {row[0]: row[1] for row in cube.category_mix(start, end)},
+            lines_in_period.add_columns(Product.category_id).join(Product)
+            .group_by(Product.category_id),
+        ),
+    }
+    click.echo(f'{"report":<14} {"cube ms":>9} {"sql ms":>9}  check')
+    for name, (from_cube, query) in reports.items():
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = from_cube()
+            samples.append((time.perf_counter() - started) * 1000)
+        if query is None:
+            click.echo(f'{name:<14} {statistics.median(samples):>9.1f} {"-":>9}  -')
+            continue
+        started = time.perf_counter()
+        expected = [(key, round(float(total), 2)) for total, key in db.session.execute(query)]
+        elapsed = (time.perf_counter() - started) * 1000
+        if isinstance(result, dict):
+            expected = dict(expected)
+        check = 'ok' if expected == result else 'differs'
+        click.echo(f'{name:<14} {statistics.median(samples):>9.1f} {elapsed:>9.1f}  {check}')
+
+
+# أقصى عدد من الاستعلامات لكل صفحة بعد تحميل المستخدم في كاش العملية
+QUERY_BUDGETS = {
+    'dashboard': 6,
+    'logs': 3,
+    'invoice': 3,
+    'print_invoice': 3,
+    'sales_report': 4,
+    'products': 4,
+    'inventory': 4,
+}
+
+
+@app.cli.command('check-query-budgets')
+@click.option('--sales', default=30, help='عدد المبيعات التجريبية المطلوبة')
+@click.option('--lines', default=5, help='عدد البنود في كل عملية بيع')
+@click.option('--yes', is_flag=True, help='تخطي التأكيد (يكتب مبيعات حقيقية في قاعدة البيانات)')
+def check_query_budgets(sales, lines, yes):
+    """Request the list and detail views and fail on any over-budget page.
+
+    Seeds enough sales, items and movements that one lazy load per row
+    would blow the budget, then renders each page through the test
+    client as the admin.
+    """
+    if not yes:
+        click.confirm(f'سيتم إنشاء مبيعات تجريبية في {db.engine.url.render_as_string()}، متابعة؟',
+                      abort=True)
+
+    # كل منتج في فئة وكل بيع لكاشير مختلف، حتى لا تخفي خريطة الهوية التحميل المتكرر
+    employee = _bench_employee()
+    cashier_ids = []
+    for n in range(lines):
+        username = f'bench-cashier-{n}'
+        cashier = Employee.query.filter_by(username=username).first()
+        if cashier is None:
+            cashier = Employee(username=username, email=f'{username}@bench.local',
+                               full_name=f'كاشير قياس {n}', password_hash='!', role='cashier')
+            db.session.add(cashier)
+            db.session.flush()
+        cashier_ids.append(cashier.id)
+    product_ids = _bench_products(lines * 2)
+    for n, product_id in enumerate(product_ids):
+        category = Category.query.filter_by(name_ar=f'قياس {n}').first()
+        if category is None:
+            category = Category(name=f'Bench {n}', name_ar=f'قياس {n}')
+            db.session.add(category)
+            db.session.flush()
+        db.session.execute(update(Product).where(Product.id == product_id)
+                           .values(category_id=category.id))
+    db.session.commit()
+
+    today = datetime.utcnow().date()
+    existing = Sale.query.filter(Sale.created_at >= datetime.combine(today, datetime.min.time())).count()
+    for n in range(existing, sales):
+        chosen = product_ids[n % lines:n % lines + lines]
+        checkout([{'product_id': pid, 'quantity': 1} for pid in chosen],
+                 employee_id=cashier_ids[n % lines])
+        db.session.commit()
+    sale_id = Sale.query.order_by(Sale.id.desc()).first().id
+
+    pages = {
+        'dashboard': '/dashboard',
+        'logs': '/logs',
+        'invoice': f'/invoice/{sale_id}',
+        'print_invoice': f'/print_invoice/{sale_id}',
+        'sales_report': f'/sales_report?start_date={today}&end_date={today}',
+        'products': '/products',
+        'inventory': '/inventory',
+    }
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(employee.id)
+        session['_fresh'] = True
+    # الموظف المسجل يُحفظ في كاش العملية بعد أول طلب، فيُحمّل مرة قبل القياس
+    # حتى لا يُحسب على الصفحة الأولى وحدها
+    with app.app_context():
+        client.get('/api/cache_stats')
+
+    failures = []
+    # print_invoice يولّد ملف PDF لفاتورة تجريبية؛ لا يُترك بين فواتير المتجر
+    with scratch_invoice_dir():
+        for name, url in pages.items():
+            # سياق جديد لكل طلب حتى لا تُعاد كائنات الطلب السابق من الجلسة أو g
+            try:
+                with app.app_context(), assert_max_queries(QUERY_BUDGETS[name], label=name) as counter:
+                    response = client.get(url)
+            except QueryBudgetExceeded as e:
+                failures.append(str(e))
+                status = 'OVER'
+            else:
+                status = 'ok'
+            if response.status_code != 200:
+                failures.append(f'{name}: HTTP {response.status_code}')
+            click.echo(f'{name:<14} {counter.count:>4} / {QUERY_BUDGETS[name]:<4} {status}')
+    if failures:
+        raise click.ClickException('; '.join(failures))
+
+
+# ==========================
+# قياس المسارات عبر عميل الاختبار
+# ==========================
+def _route_requests(rng, product_ids, search_terms):
+    """name -> factory returning (method, url, json) for one request"""
+    today = datetime.utcnow().date()
+    week_ago = today - timedelta(days=7)
+
+    def sale():
+        chosen = rng.sample(product_ids, k=min(len(product_ids), rng.randint(1, 5)))
+        return 'POST', '/api/process_sale', {'items': [{'product_id': pid, 'quantity': 1} for pid in chosen]}
+
+    return {
+        'search_products': lambda: ('GET', f'/api/search_products?q={rng.choice(search_terms)}', None),
+        'process_sale': sale,
+        'dashboard': lambda: ('GET', '/dashboard', None),
+        'sales_report': lambda: ('GET', f'/sales_report?start_date={week_ago}&end_date={today}', None),
+        'logs': lambda: ('GET', f'/logs?page={rng.randint(1, 5)}', None),
+        'inventory': lambda: ('GET', f'/inventory?page={rng.randint(1, 5)}', None),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=app.root_path).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@app.cli.command('bench-routes')
+@click.option('--routes', 'route_names', default='', help='المسارات المطلوبة مفصولة بفواصل (الافتراضي: الكل)')
+@click.option('--concurrency', default=8, help='عدد العملاء المتزامنين')
+@click.option('--requests', 'request_count', default=200, help='عدد الطلبات لكل مسار')
+@click.option('--seed', default=1, help='بذرة اختيار الطلبات')
+@click.option('--output', default='bench-routes.json', help='ملف النتائج')
+@click.option('--baseline', type=click.Path(exists=True), help='ملف نتائج سابق للمقارنة')
+@click.option('--yes', is_flag=True, help='تخطي التأكيد (process_sale يكتب مبيعات حقيقية)')
+def bench_routes(route_names, concurrency, request_count, seed, output, baseline, yes):
+    """Drive each route through the test client at fixed concurrency.
+
+    Writes throughput and p50/p95/p99 per route to a JSON file stamped
+    with the git revision and database, so runs can be compared across
+    commits. Load data with `flask seed-data` first for meaningful
+    numbers; run once against SQLite and once against Postgres.
+    """
+    if not yes:
+        click.confirm(f'سيتم إنشاء مبيعات تجريبية في {db.engine.url.render_as_string()}، متابعة؟',
+                      abort=True)
+
+    rng = random.Random(seed)
+    employee_id = _bench_employee().id
+    product_ids = [pid for pid, in db.session.query(Product.id)
+                   .filter(Product.is_active == True, Product.quantity > 100).limit(5000)]
+    if not product_ids:
+        product_ids = _bench_products(50)
+    search_terms = [name.split(' ')[0][:rng.randint(2, 5)] for name, in
+                    db.session.query(Product.name_ar).filter(Product.is_active == True).limit(500)]
+    factories = _route_requests(rng, product_ids, search_terms or ARABIC_WORDS)
+    selected = route_names.split(',') if route_names else list(factories)
+    unknown = set(selected) - set(factories)
+    if unknown:
+        raise click.ClickException(f'مسارات غير معروفة: {", ".join(sorted(unknown))}')
+    db.session.commit()
+
+    def client():
+        test_client = app.test_client()
+        with test_client.session_transaction() as session:
+            session['_user_id'] = str(employee_id)
+            session['_fresh'] = True
+        return test_client
+
+    results = {}
+    click.echo(f'{"route":<16} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for name in selected:
+        # الطلبات تُحضَّر مسبقاً بنفس البذرة حتى تتطابق بين التشغيلات
+        plan = [factories[name]() for _ in range(request_count)]
+        # طلب تمهيدي يبني الفهارس والكاشات التي تُبنى عند أول استخدام
+        method, url, payload = factories[name]()
+        client().open(url, method=method, json=payload)
+        timings = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(requests_):
+            test_client = client()
+            for method, url, payload in requests_:
+                started = time.perf_counter()
+                response = test_client.open(url, method=method, json=payload)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    timings.append(elapsed)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+
+        threads = [threading.Thread(target=worker, args=(plan[n::concurrency],))
+                   for n in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        results[name] = {
+            'requests': len(timings),
+            'errors': len(errors),
+            'throughput': round(len(timings) / wall, 2),
+            'p50_ms': round(_percentile(timings, 50), 3),
+            'p95_ms': round(_percentile(timings, 95), 3),
+            'p99_ms': round(_percentile(timings, 99), 3),
+        }
+        row = results[name]
+        click.echo(f'{name:<16} {row["throughput"]:>8.1f} {row["p50_ms"]:>8.2f} '
+                   f'{row["p95_ms"]:>8.2f} {row["p99_ms"]:>8.2f} {row["errors"]:>7}')
+
+    report = {
+        'revision': _git_revision(),
+        'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'database': db.engine.dialect.name,
+        'products': db.session.query(func.count(Product.id)).scalar(),
+        'sales': db.session.query(func.count(Sale.id)).scalar(),
+        'concurrency': concurrency,
+        'seed': seed,
+        'routes': results,
+    }
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, indent=2, ensure_ascii=False)
+    click.echo(f'results written to {output}')
+
+    if baseline:
+        with open(baseline, encoding='utf-8') as handle:
+            previous = json.load(handle)
+        click.echo(f'compared with {previous.get("revision")} ({previous.get("database")}):')
+        for name, row in results.items():
+            before = previous.get('routes', {}).get(name)
+            if before and before['p95_ms']:
+                change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+                click.echo(f'  {name:<16} p95 {before["p95_ms"]:.2f} -> {row["p95_ms"]:.2f} ms ({change:+.0f}%)')
+
+
+# ==========================
+# زمن بدء العامل
+# ==========================
+_STARTUP_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+imported = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000,
+                  'first_request_ms': (served - imported) * 1000,
+                  'status': response.status_code,
+                  'modules': len(sys.modules)}))
+'''
+
+
+@app.cli.command('bench-startup')
+@click.option('--runs', default=5, help='عدد مرات تشغيل عملية جديدة')
+@click.option('--url', default='/login', help='أول طلب بعد الاستيراد')
+def bench_startup(runs, url):
+    """Time a cold worker: importing the app and serving its first request.
+
+    Each run is a fresh interpreter, like a new autoscaled instance, so
+    import caching in this process does not flatter the numbers.
+    """
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', _STARTUP_PROBE, url], capture_output=True,
+                                text=True, cwd=app.root_path, env=os.environ.copy())
+        if result.returncode != 0:
+            raise click.ClickException(result.stderr.strip().splitlines()[-1])
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    for key in ('import_ms', 'first_request_ms'):
+        values = [sample[key] for sample in samples]
+        click.echo(f'{key:<17} median {statistics.median(values):8.1f}  min {min(values):8.1f}')
+    click.echo(f'modules loaded    {samples[-1]["modules"]}  (status {samples[-1]["status"]})')
+    heavy = [name for name in ('reportlab', 'PIL', 'openpyxl', 'numpy')
+             if subprocess.run([sys.executable, '-c', f'import sys, app; sys.exit({name!r} in sys.modules)'],
+                               cwd=app.root_path, capture_output=True).returncode]
+    click.echo(f'eagerly imported  {", ".join(heavy) or "none of reportlab, PIL, openpyxl, numpy"}')
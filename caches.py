@@ -0,0 +1,420 @@
+import os
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from select import select as wait_readable
+from sqlalchemy import event, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app import app, db
+from models import Employee, Principal, Category, CacheVersion
+import images
+
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU map with an optional time-to-live per entry"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is not MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+    def peek(self, key):
+        """Read an entry without touching recency or the counters"""
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            return entry if entry is MISSING else entry[0]
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def replace(self, key, value):
+        """Swap the value of a cached entry, keeping its expiry"""
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is not MISSING:
+                self._data[key] = (value, entry[1])
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def pg_listen(channel, on_notify, on_idle=None, idle=60):
+    """Block on a dedicated PostgreSQL connection that LISTENs on `channel`.
+
+    Calls on_notify(payloads) for each batch of notifications, and
+    on_idle() once LISTEN is in place and after every `idle` quiet
+    seconds, which covers anything sent while the connection was down.
+    """
+    connection = db.engine.raw_connection()
+    connection.detach()
+    try:
+        listener = connection.driver_connection
+        listener.autocommit = True
+        listener.cursor().execute(f'LISTEN {channel}')
+        if on_idle:
+            on_idle()
+        while True:
+            if wait_readable([listener], [], [], idle)[0]:
+                listener.poll()
+                if listener.notifies:
+                    payloads = [notify.payload for notify in listener.notifies]
+                    listener.notifies.clear()
+                    on_notify(payloads)
+            elif on_idle:
+                on_idle()
+    finally:
+        connection.close()
+
+
+class VersionWatcher:
+    """This worker's copy of the cache_version table, kept current in the background.
+
+    On PostgreSQL a thread LISTENs for the NOTIFY that `VersionStamp.bump()`
+    sends when its transaction commits; on other databases it re-reads the
+    table every `interval` seconds. Readers only look up a dict, so checking
+    a version never costs a query. The thread starts on first use, which
+    keeps it out of a --preload master.
+    """
+
+    CHANNEL = 'cache_version'
+
+    def __init__(self, interval=5):
+        self.interval = interval
+        self.versions = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        # الخيط لا ينتقل مع fork؛ العامل يبدأ خيطه عند أول استخدام
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def version(self, name):
+        if self._thread is None:
+            self._start()
+        return self.versions.get(name, 0)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._read()
+            self._thread = threading.Thread(target=self._run, name='cache-version-watcher', daemon=True)
+            self._thread.start()
+
+    def _read(self):
+        with db.engine.connect() as connection:
+            self.versions = dict(connection.execute(select(CacheVersion.name, CacheVersion.version)).all())
+
+    def _run(self):
+        with app.app_context():
+            while True:
+                try:
+                    if db.engine.dialect.name == 'postgresql':
+                        self._listen()
+                    else:
+                        time.sleep(self.interval)
+                        self._read()
+                except Exception:
+                    app.logger.exception('cache version watcher failed, retrying')
+                    time.sleep(self.interval)
+
+    def _listen(self):
+        pg_listen(self.CHANNEL, lambda payloads: self._read(), on_idle=self._read)
+
+
+version_watcher = VersionWatcher(interval=app.config.get('CACHE_VERSION_INTERVAL', 5))
+
+
+class VersionStamp:
+    """A named counter in cache_version that lets workers drop stale entries.
+
+    Writers bump it inside the transaction that makes the change; other
+    workers see the new value through `version_watcher`, at once on
+    PostgreSQL and within its interval elsewhere.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._seen = MISSING
+
+    def bump(self):
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            stmt = postgresql.insert(CacheVersion)
+        elif dialect == 'sqlite':
+            stmt = sqlite.insert(CacheVersion)
+        else:
+            raise NotImplementedError(f'لا يوجد دعم لإصدارات الكاش على {dialect}')
+        stmt = stmt.values(name=self.name, version=1).on_conflict_do_update(
+            index_elements=[CacheVersion.name],
+            set_={'version': CacheVersion.version + 1}
+        )
+        db.session.execute(stmt)
+        if dialect == 'postgresql':
+            # يُسلَّم عند نجاح المعاملة فقط
+            db.session.execute(select(func.pg_notify(VersionWatcher.CHANNEL, self.name)))
+
+    @property
+    def version(self):
+        return version_watcher.version(self.name)
+
+    def changed(self):
+        """True once each time another process has bumped the counter"""
+        version = self.version
+        if version == self._seen:
+            return False
+        changed, self._seen = self._seen is not MISSING, version
+        return changed
+
+
+class ReferenceData:
+    """Process-local copy of a small table, reloaded when its VersionStamp moves.
+
+    A hit is one integer comparison against the watcher's copy of the
+    version. Writers call `invalidate(session)` in the transaction that
+    changes the table; this process reloads as soon as it commits.
+    `loader` must return plain values, not ORM objects bound to a session.
+    """
+
+    def __init__(self, name, loader):
+        self.stamp = VersionStamp(name)
+        self.loader = loader
+        self._entry = (MISSING, None)
+
+    def get(self):
+        version = self.stamp.version
+        loaded_version, value = self._entry
+        if loaded_version != version:
+            value = self.loader()
+            self._entry = (version, value)
+        return value
+
+    def invalidate(self, session):
+        self.stamp.bump()
+        session.info.setdefault('stale_reference_data', set()).add(self)
+
+    def reset(self):
+        self._entry = (MISSING, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _reload_reference_data(session):
+    for reference in session.info.pop('stale_reference_data', ()):
+        reference.reset()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_reference_data(session):
+    session.info.pop('stale_reference_data', None)
+
+
+# ==========================
+# كاش الباركود
+# ==========================
+# القيمة إما (payload, body) جاهزة للإرسال أو None للباركود غير الموجود.
+# المدة تحدد أقصى تأخير في رؤية تعديلات العمال الآخرين.
+barcode_cache = LRUCache(
+    maxsize=app.config.get('BARCODE_CACHE_SIZE', 4096),
+    ttl=app.config.get('BARCODE_CACHE_TTL', 30)
+)
+barcode_version = VersionStamp('barcodes')
+
+
+def product_payload(product):
+    """The product JSON shape shared by search and barcode lookups"""
+    return {
+        'id': product.id,
+        'name': product.name_ar,
+        'name_en': product.name,
+        'barcode': product.barcode,
+        'sku': product.sku,
+        'price': float(product.price),
+        'quantity': product.quantity,
+        'image_url': images.image_variant(product.image_url, 'tile')
+    }
+
+
+def cached_barcode(barcode):
+    """The cached entry for `barcode`, or MISSING; a product edit in any worker empties the cache"""
+    if barcode_version.changed():
+        barcode_cache.clear()
+    return barcode_cache.get(barcode)
+
+
+def cache_barcode(barcode, payload):
+    """Store a found product (or None for an unknown barcode) as encoded JSON"""
+    entry = None if payload is None else (payload, app.json.dumps(payload))
+    barcode_cache.set(barcode, entry)
+    return entry
+
+
+def invalidate_barcodes(session, *barcodes):
+    """Drop cached barcodes here once `session` commits, and elsewhere via barcode_version"""
+    barcodes = {barcode for barcode in barcodes if barcode}
+    if not barcodes:
+        return
+    barcode_version.bump()
+    session.info.setdefault('stale_barcodes', set()).update(barcodes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_stale_barcodes(session):
+    for barcode in session.info.pop('stale_barcodes', ()):
+        barcode_cache.pop(barcode)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_barcodes(session):
+    session.info.pop('stale_barcodes', None)
+
+
+def refresh_stock_after_commit(session, levels):
+    """Queue {barcode: quantity} updates to apply once `session` commits"""
+    session.info.setdefault('barcode_stock', {}).update(levels)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_stock_levels(session):
+    for barcode, quantity in session.info.pop('barcode_stock', {}).items():
+        entry = barcode_cache.peek(barcode)
+        if entry is not MISSING and entry is not None:
+            payload = dict(entry[0], quantity=quantity)
+            barcode_cache.replace(barcode, (payload, app.json.dumps(payload)))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stock_levels(session):
+    session.info.pop('barcode_stock', None)
+
+
+# ==========================
+# كاش المستخدم الحالي
+# ==========================
+# يُقرأ في كل طلب مسجل، بما فيه كل حرف في البحث وكل مسح باركود
+principal_cache = LRUCache(
+    maxsize=app.config.get('PRINCIPAL_CACHE_SIZE', 1024),
+    ttl=app.config.get('PRINCIPAL_CACHE_TTL', 60)
+)
+auth_version = VersionStamp('auth')
+
+
+def load_principal(user_id):
+    """Flask-Login user loader; inactive or deleted employees load as None"""
+    try:
+        employee_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    if auth_version.changed():
+        principal_cache.clear()
+    principal = principal_cache.get(employee_id)
+    if principal is MISSING:
+        employee = db.session.get(Employee, employee_id)
+        principal = Principal(employee) if employee is not None and employee.is_active else None
+        principal_cache.set(employee_id, principal)
+    return principal
+
+
+def invalidate_employee(session, employee_id):
+    """Drop a cached principal here once `session` commits, and elsewhere via auth_version"""
+    auth_version.bump()
+    session.info.setdefault('stale_principals', set()).add(employee_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_stale_principals(session):
+    for employee_id in session.info.pop('stale_principals', ()):
+        principal_cache.pop(employee_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_principals(session):
+    session.info.pop('stale_principals', None)
+
+
+# ==========================
+# البيانات المرجعية: الفئات
+# ==========================
+# الصلاحيات (ROLE_PERMISSIONS) وإعدادات المتجر (app.config) ثابتة في الكود
+# ولا تُقرأ من قاعدة البيانات، فالفئات وحدها تحتاج كاشاً
+CategoryRef = namedtuple('CategoryRef', 'id name name_ar')
+
+
+class CategoryIndex:
+    """All categories in id order, with lookups by id and by Arabic name"""
+
+    def __init__(self, rows):
+        self.all = tuple(CategoryRef(*row) for row in rows)
+        self.by_id = {category.id: category for category in self.all}
+        self.by_name = {}
+        for category in self.all:
+            self.by_name.setdefault(category.name_ar, category)
+        self.names = {category.id: category.name_ar for category in self.all}
+
+
+category_data = ReferenceData('categories', lambda: CategoryIndex(db.session.execute(
+    select(Category.id, Category.name, Category.name_ar).order_by(Category.id)).all()))
+
+
+def category_index():
+    return category_data.get()
+
+
+def category_by_name(name_ar):
+    """The category named `name_ar`, asking the database only when this worker does not know it"""
+    category = category_index().by_name.get(name_ar)
+    if category is None:
+        # قد تكون أُضيفت للتو في عامل آخر ولم يصلنا إصدارها بعد
+        row = db.session.execute(select(Category.id, Category.name, Category.name_ar)
+                                 .where(Category.name_ar == name_ar).order_by(Category.id).limit(1)).first()
+        category = CategoryRef(*row) if row else None
+    return category
+
+
+def invalidate_categories(session):
+    """Call in the transaction that adds, renames or removes a category"""
+    category_data.invalidate(session)
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+from flask import request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import event, select, insert, delete, or_, and_
+from app import app, db
+from models import Product, ProductTombstone
+import images
+from http_cache import conditional_body
+
+# ترتيب الحقول في كل صف من صفوف الكتالوج المضغوط
+CATALOG_FIELDS = ['id', 'barcode', 'sku', 'name', 'name_en', 'price', 'quantity', 'image_url', 'active']
+CATALOG_PAGE_SIZE = 5000
+MAX_CATALOG_PAGE_SIZE = 20000
+# التعديلات الأحدث من هذا لا تُرسل بعد، حتى لا تفوت الطرفية معاملة
+# بدأت قبل المؤشر ولم تُحفظ إلا بعده
+CATALOG_SETTLE_SECONDS = 2
+# بعد هذه المدة تُحذف سجلات الحذف، والطرفية الأقدم منها تعيد التحميل كاملاً
+TOMBSTONE_RETENTION_DAYS = 30
+
+
+# ==========================
+# سجل المنتجات المحذوفة
+# ==========================
+@event.listens_for(Product, 'after_delete')
+def _record_tombstone(mapper, connection, target):
+    now = datetime.utcnow()
+    table = ProductTombstone.__table__
+    connection.execute(delete(table).where(or_(
+        table.c.product_id == target.id,
+        table.c.deleted_at < now - timedelta(days=TOMBSTONE_RETENTION_DAYS))))
+    connection.execute(insert(table).values(product_id=target.id, deleted_at=now))
+
+
+# ==========================
+# المؤشر: "<updated_at>" أو "<updated_at>,<id>"
+# ==========================
+def format_cursor(updated_at, product_id=None):
+    text = updated_at.isoformat(timespec='microseconds')
+    return text if product_id is None else f'{text},{product_id}'
+
+
+def parse_cursor(cursor):
+    """(updated_at, id or None); raises ValueError for a malformed cursor"""
+    stamp, _, product_id = cursor.partition(',')
+    return datetime.fromisoformat(stamp), int(product_id) if product_id else None
+
+
+def catalog_row(product):
+    """A product row in CATALOG_FIELDS order"""
+    return [
+        product.id,
+        product.barcode,
+        product.sku,
+        product.name_ar,
+        product.name,
+        float(product.price),
+        product.quantity,
+        images.image_variant(product.image_url, 'tile'),
+        1 if product.is_active else 0,
+    ]
+
+
+def catalog_page(cursor=None, limit=CATALOG_PAGE_SIZE):
+    """One page of the product catalog in compact form.
+
+    Without a cursor (or with a sync watermark older than the tombstone
+    retention) it is a snapshot of active products and `full` is true:
+    the terminal replaces its copy. Later pages of a snapshot continue
+    from their keyset cursor however old its timestamp is. With a cursor it is a delta of products changed
+    since then, deactivated ones included with active=0, plus ids
+    deleted since then. Rows are ordered by (updated_at, id) so a cursor
+    is a keyset position; `more` means another page follows immediately.
+    Applying `deleted` before `products` is always correct.
+    """
+    now = datetime.utcnow()
+    settled = now - timedelta(seconds=CATALOG_SETTLE_SECONDS)
+    since, since_id = parse_cursor(cursor) if cursor else (None, None)
+    # مؤشر بمعرّف هو موضع داخل سلسلة صفحات، وقد يكون تاريخه قديماً؛ مهلة
+    # الاحتفاظ تخص علامة المزامنة وحدها، وإلا عادت الصفحة الأولى في كل مرة
+    full = since is None or (since_id is None and
+                             since < now - timedelta(days=TOMBSTONE_RETENTION_DAYS))
+    if full and since is not None:
+        since = None
+
+    query = select(Product.id, Product.barcode, Product.sku, Product.name_ar, Product.name,
+                   Product.price, Product.quantity, Product.image_url, Product.is_active,
+                   Product.updated_at).where(Product.updated_at <= settled)
+    if since is None:
+        query = query.where(Product.is_active == True)
+    elif since_id is None:
+        query = query.where(Product.updated_at > since)
+    else:
+        query = query.where(or_(Product.updated_at > since,
+                                and_(Product.updated_at == since, Product.id > since_id)))
+    products = db.session.execute(
+        query.order_by(Product.updated_at, Product.id).limit(limit + 1)
+    ).all()
+    more = len(products) > limit
+    products = products[:limit]
+
+    # سجلات الحذف حتى آخر صف في الصفحة فقط، والباقي يأتي مع الصفحة التالية
+    upper = products[-1].updated_at if more else settled
+    deleted = []
+    if since is not None:
+        deleted = db.session.execute(
+            select(ProductTombstone.product_id, ProductTombstone.deleted_at)
+            .where(ProductTombstone.deleted_at > since, ProductTombstone.deleted_at <= upper)
+        ).all()
+
+    if more:
+        next_cursor = format_cursor(products[-1].updated_at, products[-1].id)
+    else:
+        # كل ما تم حتى آخر تغيير مُرسل؛ بلا تغييرات يبقى المؤشر كما هو
+        # فتتطابق الاستجابة وتعود 304
+        stamps = [product.updated_at for product in products[-1:]] + [row.deleted_at for row in deleted]
+        if stamps and max(stamps) >= now - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+            next_cursor = format_cursor(max(stamps))
+        elif stamps:
+            # كل شيء حتى settled أُرسل؛ علامة بتاريخ آخر صف القديم تعيد اللقطة كاملة
+            next_cursor = format_cursor(settled)
+        elif since is not None:
+            next_cursor = cursor
+        else:
+            next_cursor = format_cursor(settled)
+
+    return {
+        'full': full,
+        'fields': CATALOG_FIELDS,
+        'products': [catalog_row(product) for product in products],
+        'deleted': [row.product_id for row in deleted],
+        'cursor': next_cursor,
+        'more': more,
+    }
+
+
+# ==========================
+# نقطة /api/catalog
+# ==========================
+@app.route('/api/catalog')
+@login_required
+def product_catalog():
+    """Snapshot (no `since`) or delta (`since=<cursor>`) of the product catalog for POS terminals"""
+    if not current_user.has_permission('make_sales'):
+        return jsonify({'error': 'ليس لديك صلاحية'}), 403
+    limit = min(max(request.args.get('limit', CATALOG_PAGE_SIZE, type=int), 1), MAX_CATALOG_PAGE_SIZE)
+    try:
+        page = catalog_page(request.args.get('since') or None, limit)
+    except ValueError:
+        return jsonify({'error': 'مؤشر مزامنة غير صالح'}), 400
+    body = app.json.dumps(page, separators=(',', ':'))
+    return conditional_body(app.response_class(body, mimetype='application/json'))
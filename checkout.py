@@ -0,0 +1,475 @@
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import select, insert, update, case
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import Product, Sale, SaleItem, InventoryMovement
+from sequences import invoice_numbers
+from rollups import record_sale, record_sales
+from caches import refresh_stock_after_commit
+from live import publish_sales
+from instrumentation import timed
+
+CENTS = Decimal('0.01')
+INGEST_CHUNK_SIZE = 100
+MAX_BATCH_SALES = 1000
+MAX_CLIENT_KEY_LENGTH = 64
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into a sale"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _to_money(value):
+    try:
+        amount = Decimal(str(value)).quantize(CENTS)
+    except (InvalidOperation, TypeError, ValueError):
+        raise CheckoutError(f'قيمة غير صحيحة: {value}')
+    if amount < 0:
+        raise CheckoutError(f'قيمة غير صحيحة: {value}')
+    return amount
+
+
+def _parse_lines(items):
+    """Normalize raw cart lines into (product_id, quantity, unit_price) tuples"""
+    lines = []
+    for item_data in items:
+        try:
+            product_id = int(item_data['product_id'])
+            quantity = int(item_data['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError('بيانات السلة غير صحيحة')
+        if quantity <= 0:
+            raise CheckoutError('الكمية يجب أن تكون أكبر من صفر')
+        unit_price = item_data.get('price')
+        lines.append((product_id, quantity, None if unit_price is None else _to_money(unit_price)))
+    return lines
+
+
+class InsufficientStock(CheckoutError):
+    """Raised when one or more cart lines cannot be served from stock"""
+
+    def __init__(self, lines):
+        names = '، '.join(line['name'] for line in lines)
+        super().__init__(f'الكمية المطلوبة غير متوفرة للمنتج: {names}')
+        self.lines = lines
+
+
+def _lock_products(product_ids):
+    """Take row locks in primary key order so concurrent checkouts never deadlock"""
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite serializes writers on the database file, there are no row locks
+        return
+    db.session.execute(
+        select(Product.id)
+        .where(Product.id.in_(product_ids))
+        .order_by(Product.id)
+        .with_for_update()
+    )
+
+
+def _decrement_stock(requested):
+    """Decrement stock for every product in one conditional UPDATE.
+
+    A row is only touched when it still holds enough stock, so two tills
+    racing for the last units can never both succeed. Returns the
+    post-sale rows for the products that were decremented.
+    """
+    needed = case(requested, value=Product.id)
+    rows = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(requested), Product.quantity >= needed)
+        .values(quantity=Product.quantity - needed, updated_at=datetime.utcnow())
+        .returning(Product.id, Product.name_ar, Product.sku, Product.barcode,
+                   Product.price, Product.quantity, Product.min_quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return {row.id: row for row in rows}
+
+
+def _shortages(requested, decremented):
+    """Describe the lines the conditional UPDATE refused, one entry per product"""
+    missing = [product_id for product_id in requested if product_id not in decremented]
+    current = {row.id: row for row in db.session.execute(
+        select(Product.id, Product.name_ar, Product.quantity).where(Product.id.in_(missing))
+    )}
+    shortages = []
+    for product_id in missing:
+        row = current.get(product_id)
+        if row is None:
+            raise CheckoutError(f'المنتج غير موجود: {product_id}')
+        shortages.append({
+            'product_id': product_id,
+            'name': row.name_ar,
+            'requested': requested[product_id],
+            'available': row.quantity,
+        })
+    return shortages
+
+
+def _requested(lines):
+    requested = {}
+    for product_id, quantity, _ in lines:
+        requested[product_id] = requested.get(product_id, 0) + quantity
+    return requested
+
+
+def _plan(lines, products, stock, discount_amount):
+    """Price one cart against the decremented rows, consuming `stock` (pre-sale quantities) line by line"""
+    planned = []
+    subtotal = Decimal('0.00')
+    for product_id, quantity, unit_price in lines:
+        product = products[product_id]
+        previous_quantity = stock[product_id]
+        stock[product_id] = previous_quantity - quantity
+
+        # السعر من المنتج دائماً؛ سعر مختلف من العميل يعني كتالوجاً قديماً على الجهاز
+        price = Decimal(product.price).quantize(CENTS)
+        if unit_price is not None and unit_price != price:
+            raise CheckoutError(f'سعر {product.name_ar} تغيّر إلى {price}، يرجى تحديث السلة')
+        unit_price = price
+        item_total = unit_price * quantity
+        subtotal += item_total
+        planned.append((product, quantity, unit_price, item_total, previous_quantity))
+
+    if discount_amount > subtotal:
+        raise CheckoutError('قيمة الخصم أكبر من إجمالي المبلغ')
+    return planned, subtotal
+
+
+def _line_rows(sale_id, employee_id, planned):
+    """The sale_item and inventory_movement rows of one planned sale"""
+    items = [{
+        'sale_id': sale_id,
+        'product_id': product.id,
+        'product_name': product.name_ar,
+        'product_sku': product.sku,
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'total_price': item_total,
+    } for product, quantity, unit_price, item_total, _ in planned]
+    movements = [{
+        'movement_type': 'out',
+        'quantity': quantity,
+        'previous_quantity': previous_quantity,
+        'new_quantity': previous_quantity - quantity,
+        'reason': 'sale',
+        'reference_id': sale_id,
+        'product_id': product.id,
+        'employee_id': employee_id,
+    } for product, quantity, _, _, previous_quantity in planned]
+    return items, movements
+
+
+def _refresh_barcodes(products):
+    # بعد آخر خطوة قد تفشل، حتى لا يبقى في الطابور مخزون بيع أُلغي
+    refresh_stock_after_commit(db.session, {
+        product.barcode: product.quantity for product in products.values() if product.barcode
+    })
+
+
+def _announce(sales, products, requested):
+    """Queue the dashboard event for written sales; like _refresh_barcodes, call it last"""
+    low_stock = [
+        (product, product.quantity + requested[product.id] > product.min_quantity)
+        for product in products.values()
+        if product.min_quantity is not None and product.quantity <= product.min_quantity
+    ]
+    publish_sales(db.session(), sales, low_stock)
+
+
+def checkout(items, employee_id, payment_method='cash', customer_name='',
+             customer_phone='', discount_amount=0, client_key=None, created_at=None,
+             invoice_number=None):
+    """Validate a cart and write the sale with set-based statements.
+
+    Stock is decremented first with a guarded UPDATE ... RETURNING, which
+    both checks availability atomically and hands back the product data
+    the sale needs, so the statement count is constant in the number of
+    cart lines. The caller owns the transaction: it must commit on success
+    and roll back on any exception. `client_key` is the terminal's
+    idempotency key; a second sale with the same key fails with
+    IntegrityError on the unique index. A caller that has already
+    written in this transaction passes an `invoice_number` it took
+    beforehand.
+    """
+    if not items:
+        raise CheckoutError('لا يوجد منتجات في السلة')
+
+    lines = _parse_lines(items)
+    discount_amount = _to_money(discount_amount or 0)
+    requested = _requested(lines)
+    # أخذ الرقم قبل أول كتابة، فلا ينتظر حجز كتلة جديدة خلف معاملتنا
+    if invoice_number is None:
+        invoice_number, = invoice_numbers()
+
+    with timed('lock'):
+        _lock_products(requested)
+    with timed('stock_check'):
+        products = _decrement_stock(requested)
+    if len(products) != len(requested):
+        raise InsufficientStock(_shortages(requested, products))
+
+    # توزيع الكميات السابقة والجديدة على سطور السلة بالترتيب
+    stock = {product_id: products[product_id].quantity + total
+             for product_id, total in requested.items()}
+    planned, subtotal = _plan(lines, products, stock, discount_amount)
+
+    sale = Sale(
+        invoice_number=invoice_number,
+        total_amount=subtotal - discount_amount,
+        discount_amount=discount_amount,
+        payment_method=payment_method,
+        customer_name=customer_name,
+        customer_phone=customer_phone,
+        employee_id=employee_id,
+        client_key=client_key,
+        created_at=created_at or datetime.utcnow()
+    )
+    with timed('insert'):
+        db.session.add(sale)
+        db.session.flush()
+        record_sale(sale)
+
+        items, movements = _line_rows(sale.id, employee_id, planned)
+        db.session.execute(insert(SaleItem), items)
+        db.session.execute(insert(InventoryMovement), movements)
+
+    _refresh_barcodes(products)
+    _announce([{'id': sale.id, 'invoice_number': sale.invoice_number, 'total_amount': sale.total_amount,
+                'customer_name': sale.customer_name, 'employee_id': employee_id,
+                'created_at': sale.created_at}], products, requested)
+    return sale
+
+
+# ==========================
+# استقبال المبيعات المؤجلة على دفعات
+# ==========================
+def sale_result(sale, status):
+    return {
+        'status': status,
+        'sale_id': sale.id,
+        'invoice_number': sale.invoice_number,
+        'total_amount': float(sale.total_amount),
+    }
+
+
+def find_sale_by_key(client_key):
+    return Sale.query.filter_by(client_key=client_key).first() if client_key else None
+
+
+def parse_client_key(value):
+    key = str(value or '').strip()
+    if len(key) > MAX_CLIENT_KEY_LENGTH:
+        raise CheckoutError('مفتاح العملية طويل جداً')
+    return key or None
+
+
+def _parse_sold_at(value):
+    """The time a queued sale happened on the terminal, in naive UTC and never in the future"""
+    if not value:
+        return None
+    try:
+        sold_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise CheckoutError(f'تاريخ البيع غير صحيح: {value}')
+    if sold_at.tzinfo is not None:
+        sold_at = sold_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(sold_at, datetime.utcnow())
+
+
+class _Order:
+    """A queued sale parsed and validated before any row is touched"""
+
+    __slots__ = ('client_key', 'lines', 'discount_amount', 'payment_method',
+                 'customer_name', 'customer_phone', 'created_at')
+
+    def __init__(self, data, client_key):
+        if not data.get('items'):
+            raise CheckoutError('لا يوجد منتجات في السلة')
+        self.client_key = client_key
+        self.lines = _parse_lines(data['items'])
+        self.discount_amount = _to_money(data.get('discount_amount') or 0)
+        self.payment_method = data.get('payment_method', 'cash')
+        self.customer_name = data.get('customer_name', '')
+        self.customer_phone = data.get('customer_phone', '')
+        self.created_at = _parse_sold_at(data.get('sold_at'))
+
+
+def _ingest_chunk(orders, employee_id, invoice_numbers):
+    """Write many validated orders with one stock UPDATE and one insert per table.
+
+    Raises CheckoutError (stock or discount) or IntegrityError (a key
+    stored meanwhile by another request) when any order in the chunk
+    cannot be written; the caller then retries the orders one by one.
+    """
+    requested = {}
+    for order in orders:
+        for product_id, quantity in _requested(order.lines).items():
+            requested[product_id] = requested.get(product_id, 0) + quantity
+
+    _lock_products(requested)
+    products = _decrement_stock(requested)
+    if len(products) != len(requested):
+        raise InsufficientStock(_shortages(requested, products))
+
+    stock = {product_id: products[product_id].quantity + total
+             for product_id, total in requested.items()}
+    now = datetime.utcnow()
+    plans = [_plan(order.lines, products, stock, order.discount_amount) for order in orders]
+    sales = []
+    for order, (planned, subtotal), invoice_number in zip(orders, plans, invoice_numbers):
+        sales.append({
+            'invoice_number': invoice_number,
+            'total_amount': subtotal - order.discount_amount,
+            'discount_amount': order.discount_amount,
+            'tax_amount': Decimal('0.00'),
+            'payment_method': order.payment_method,
+            'customer_name': order.customer_name,
+            'customer_phone': order.customer_phone,
+            'employee_id': employee_id,
+            'client_key': order.client_key,
+            'created_at': order.created_at or now,
+        })
+
+    # أرقام الفواتير فريدة فتُربط بها المعرفات بدل ترتيب الصفوف، وهكذا
+    # يبقى الإدخال جملة واحدة متعددة القيم
+    table = Sale.__table__
+    ids_by_invoice = dict(db.session.execute(
+        insert(table).returning(table.c.invoice_number, table.c.id), sales
+    ).all())
+    sale_ids = [ids_by_invoice[sale['invoice_number']] for sale in sales]
+    record_sales(sales)
+
+    items, movements = [], []
+    for sale_id, (planned, _) in zip(sale_ids, plans):
+        sale_items, sale_movements = _line_rows(sale_id, employee_id, planned)
+        items += sale_items
+        movements += sale_movements
+    db.session.execute(insert(SaleItem.__table__), items)
+    db.session.execute(insert(InventoryMovement.__table__), movements)
+
+    _refresh_barcodes(products)
+    _announce([dict(sale, id=sale_id) for sale_id, sale in zip(sale_ids, sales)], products, requested)
+    return [{
+        'status': 'created',
+        'sale_id': sale_id,
+        'invoice_number': sale['invoice_number'],
+        'total_amount': float(sale['total_amount']),
+    } for sale_id, sale in zip(sale_ids, sales)]
+
+
+def _ingest_one(data, client_key, employee_id, invoice_number):
+    """Write one queued sale inside a savepoint so a failure only discards that sale"""
+    savepoint = db.session.begin_nested()
+    try:
+        sale = checkout(
+            data.get('items', []),
+            employee_id=employee_id,
+            payment_method=data.get('payment_method', 'cash'),
+            customer_name=data.get('customer_name', ''),
+            customer_phone=data.get('customer_phone', ''),
+            discount_amount=data.get('discount_amount', 0),
+            client_key=client_key,
+            created_at=_parse_sold_at(data.get('sold_at')),
+            invoice_number=invoice_number,
+        )
+        savepoint.commit()
+        return sale_result(sale, 'created')
+    except InsufficientStock as e:
+        savepoint.rollback()
+        return {'status': 'error', 'error': e.message, 'lines': e.lines}
+    except CheckoutError as e:
+        savepoint.rollback()
+        return {'status': 'error', 'error': e.message}
+    except IntegrityError:
+        savepoint.rollback()
+        # طرفية أخرى أرسلت نفس العملية للتو
+        existing = find_sale_by_key(client_key)
+        if existing is not None:
+            return sale_result(existing, 'duplicate')
+        return {'status': 'error', 'error': 'تعذر حفظ عملية البيع، أعد المحاولة'}
+
+
+def _write_orders(orders, sales, keys, employee_id):
+    """Results by position for one chunk of new orders"""
+    # الأرقام تؤخذ قبل أي كتابة؛ إن تراجعت الدفعة لم يُحفظ منها شيء فتعيد
+    # كل عملية استخدام رقمها
+    numbers = dict(zip(orders, invoice_numbers(len(orders))))
+    savepoint = db.session.begin_nested()
+    try:
+        written = _ingest_chunk(list(orders.values()), employee_id, list(numbers.values()))
+        savepoint.commit()
+        return dict(zip(orders, written))
+    except (CheckoutError, IntegrityError):
+        savepoint.rollback()
+    return {position: _ingest_one(sales[position], keys[position], employee_id, numbers[position])
+            for position in orders}
+
+
+def ingest_sales(sales, employee_id, chunk_size=INGEST_CHUNK_SIZE):
+    """Write a backlog of queued sales, returning one result per input in order.
+
+    Every sale carries a `client_key`. Keys already stored (or repeated
+    earlier in the batch) come back as 'duplicate' with the original
+    sale, so a terminal can resend its whole queue after a lost
+    response. New sales are written `chunk_size` at a time with
+    set-based statements and one commit per chunk. When a chunk cannot
+    go through as a whole, for example because one sale lacks stock, it
+    is retried sale by sale and only the failing ones are reported as
+    'error'.
+    """
+    results = [None] * len(sales)
+    client_keys = {}
+    first_seen = {}
+    for start in range(0, len(sales), chunk_size):
+        positions = range(start, min(start + chunk_size, len(sales)))
+        keys = {}
+        for position in positions:
+            data = sales[position]
+            try:
+                key = parse_client_key(data.get('client_key')) if isinstance(data, dict) else None
+            except CheckoutError as e:
+                results[position] = {'status': 'error', 'error': e.message}
+                continue
+            if key is None:
+                results[position] = {'status': 'error', 'error': 'مفتاح العملية (client_key) مطلوب'}
+            else:
+                keys[position] = key
+        client_keys.update(keys)
+        existing = {sale.client_key: sale for sale in
+                    Sale.query.filter(Sale.client_key.in_(set(keys.values())))}
+
+        orders = {}
+        for position, key in keys.items():
+            if key in first_seen:
+                continue
+            first_seen[key] = position
+            if key in existing:
+                results[position] = sale_result(existing[key], 'duplicate')
+                continue
+            try:
+                orders[position] = _Order(sales[position], key)
+            except CheckoutError as e:
+                results[position] = {'status': 'error', 'error': e.message}
+
+        if orders:
+            for position, result in _write_orders(orders, sales, keys, employee_id).items():
+                results[position] = result
+        db.session.commit()
+
+        # التكرار داخل نفس الطلب يأخذ نتيجة أول ظهور للمفتاح
+        for position, key in keys.items():
+            first = first_seen[key]
+            if first != position:
+                result = dict(results[first])
+                if result['status'] == 'created':
+                    result['status'] = 'duplicate'
+                results[position] = result
+    return [dict(result, client_key=client_keys[position]) if position in client_keys else result
+            for position, result in enumerate(results)]
@@ -0,0 +1,61 @@
+import os
+import re
+import hashlib
+from app import app
+from utils import process_pool, build_image_variants, variant_name, IMAGE_VARIANTS
+
+UPLOAD_URL_PREFIX = '/static/uploads/'
+
+_CONTENT_ADDRESSED = re.compile(r'^/static/uploads/([0-9a-f]{2}/[0-9a-f]{64})/original\.(\w+)$')
+
+
+def _upload_root():
+    return app.config['UPLOAD_FOLDER']
+
+
+def save_upload(file):
+    """Store an uploaded image content-addressed and queue its variants.
+
+    Identical uploads hash to the same directory, so they share one copy
+    on disk. Returns the URL of the original, which is what
+    Product.image_url keeps; `image_variant` maps it to a sized copy.
+    """
+    data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    relative = f'{digest[:2]}/{digest}'
+    directory = os.path.join(_upload_root(), digest[:2], digest)
+    original_path = os.path.join(directory, f'original.{extension}')
+
+    if not os.path.exists(original_path):
+        os.makedirs(directory, exist_ok=True)
+        partial = f'{original_path}.{os.getpid()}.tmp'
+        with open(partial, 'wb') as handle:
+            handle.write(data)
+        os.replace(partial, original_path)
+
+    if not all(os.path.exists(os.path.join(directory, variant_name(variant)))
+               for variant in IMAGE_VARIANTS):
+        process_pool('images', app.config['IMAGE_WORKERS']).submit(build_image_variants, original_path)
+
+    return f'{UPLOAD_URL_PREFIX}{relative}/original.{extension}'
+
+
+def image_variant(image_url, variant):
+    """URL of a sized copy of a product image.
+
+    Falls back to the original while the variant is still being built
+    and for images uploaded before the pipeline existed.
+    """
+    if not image_url:
+        return image_url
+    match = _CONTENT_ADDRESSED.match(image_url)
+    if not match:
+        return image_url
+    relative = f'{match.group(1)}/{variant_name(variant)}'
+    if os.path.exists(os.path.join(_upload_root(), relative)):
+        return f'{UPLOAD_URL_PREFIX}{relative}'
+    return image_url
+
+
+app.add_template_filter(image_variant)
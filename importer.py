@@ -0,0 +1,419 @@
+import io
+import csv
+import json
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import click
+from sqlalchemy import select, insert, update, bindparam, or_, case
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+from models import Employee, Category, Product, InventoryMovement
+from caches import invalidate_barcodes, category_index, invalidate_categories
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+CENTS = Decimal('0.01')
+_FALSE = {'0', 'false', 'no', 'لا', 'غير متوفر'}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _money(value, field, required=False):
+    text = _text(value)
+    if not text:
+        if required:
+            raise RowError(f'{field} مطلوب')
+        return None
+    try:
+        amount = Decimal(text).quantize(CENTS)
+    except InvalidOperation:
+        raise RowError(f'{field} غير صحيح: {text}')
+    if amount < 0 or (required and amount == 0):
+        raise RowError(f'{field} غير صحيح: {text}')
+    return amount
+
+
+def _count(value, field, default):
+    text = _text(value)
+    if not text:
+        return default
+    try:
+        number = int(Decimal(text))
+    except InvalidOperation:
+        raise RowError(f'{field} غير صحيح: {text}')
+    if number < 0:
+        raise RowError(f'{field} لا يمكن أن يكون سالباً')
+    return number
+
+
+# القيم المستخدمة للمنتج الجديد عندما لا يحددها الملف
+NEW_PRODUCT_DEFAULTS = {
+    'barcode': None, 'description': None, 'cost_price': None,
+    'quantity': 0, 'min_quantity': 5, 'is_active': True, 'category': '',
+}
+PRODUCT_COLUMNS = ('sku', 'barcode', 'name', 'name_ar', 'description', 'price', 'cost_price',
+                   'quantity', 'min_quantity', 'is_active', 'category_id')
+
+
+def clean_row(raw):
+    """Validate one supplier row, raising RowError.
+
+    Only the columns the row actually fills are returned, so a partial
+    feed (say sku and price) updates those and leaves the rest alone.
+    """
+    sku = _text(raw.get('sku'))
+    if not sku:
+        raise RowError('SKU مطلوب')
+    row = {'sku': sku}
+    for key in ('barcode', 'name', 'name_ar', 'description', 'category'):
+        if _text(raw.get(key)):
+            row[key] = _text(raw.get(key))
+    if _text(raw.get('price')):
+        row['price'] = _money(raw.get('price'), 'السعر', required=True)
+    if _text(raw.get('cost_price')):
+        row['cost_price'] = _money(raw.get('cost_price'), 'سعر التكلفة')
+    if _text(raw.get('quantity')):
+        row['quantity'] = _count(raw.get('quantity'), 'الكمية', 0)
+    if _text(raw.get('min_quantity')):
+        row['min_quantity'] = _count(raw.get('min_quantity'), 'الحد الأدنى', 5)
+    if _text(raw.get('is_active')):
+        row['is_active'] = _text(raw.get('is_active')).lower() not in _FALSE
+    return row
+
+
+# ==========================
+# قراءة الملفات بشكل متدفق
+# ==========================
+def iter_csv(stream):
+    """(line number, row) pairs of a UTF-8 CSV (BOM tolerated), read line by line"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    for raw in reader:
+        yield reader.line_num, raw
+
+
+def iter_json(stream, chunk_size=64 * 1024):
+    """(position, object) pairs from a JSON array or JSON Lines, decoded incrementally.
+
+    Only the current chunk and the object being decoded are held in
+    memory, so a catalog of any size can be read.
+    """
+    decoder = json.JSONDecoder()
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    buffer = ''
+    eof = False
+    position = 0
+    while True:
+        # تخطي الأقواس والفواصل والمسافات بين الكائنات
+        start = 0
+        while start < len(buffer) and buffer[start] in ' \t\r\n,[]':
+            start += 1
+        buffer = buffer[start:]
+        if not buffer:
+            if eof:
+                return
+            chunk = text.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError('ملف JSON غير صالح')
+            chunk = text.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        if not isinstance(item, dict):
+            raise ValueError('ملف JSON يجب أن يحتوي على كائنات منتجات')
+        position += 1
+        yield position, item
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        return iter_csv(stream)
+    if fmt in ('json', 'jsonl'):
+        return iter_json(stream)
+    raise ValueError(f'صيغة غير مدعومة: {fmt}')
+
+
+def detect_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    return extension if extension in ('csv', 'json', 'jsonl') else default
+
+
+# ==========================
+# الاستيراد على دفعات
+# ==========================
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, sku, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line, 'sku': sku, 'error': message})
+
+    def to_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def _resolve_categories(names, categories):
+    """Fill `categories` (name_ar -> id) for every name, creating missing ones in one statement"""
+    missing = {name for name in names if name and name not in categories}
+    known = category_index().by_name
+    for name in missing & known.keys():
+        categories[name] = known[name].id
+    missing -= categories.keys()
+    if not missing:
+        return
+    for category_id, name_ar in db.session.execute(
+            select(Category.id, Category.name_ar).where(Category.name_ar.in_(missing))):
+        categories.setdefault(name_ar, category_id)
+    missing -= categories.keys()
+    if missing:
+        db.session.execute(insert(Category.__table__),
+                           [{'name': name, 'name_ar': name, 'created_at': datetime.utcnow()}
+                            for name in missing])
+        invalidate_categories(db.session)
+        for category_id, name_ar in db.session.execute(
+                select(Category.id, Category.name_ar).where(Category.name_ar.in_(missing))):
+            categories.setdefault(name_ar, category_id)
+
+
+def _write_batch(batch, employee_id, categories, report):
+    """Upsert one batch of (line, row) pairs with a few set-based statements.
+
+    Only the columns a row changes are written. A new quantity is applied
+    as the difference from the quantity read here, so a sale committed
+    in between is kept rather than overwritten.
+
+    Returns the stale barcodes and the counts of created, updated and
+    unchanged rows; the caller adds the counts once the batch commits.
+    """
+    by_sku = {}
+    barcodes = set()
+    for line, row in batch:
+        barcode = row.get('barcode')
+        if row['sku'] in by_sku:
+            report.error(line, row['sku'], 'SKU مكرر في نفس الدفعة')
+        elif barcode in barcodes:
+            report.error(line, row['sku'], f'الباركود {barcode} مكرر في نفس الدفعة')
+        else:
+            by_sku[row['sku']] = (line, row)
+            if barcode:
+                barcodes.add(barcode)
+
+    existing_by_sku = {}
+    existing_by_barcode = {}
+    for product in db.session.execute(
+            select(Product.id, *(getattr(Product, column) for column in PRODUCT_COLUMNS))
+            .where(or_(Product.sku.in_(by_sku), Product.barcode.in_(barcodes)))):
+        existing_by_sku[product.sku] = product
+        if product.barcode:
+            existing_by_barcode[product.barcode] = product
+
+    _resolve_categories({row.get('category') for _, row in by_sku.values()}, categories)
+
+    now = datetime.utcnow()
+    inserts, movements, stale_barcodes = [], [], []
+    updates = {}  # الأعمدة المتغيرة -> الصفوف
+    deltas, delta_lines = {}, {}
+    written, unchanged = set(), 0
+    for sku, (line, row) in by_sku.items():
+        current = existing_by_sku.get(sku)
+        owner = existing_by_barcode.get(row['barcode']) if row.get('barcode') else None
+        if current is None:
+            current = owner
+        elif owner is not None and owner.id != current.id:
+            report.error(line, sku, f'الباركود {row["barcode"]} مستخدم لمنتج آخر ({owner.sku})')
+            continue
+
+        if current is None:
+            if 'name_ar' not in row:
+                report.error(line, sku, 'اسم المنتج بالعربية مطلوب')
+                continue
+            if 'price' not in row:
+                report.error(line, sku, 'السعر مطلوب')
+                continue
+            row = {**NEW_PRODUCT_DEFAULTS, 'name': row['name_ar'], **row}
+            values = {column: row[column] for column in PRODUCT_COLUMNS if column != 'category_id'}
+            values['category_id'] = categories.get(row['category'])
+            values['created_at'] = values['updated_at'] = now
+            inserts.append((line, values))
+            continue
+
+        # الأعمدة غير الموجودة في الصف أو التي لم تتغير تبقى كما هي
+        changed = {column: row[column] for column in PRODUCT_COLUMNS
+                   if column in row and column != 'quantity' and row[column] != getattr(current, column)}
+        if 'category' in row and categories.get(row['category']) != current.category_id:
+            changed['category_id'] = categories.get(row['category'])
+        if changed:
+            changed['updated_at'] = now
+            updates.setdefault(tuple(changed), []).append({'product_id': current.id, **changed})
+            written.add(current.id)
+        if 'quantity' in row and row['quantity'] != current.quantity:
+            deltas[current.id] = row['quantity'] - current.quantity
+            delta_lines[current.id] = (line, sku)
+        elif not changed:
+            unchanged += 1
+            continue
+        stale_barcodes += [current.barcode, changed.get('barcode', current.barcode)]
+
+    if inserts:
+        created = db.session.execute(
+            insert(Product.__table__).returning(Product.__table__.c.id, Product.__table__.c.quantity),
+            [values for _, values in inserts])
+        for product_id, quantity in created:
+            if not quantity:
+                continue
+            movements.append({
+                'movement_type': 'in',
+                'quantity': quantity,
+                'previous_quantity': 0,
+                'new_quantity': quantity,
+                'reason': 'initial_stock',
+                'product_id': product_id,
+                'employee_id': employee_id,
+                'created_at': now,
+            })
+    table = Product.__table__
+    for columns, rows in updates.items():
+        db.session.connection().execute(
+            update(table).where(table.c.id == bindparam('product_id'))
+            .values({column: bindparam(column) for column in columns}),
+            rows)
+    if deltas:
+        # مثل خصم المخزون عند البيع: الفرق يُضاف إلى الكمية الحالية لا إلى ما قرأناه
+        delta = case(deltas, value=table.c.id)
+        applied = dict(db.session.execute(
+            update(table)
+            .where(table.c.id.in_(deltas), table.c.quantity + delta >= 0)
+            .values(quantity=table.c.quantity + delta, updated_at=now)
+            .returning(table.c.id, table.c.quantity)
+        ).all())
+        for product_id, change in deltas.items():
+            if product_id not in applied:
+                line, sku = delta_lines[product_id]
+                report.error(line, sku, 'لم تُحدَّث الكمية: بيع من المنتج أثناء الاستيراد أكثر من المتاح')
+                continue
+            written.add(product_id)
+            movements.append({
+                'movement_type': 'in' if change > 0 else 'adjustment',
+                'quantity': abs(change),
+                'previous_quantity': applied[product_id] - change,
+                'new_quantity': applied[product_id],
+                'reason': 'import',
+                'product_id': product_id,
+                'employee_id': employee_id,
+                'created_at': now,
+            })
+    if movements:
+        db.session.execute(insert(InventoryMovement.__table__), movements)
+
+    return stale_barcodes, len(inserts), len(written), unchanged
+
+
+def import_products(rows, employee_id, batch_size=IMPORT_BATCH_SIZE):
+    """Validate and upsert (row number, raw row) pairs, committing every batch.
+
+    A row updates the product with the same SKU, or failing that the one
+    with the same barcode (taking the row's SKU); otherwise it is created.
+    Stock changes are written to the movement ledger as 'initial_stock'
+    or 'import'.
+
+    A batch that fails as a whole, e.g. because another import inserted
+    the same SKU at the same moment, is rolled back and its rows are
+    reported; earlier batches stay committed. Returns an ImportReport.
+    """
+    report = ImportReport()
+    categories = {}
+    batch = []
+
+    def flush():
+        failed, errors = report.failed, len(report.errors)
+        try:
+            stale_barcodes, created, updated, unchanged = _write_batch(batch, employee_id, categories, report)
+            invalidate_barcodes(db.session, *stale_barcodes)
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            categories.clear()
+            # كل صفوف الدفعة تُعد فاشلة مرة واحدة، بما فيها ما رُفض قبل الحفظ
+            report.failed = failed
+            del report.errors[errors:]
+            for line, row in batch:
+                report.error(line, row['sku'], f'تعذر حفظ الدفعة: {e.orig}')
+        else:
+            report.created += created
+            report.updated += updated
+            report.unchanged += unchanged
+        batch.clear()
+
+    for line, raw in rows:
+        try:
+            batch.append((line, clean_row(raw)))
+        except RowError as e:
+            report.error(line, _text(raw.get('sku')), str(e))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return report
+
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json', 'jsonl']), help='الافتراضي حسب امتداد الملف')
+@click.option('--employee', 'username', default='admin', help='الموظف المسجل في حركات المخزون')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, help='عدد الصفوف في كل دفعة')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), help='حفظ تقرير الأخطاء في ملف CSV')
+def import_products_command(path, fmt, username, batch_size, errors_path):
+    """Bulk create or update products from a supplier CSV or JSON catalog."""
+    employee = Employee.query.filter_by(username=username).first()
+    if employee is None:
+        raise click.ClickException(f'الموظف {username} غير موجود')
+
+    started = time.perf_counter()
+    with open(path, 'rb') as stream:
+        try:
+            report = import_products(read_rows(stream, fmt or detect_format(path)),
+                                     employee.id, batch_size=batch_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+
+    click.echo(f'{report.created} created, {report.updated} updated, {report.unchanged} unchanged, '
+               f'{report.failed} failed in {elapsed:.1f}s')
+    if errors_path and report.errors:
+        with open(errors_path, 'w', encoding='utf-8-sig', newline='') as handle:
+            writer = csv.DictWriter(handle, fieldnames=['row', 'sku', 'error'])
+            writer.writeheader()
+            writer.writerows(report.errors)
+        click.echo(f'errors written to {errors_path}')
+    else:
+        for error in report.errors[:20]:
+            click.echo(f'  row {error["row"]} ({error["sku"]}): {error["error"]}')
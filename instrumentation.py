@@ -0,0 +1,234 @@
+import hmac
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import g, request, has_request_context, abort
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app, db
+
+# حدود المدرجات بالثواني؛ آخر خانة (+Inf) تُضاف عند العرض
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-on-render histogram; observing is one bisect and two adds"""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class EndpointStats:
+    __slots__ = ('latency', 'statuses', 'sql_statements', 'sql_seconds', 'sql_rows', 'stages')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = {}
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.sql_rows = 0
+        self.stages = {}
+
+
+class Metrics:
+    """Per-endpoint request aggregates, kept in process memory.
+
+    Recording is a handful of additions under one lock, and all the
+    formatting happens in `render()`, so an instance nobody scrapes costs
+    almost nothing. Each gunicorn worker keeps its own numbers; Prometheus
+    sums them per instance label.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, status, seconds, sql_statements, sql_seconds, sql_rows, stages):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.latency.observe(seconds)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.sql_statements += sql_statements
+            stats.sql_seconds += sql_seconds
+            stats.sql_rows += sql_rows
+            for stage, elapsed in stages.items():
+                histogram = stats.stages.get(stage)
+                if histogram is None:
+                    histogram = stats.stages[stage] = Histogram()
+                histogram.observe(elapsed)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def render(self):
+        """Prometheus text exposition format 0.0.4"""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+
+            lines += ['# HELP pos_request_duration_seconds Request latency per endpoint.',
+                      '# TYPE pos_request_duration_seconds histogram']
+            for endpoint, stats in endpoints:
+                lines += _histogram_lines('pos_request_duration_seconds',
+                                          f'endpoint="{endpoint}"', stats.latency)
+
+            lines += ['# HELP pos_requests_total Requests per endpoint and status code.',
+                      '# TYPE pos_requests_total counter']
+            for endpoint, stats in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'pos_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+            for name, attribute, help_text in (
+                ('pos_sql_statements_total', 'sql_statements', 'SQL statements executed.'),
+                ('pos_sql_seconds_total', 'sql_seconds', 'Time spent waiting on SQL.'),
+                ('pos_sql_rows_total', 'sql_rows', 'Rows loaded into ORM objects.'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for endpoint, stats in endpoints:
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {getattr(stats, attribute)}')
+
+            lines += ['# HELP pos_stage_duration_seconds Named sub-timers inside hot endpoints.',
+                      '# TYPE pos_stage_duration_seconds histogram']
+            for endpoint, stats in endpoints:
+                for stage, histogram in sorted(stats.stages.items()):
+                    lines += _histogram_lines('pos_stage_duration_seconds',
+                                              f'endpoint="{endpoint}",stage="{stage}"', histogram)
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.total:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+metrics = Metrics()
+
+
+class RequestTrace:
+    __slots__ = ('started', 'status', 'sql_statements', 'sql_seconds', 'sql_rows', 'stages')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.status = 500
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.sql_rows = 0
+        self.stages = {}
+
+
+def _trace():
+    return g.get('_trace') if has_request_context() else None
+
+
+@contextmanager
+def timed(stage):
+    """Add the wrapped block's wall time to a named stage of the current request.
+
+    Outside a request (CLI commands, benchmarks) it only runs the block.
+    """
+    trace = _trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.stages[stage] = trace.stages.get(stage, 0.0) + time.perf_counter() - started
+
+
+# ==========================
+# ربط الطلبات وقاعدة البيانات
+# ==========================
+@app.before_request
+def _start_trace():
+    if app.config.get('METRICS_ENABLED', True):
+        g._trace = RequestTrace()
+
+
+@app.after_request
+def _capture_status(response):
+    trace = _trace()
+    if trace is not None:
+        trace.status = response.status_code
+    return response
+
+
+@app.teardown_request
+def _finish_trace(exc):
+    trace = g.pop('_trace', None)
+    if trace is None or request.endpoint in (None, 'static', 'metrics_endpoint'):
+        return
+    metrics.record(request.endpoint, trace.status, time.perf_counter() - trace.started,
+                   trace.sql_statements, trace.sql_seconds, trace.sql_rows, trace.stages)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _trace() is not None:
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _trace()
+    started = conn.info.get('_query_started')
+    if trace is None or not started:
+        return
+    trace.sql_statements += 1
+    trace.sql_seconds += time.perf_counter() - started.pop()
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_failed_statement(context):
+    started = context.connection.info.get('_query_started') if context.connection else None
+    if started:
+        started.pop()
+
+
+@event.listens_for(db.Model, 'load', propagate=True)
+def _count_loaded_row(target, context):
+    # عدد الصفوف التي تحولت إلى كائنات؛ هذا ما يكلف فعلاً في تكرار الاستعلامات
+    trace = _trace()
+    if trace is not None:
+        trace.sql_rows += 1
+
+
+# ==========================
+# نقطة /metrics
+# ==========================
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target.
+
+    Accepts `Authorization: Bearer <METRICS_TOKEN>` for the scraper, or
+    a logged-in user allowed to view reports.
+    """
+    token = app.config.get('METRICS_TOKEN')
+    header = request.headers.get('Authorization', '')
+    authorized = bool(token) and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+    if not authorized and not (current_user.is_authenticated
+                               and current_user.has_permission('view_reports')):
+        abort(403)
+    return app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,312 @@
+import json
+import zlib
+from datetime import date, datetime
+from types import SimpleNamespace
+import click
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import select, insert, delete, func, text
+from app import app, db
+from models import Employee, Product, InventoryMovement, MovementArchive, MovementArchiveChunk, STOCK_MOVEMENT_TYPES
+
+# سجل الحركات مقسم حسب الشهر: الأشهر الساخنة في جدول inventory_movement
+# (أقسام أصلية على Postgres)، والأشهر المغلقة الأقدم تنتقل كوحدة واحدة إلى
+# أرشيف مضغوط مع صف ملخص لكل شهر
+ARCHIVE_CHUNK_ROWS = 50_000
+ARCHIVE_FIELDS = ['id', 'created_at', 'movement_type', 'quantity', 'previous_quantity', 'new_quantity',
+                  'reference_id', 'reason', 'notes', 'product_id', 'product_name',
+                  'employee_id', 'employee_name']
+PARTITIONS_AHEAD = 2
+
+
+# ==========================
+# الأشهر
+# ==========================
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(period, months):
+    year, month = divmod(period.year * 12 + period.month - 1 + months, 12)
+    return date(year, month + 1, 1)
+
+
+def month_bounds(period):
+    """[start, end) of the month as datetimes, for comparing with created_at"""
+    return datetime.combine(period, datetime.min.time()), datetime.combine(add_months(period, 1), datetime.min.time())
+
+
+def parse_period(text_value):
+    """date for 'YYYY-MM'; raises ValueError otherwise"""
+    return datetime.strptime(text_value, '%Y-%m').date()
+
+
+def hot_since(keep_months=None):
+    """Start of the oldest month still kept in the live ledger"""
+    keep_months = keep_months or app.config['LEDGER_HOT_MONTHS']
+    return month_bounds(add_months(month_start(datetime.utcnow()), 1 - keep_months))[0]
+
+
+# ==========================
+# الأقسام الأصلية على Postgres
+# ==========================
+def _partition_name(period):
+    return f'inventory_movement_p{period:%Y%m}'
+
+
+def _is_partitioned(connection):
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'inventory_movement'::regclass"
+    ).first() is not None
+
+
+def _create_partition(connection, period):
+    start, end = month_bounds(period)
+    connection.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {_partition_name(period)} PARTITION OF inventory_movement "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+
+
+def partition_movements(connection):
+    """Turn a plain inventory_movement table into one range-partitioned by month.
+
+    Existing rows are copied into monthly partitions; a default partition
+    catches rows outside every month created so far. The id sequence is
+    kept, so ids continue where they were.
+    """
+    if _is_partitioned(connection):
+        return
+    connection.exec_driver_sql("ALTER TABLE inventory_movement RENAME TO inventory_movement_flat")
+    connection.exec_driver_sql(
+        "ALTER TABLE inventory_movement_flat RENAME CONSTRAINT inventory_movement_pkey TO inventory_movement_flat_pkey")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_inventory_movement_created_at_type")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_inventory_movement_product_id")
+    connection.exec_driver_sql("""
+        CREATE TABLE inventory_movement (
+            id INTEGER NOT NULL DEFAULT nextval('inventory_movement_id_seq'::regclass),
+            movement_type VARCHAR(20) NOT NULL,
+            quantity INTEGER NOT NULL,
+            previous_quantity INTEGER NOT NULL,
+            new_quantity INTEGER NOT NULL,
+            reference_id INTEGER,
+            reason VARCHAR(100),
+            notes TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            product_id INTEGER NOT NULL REFERENCES product (id),
+            employee_id INTEGER NOT NULL REFERENCES employee (id),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)""")
+    connection.exec_driver_sql("ALTER SEQUENCE inventory_movement_id_seq OWNED BY inventory_movement.id")
+    connection.exec_driver_sql("CREATE TABLE inventory_movement_default PARTITION OF inventory_movement DEFAULT")
+
+    oldest = connection.exec_driver_sql("SELECT min(created_at) FROM inventory_movement_flat").scalar()
+    period = month_start(oldest or datetime.utcnow())
+    last = add_months(month_start(datetime.utcnow()), PARTITIONS_AHEAD)
+    while period <= last:
+        _create_partition(connection, period)
+        period = add_months(period, 1)
+
+    columns = ('id, movement_type, quantity, previous_quantity, new_quantity, reference_id, '
+               'reason, notes, product_id, employee_id')
+    connection.exec_driver_sql(
+        f"INSERT INTO inventory_movement ({columns}, created_at) "
+        f"SELECT {columns}, coalesce(created_at, now() AT TIME ZONE 'utc') FROM inventory_movement_flat")
+    connection.exec_driver_sql("DROP TABLE inventory_movement_flat")
+    connection.exec_driver_sql(
+        "CREATE INDEX ix_inventory_movement_created_at_type ON inventory_movement (created_at, movement_type)")
+    connection.exec_driver_sql(
+        "CREATE INDEX ix_inventory_movement_product_id ON inventory_movement (product_id)")
+
+
+def ensure_partitions(months_ahead=PARTITIONS_AHEAD):
+    """Create the partitions of the coming months (Postgres; nothing to do on SQLite).
+
+    Run at least monthly; `archive-movements` does it on every run. Rows
+    for a month without a partition land in the default partition.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with db.engine.begin() as connection:
+        partition_movements(connection)
+        period = month_start(datetime.utcnow())
+        for offset in range(months_ahead + 1):
+            _create_partition(connection, add_months(period, offset))
+
+
+def _drop_month(period):
+    """Remove one month of movements from the live ledger"""
+    start, end = month_bounds(period)
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        db.session.execute(text('DELETE FROM inventory_movement_default WHERE created_at >= :start AND created_at < :end'),
+                           {'start': start, 'end': end})
+        db.session.execute(text(f'DROP TABLE IF EXISTS {_partition_name(period)}'))
+    elif dialect == 'sqlite':
+        table = InventoryMovement.__table__
+        db.session.execute(delete(table).where(table.c.created_at >= start, table.c.created_at < end))
+    else:
+        raise NotImplementedError(f'لا يوجد دعم لأرشفة سجل الحركات على {dialect}')
+
+
+# ==========================
+# الأرشفة
+# ==========================
+def _month_rows(period, after_id, limit):
+    start, end = month_bounds(period)
+    return db.session.execute(
+        select(InventoryMovement.id, InventoryMovement.created_at, InventoryMovement.movement_type,
+               InventoryMovement.quantity, InventoryMovement.previous_quantity, InventoryMovement.new_quantity,
+               InventoryMovement.reference_id, InventoryMovement.reason, InventoryMovement.notes,
+               InventoryMovement.product_id, Product.name_ar, InventoryMovement.employee_id, Employee.full_name)
+        .join(Product, Product.id == InventoryMovement.product_id, isouter=True)
+        .join(Employee, Employee.id == InventoryMovement.employee_id, isouter=True)
+        .where(InventoryMovement.created_at >= start, InventoryMovement.created_at < end,
+               InventoryMovement.id > after_id)
+        .order_by(InventoryMovement.id).limit(limit)
+    ).all()
+
+
+def archive_month(period):
+    """Move one closed month out of the live ledger into the archive.
+
+    Rows are stored ARCHIVE_CHUNK_ROWS at a time as zlib-compressed JSON,
+    with product and employee names copied in so the archive still reads
+    after either is deleted. The month's MovementArchive row keeps the
+    totals. Everything is written and removed in one transaction.
+    Returns the archive row, or None when the month had no movements.
+    """
+    if db.session.get(MovementArchive, period) is not None:
+        raise ValueError(f'الشهر {period:%Y-%m} مؤرشف بالفعل')
+
+    summary = {'row_count': 0, 'first_id': None, 'last_id': 0, 'quantity_in': 0, 'quantity_out': 0}
+    chunks = []
+    while True:
+        rows = _month_rows(period, summary['last_id'], ARCHIVE_CHUNK_ROWS)
+        if not rows:
+            break
+        for row in rows:
+            if row.movement_type not in STOCK_MOVEMENT_TYPES:
+                continue
+            change = row.new_quantity - row.previous_quantity
+            if change > 0:
+                summary['quantity_in'] += change
+            else:
+                summary['quantity_out'] -= change
+        summary['row_count'] += len(rows)
+        summary['first_id'] = summary['first_id'] or rows[0].id
+        summary['last_id'] = rows[-1].id
+        payload = json.dumps([[*row[:1], row.created_at.isoformat(), *row[2:]] for row in rows],
+                             separators=(',', ':'), ensure_ascii=False)
+        chunks.append({'period': period, 'seq': len(chunks), 'row_count': len(rows),
+                       'data': zlib.compress(payload.encode(), 6)})
+    if not chunks:
+        return None
+
+    archive = MovementArchive(period=period, **summary)
+    db.session.add(archive)
+    db.session.flush()
+    db.session.execute(insert(MovementArchiveChunk.__table__), chunks)
+    _drop_month(period)
+    db.session.commit()
+    return archive
+
+
+def archive_cold_months(keep_months=None):
+    """Archive every month older than the hot window; returns the archive rows written"""
+    boundary = hot_since(keep_months)
+    oldest = db.session.scalar(
+        select(func.min(InventoryMovement.created_at)).where(InventoryMovement.created_at < boundary))
+    archived = []
+    period = month_start(oldest) if oldest else boundary.date()
+    while period < boundary.date():
+        if db.session.get(MovementArchive, period) is None:
+            archive = archive_month(period)
+            if archive is not None:
+                archived.append(archive)
+        period = add_months(period, 1)
+    return archived
+
+
+# ==========================
+# القراءة من الأرشيف
+# ==========================
+def is_archived(period):
+    return db.session.get(MovementArchive, period) is not None
+
+
+def archived_periods():
+    return db.session.scalars(select(MovementArchive.period).order_by(MovementArchive.period.desc())).all()
+
+
+def _archived_entry(values):
+    row = dict(zip(ARCHIVE_FIELDS, values))
+    row['created_at'] = datetime.fromisoformat(row['created_at'])
+    return SimpleNamespace(
+        **row,
+        product=SimpleNamespace(name_ar=row['product_name']) if row['product_name'] else None,
+        employee=SimpleNamespace(full_name=row['employee_name']) if row['employee_name'] else None,
+    )
+
+
+def iter_archived(period, newest_first=True):
+    """Rows of an archived month as tuples in ARCHIVE_FIELDS order, decompressed one chunk at a time"""
+    seqs = db.session.scalars(
+        select(MovementArchiveChunk.seq).where(MovementArchiveChunk.period == period)
+        .order_by(MovementArchiveChunk.seq.desc() if newest_first else MovementArchiveChunk.seq)).all()
+    for seq in seqs:
+        data = db.session.scalar(select(MovementArchiveChunk.data).where(
+            MovementArchiveChunk.period == period, MovementArchiveChunk.seq == seq))
+        rows = json.loads(zlib.decompress(data))
+        yield from reversed(rows) if newest_first else rows
+
+
+class ArchivePagination(Pagination):
+    """One page of an archived month for the logs view, filtered like the live query"""
+
+    def _query_items(self):
+        period = self._query_args['period']
+        search = self._query_args['search'].lower()
+        movement_type = self._query_args['movement_type']
+        first, last = self._query_offset, self._query_offset + self.per_page
+        items, self._total = [], 0
+        for values in iter_archived(period):
+            row = dict(zip(ARCHIVE_FIELDS, values))
+            if movement_type and row['movement_type'] != movement_type:
+                continue
+            if search and search not in (row['product_name'] or '').lower() \
+                    and search not in (row['employee_name'] or '').lower():
+                continue
+            if first <= self._total < last:
+                items.append(_archived_entry(values))
+            self._total += 1
+        return items
+
+    def _query_count(self):
+        return self._total
+
+
+# ==========================
+# أمر الأرشفة
+# ==========================
+@app.cli.command('archive-movements')
+@click.option('--keep-months', type=int, default=None, help='عدد الأشهر التي تبقى في السجل الحي')
+@click.option('--yes', is_flag=True, help='تخطي التأكيد')
+def archive_movements(keep_months, yes):
+    """Move closed months of the movement ledger into the compressed archive.
+
+    Months older than the hot window (LEDGER_HOT_MONTHS, the current month
+    included) are archived with one summary row each; on Postgres their
+    partitions are dropped and the coming months' partitions created.
+    Month-start stock checkpoints are filled in first.
+    Meant to run from cron once a month.
+    """
+    boundary = hot_since(keep_months)
+    if not yes:
+        click.confirm(f'سيتم نقل الحركات الأقدم من {boundary:%Y-%m-%d} إلى الأرشيف، متابعة؟', abort=True)
+    ensure_partitions()
+    # لقطات بداية كل شهر قبل الأرشفة، حتى لا يحتاج حساب المخزون في
+    # تاريخ قديم إلى فك الأرشيف
+    from stock_history import backfill_checkpoints
+    backfill_checkpoints()
+    for archive in archive_cold_months(keep_months):
+        click.echo(f'{archive.period:%Y-%m}: {archive.row_count} rows, '
+                   f'in {archive.quantity_in}, out {archive.quantity_out}')
@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+from flask import request
+from flask_login import login_required
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+from app import app, db
+from models import Sale, Employee, Product
+from caches import MISSING, principal_cache, pg_listen
+
+RECENT_SALES = 10  # rows in the dashboard's recent sales list
+LOW_STOCK_ROWS = 20
+HEARTBEAT_SECONDS = 15
+
+
+class Subscription:
+    """One open dashboard stream; `overflowed` means it fell behind and must reload"""
+
+    def __init__(self, broker, size):
+        self.broker = broker
+        self.events = queue.Queue(size)
+        self.overflowed = False
+
+    def get(self, timeout):
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub for dashboard events.
+
+    `publish_in(session, event)` holds the event until the session
+    commits, so a rolled back sale is never announced. Each delivered
+    event gets an id "<epoch>-<n>" in delivery order, and the last
+    `backlog` events are kept for streams that reconnect with a
+    Last-Event-ID. An id from another worker or from before the backlog
+    cannot be resumed and the stream is reset. Only dashboards connected
+    to the publishing worker see an event; PostgresBroker shares them
+    between workers.
+    """
+
+    def __init__(self, backlog=100, queue_size=256):
+        self.queue_size = queue_size
+        self._recent = deque(maxlen=backlog)
+        self._forget()
+        os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent.clear()
+        self._epoch = os.urandom(4).hex()
+        self._sequence = 0
+
+    def publish_in(self, session, event):
+        # نحفظ المعاملة الداخلية لنسقط الحدث إذا تراجعت نقطة الحفظ التي كُتب فيها
+        transaction = session.get_nested_transaction() or session.get_transaction()
+        session.info.setdefault('live_events', []).append((transaction, event))
+
+    def send(self, event):
+        """Called once the publishing transaction has committed"""
+        self.deliver(event)
+
+    def deliver(self, event):
+        with self._lock:
+            self._sequence += 1
+            delivered = (self._sequence, f'{self._epoch}-{self._sequence}', event)
+            self._recent.append(delivered)
+            # داخل القفل، فكل اشتراك يرى الأحداث بنفس ترتيب _recent
+            for subscription in self._subscribers:
+                try:
+                    subscription.events.put_nowait(delivered[1:])
+                except queue.Full:
+                    subscription.overflowed = True
+
+    def _missed(self, last_id):
+        epoch, _, sequence = last_id.partition('-')
+        if epoch != self._epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if self._recent and self._recent[0][0] > sequence + 1:
+            return None  # فاته أكثر مما نحتفظ به
+        return [delivered[1:] for delivered in self._recent if delivered[0] > sequence]
+
+    def subscribe(self, last_id=None):
+        subscription = Subscription(self, self.queue_size)
+        with self._lock:
+            if last_id:
+                missed = self._missed(last_id)
+                if missed is None or len(missed) > self.queue_size:
+                    subscription.overflowed = True
+                else:
+                    for delivered in missed:
+                        subscription.events.put_nowait(delivered)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+class PostgresBroker(LocalBroker):
+    """Shares dashboard events between workers with LISTEN/NOTIFY.
+
+    The NOTIFY goes out after the sale commits, on its own connection,
+    so it can never fail or roll back the sale. It carries only the day
+    totals and the ids to show; each listening worker reads those rows
+    once for all of its streams. A worker starts its listener with its
+    first stream; workers without open dashboards do not listen.
+    """
+
+    CHANNEL = 'dashboard_events'
+    PAYLOAD_LIMIT = 7900  # PostgreSQL refuses payloads of 8000 bytes or more
+
+    def __init__(self, *args, **kwargs):
+        self._thread = None
+        super().__init__(*args, **kwargs)
+
+    def _forget(self):
+        super()._forget()
+        self._thread = None
+
+    def send(self, event):
+        notice = json.dumps({
+            'days': event['days'],
+            'recent': [sale['id'] for sale in event['recent']],
+            'low_stock': [[product['id'], product['entered']] for product in event['low_stock']],
+            'low_stock_entered': event['low_stock_entered'],
+        }, separators=(',', ':'))
+        if len(notice) > self.PAYLOAD_LIMIT:
+            # دفعة تمتد على أيام كثيرة؛ اللوحات تعيد التحميل بدلاً من ذلك
+            notice = '{"reset":true}'
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(select(func.pg_notify(self.CHANNEL, notice)))
+                connection.commit()
+        except Exception:
+            app.logger.exception('could not announce sales to dashboards')
+
+    def subscribe(self, last_id=None):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='dashboard-events', daemon=True)
+                self._thread.start()
+        return super().subscribe(last_id)
+
+    def _receive(self, payloads):
+        for payload in payloads:
+            notice = json.loads(payload)
+            if notice.get('reset'):
+                with self._lock:
+                    for subscription in self._subscribers:
+                        subscription.overflowed = True
+            else:
+                self.deliver(_expand(notice))
+
+    def _run(self):
+        with app.app_context():
+            while True:
+                try:
+                    pg_listen(self.CHANNEL, self._receive)
+                except Exception:
+                    app.logger.exception('dashboard event listener failed, retrying')
+                    time.sleep(5)
+
+
+BROKERS = {'local': LocalBroker, 'postgres': PostgresBroker}
+
+
+def _broker_name():
+    if app.config.get('LIVE_BROKER'):
+        return app.config['LIVE_BROKER']
+    return 'postgres' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'local'
+
+
+broker = BROKERS[_broker_name()]()
+
+
+def _within(transaction, ancestor):
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+@event.listens_for(Session, 'after_commit')
+def _send_events(session):
+    for _, live_event in session.info.pop('live_events', ()):
+        broker.send(live_event)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_events(session, previous_transaction):
+    pending = session.info.get('live_events')
+    if pending:
+        pending[:] = [(transaction, live_event) for transaction, live_event in pending
+                      if not _within(transaction, previous_transaction)]
+
+
+# ==========================
+# أحداث المبيعات
+# ==========================
+def _employee_name(employee_id):
+    # البائع هو المستخدم الحالي، فهو في كاش المستخدمين دائماً تقريباً
+    principal = principal_cache.peek(employee_id)
+    return None if principal is MISSING or principal is None else principal.full_name
+
+
+def publish_sales(session, sales, low_stock=()):
+    """Announce committed sales to open dashboards, without touching the database.
+
+    `sales` are mappings with the sale columns and its id; `low_stock`
+    are the (product row, entered) pairs of products sold down to their
+    minimum, `entered` being true when this sale crossed it.
+    """
+    days = {}
+    for sale in sales:
+        day = days.setdefault(sale['created_at'].date().isoformat(), {'revenue': 0.0, 'transactions': 0})
+        day['revenue'] = round(day['revenue'] + float(sale['total_amount']), 2)
+        day['transactions'] += 1
+    recent = sorted(sales, key=lambda sale: (sale['created_at'], sale['id']))[-RECENT_SALES:]
+    broker.publish_in(session, {
+        'days': days,
+        'recent': [{
+            'id': sale['id'],
+            'invoice_number': sale['invoice_number'],
+            'total_amount': float(sale['total_amount']),
+            'customer_name': sale['customer_name'],
+            'employee_name': _employee_name(sale['employee_id']),
+            'created_at': sale['created_at'].isoformat(),
+        } for sale in reversed(recent)],
+        'low_stock': [{
+            'id': product.id,
+            'name_ar': product.name_ar,
+            'sku': product.sku,
+            'quantity': product.quantity,
+            'entered': entered,
+        } for product, entered in low_stock[:LOW_STOCK_ROWS]],
+        'low_stock_entered': sum(1 for _, entered in low_stock if entered),
+    })
+
+
+def _expand(notice):
+    """Rebuild an event from a PostgresBroker notice with two reads, once per worker"""
+    with db.engine.connect() as connection:
+        sales = {row.id: row for row in connection.execute(
+            select(Sale.id, Sale.invoice_number, Sale.total_amount, Sale.customer_name,
+                   Sale.created_at, Employee.full_name)
+            .outerjoin(Employee, Employee.id == Sale.employee_id)
+            .where(Sale.id.in_(notice['recent'])))}
+        products = {row.id: row for row in connection.execute(
+            select(Product.id, Product.name_ar, Product.sku, Product.quantity)
+            .where(Product.id.in_([product_id for product_id, _ in notice['low_stock']])))}
+    return {
+        'days': notice['days'],
+        'recent': [{
+            'id': sale.id,
+            'invoice_number': sale.invoice_number,
+            'total_amount': float(sale.total_amount),
+            'customer_name': sale.customer_name,
+            'employee_name': sale.full_name,
+            'created_at': sale.created_at.isoformat(),
+        } for sale in map(sales.get, notice['recent']) if sale is not None],
+        'low_stock': [{
+            'id': product.id,
+            'name_ar': product.name_ar,
+            'sku': product.sku,
+            'quantity': product.quantity,
+            'entered': entered,
+        } for product, entered in ((products.get(product_id), entered)
+                                   for product_id, entered in notice['low_stock'])
+            if product is not None],
+        'low_stock_entered': notice['low_stock_entered'],
+    }
+
+
+# ==========================
+# نقطة /dashboard/stream
+# ==========================
+def _stream(subscription, seconds):
+    try:
+        yield 'retry: 3000\n\n'
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            delivered = subscription.get(HEARTBEAT_SECONDS)
+            if subscription.overflowed:
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            if delivered is None:
+                yield ': keep-alive\n\n'
+            else:
+                event_id, live_event = delivered
+                data = json.dumps(live_event, ensure_ascii=False, separators=(',', ':'))
+                yield f'id: {event_id}\nevent: sales\ndata: {data}\n\n'
+    finally:
+        subscription.close()
+
+
+@app.route('/dashboard/stream')
+@login_required
+def dashboard_stream():
+    """Server-Sent Events with every committed sale for the open dashboard.
+
+    The stream reads nothing from the database. It ends after
+    LIVE_STREAM_SECONDS so a worker thread is not held forever; the
+    browser reconnects and resumes from its Last-Event-ID, or reloads
+    the page when this worker cannot replay what it missed.
+    """
+    subscription = broker.subscribe(request.headers.get('Last-Event-ID'))
+    return app.response_class(_stream(subscription, app.config['LIVE_STREAM_SECONDS']),
+                              mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,30 @@
+"""Add inventory movement reason
+
+Revision ID: 4a9c2e7d1b58
+Revises: 37688b8cc053
+Create Date: 2026-10-17 08:41:07.305518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a9c2e7d1b58'
+down_revision = '37688b8cc053'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # قواعد أنشأها create_all فيها العمود مسبقاً
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('inventory_movement')}
+    if 'reason' in columns:
+        return
+    with op.batch_alter_table('inventory_movement', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reason', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('inventory_movement', schema=None) as batch_op:
+        batch_op.drop_column('reason')
@@ -0,0 +1,30 @@
+"""Add inventory movement reference_id
+
+Revision ID: 4f8a2c6e9b13
+Revises: 4a9c2e7d1b58
+Create Date: 2026-10-18 09:20:41.618024
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8a2c6e9b13'
+down_revision = '4a9c2e7d1b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # العمود في النموذج منذ البداية لكنه لم يدخل أي مراجعة؛ قواعد create_all فيها العمود
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('inventory_movement')}
+    if 'reference_id' in columns:
+        return
+    with op.batch_alter_table('inventory_movement', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reference_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('inventory_movement', schema=None) as batch_op:
+        batch_op.drop_column('reference_id')
@@ -0,0 +1,35 @@
+"""Add sales rollup
+
+Revision ID: 5b2e8c41d7a9
+Revises: 4f8a2c6e9b13
+Create Date: 2026-10-17 09:12:31.448120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e8c41d7a9'
+down_revision = '4f8a2c6e9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sales_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=10), nullable=False),
+    sa.Column('period_start', sa.DateTime(), nullable=False),
+    sa.Column('revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('transactions', sa.Integer(), nullable=False),
+    sa.Column('discount_amount', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('tax_amount', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('granularity', 'period_start', name='uq_sales_rollup_period')
+    )
+    # بعد الترقية شغّل: flask rebuild-rollups
+
+
+def downgrade():
+    op.drop_table('sales_rollup')
@@ -0,0 +1,48 @@
+"""Add hot path indexes
+
+Revision ID: 8d4f1a6c3e20
+Revises: 5b2e8c41d7a9
+Create Date: 2026-10-17 10:04:55.913274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f1a6c3e20'
+down_revision = '5b2e8c41d7a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sale', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sale_created_at'), ['created_at'], unique=False)
+
+    with op.batch_alter_table('sale_item', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sale_item_sale_id'), ['sale_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_sale_item_product_id'), ['product_id'], unique=False)
+
+    with op.batch_alter_table('inventory_movement', schema=None) as batch_op:
+        batch_op.create_index('ix_inventory_movement_created_at_type', ['created_at', 'movement_type'], unique=False)
+        batch_op.create_index(batch_op.f('ix_inventory_movement_product_id'), ['product_id'], unique=False)
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_is_active_name_ar', ['is_active', 'name_ar'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_is_active_name_ar')
+
+    with op.batch_alter_table('inventory_movement', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_inventory_movement_product_id'))
+        batch_op.drop_index('ix_inventory_movement_created_at_type')
+
+    with op.batch_alter_table('sale_item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sale_item_product_id'))
+        batch_op.drop_index(batch_op.f('ix_sale_item_sale_id'))
+
+    with op.batch_alter_table('sale', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sale_created_at'))
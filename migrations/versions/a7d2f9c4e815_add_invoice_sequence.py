@@ -0,0 +1,28 @@
+"""Add invoice sequence
+
+Revision ID: a7d2f9c4e815
+Revises: f2c8a4e6b1d3
+Create Date: 2026-10-17 23:48:10.532917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2f9c4e815'
+down_revision = 'f2c8a4e6b1d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('invoice_sequence',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('next_value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('invoice_sequence')
@@ -0,0 +1,27 @@
+"""Add low stock index
+
+Revision ID: b4e6c8a1d957
+Revises: a7d2f9c4e815
+Create Date: 2026-10-18 00:21:37.640518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e6c8a1d957'
+down_revision = 'a7d2f9c4e815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_product_low_stock', 'product',
+                    ['is_active', sa.text('(quantity - min_quantity)'), 'id'], unique=False,
+                    sqlite_where=sa.text('quantity <= min_quantity'),
+                    postgresql_where=sa.text('quantity <= min_quantity'))
+
+
+def downgrade():
+    op.drop_index('ix_product_low_stock', table_name='product')
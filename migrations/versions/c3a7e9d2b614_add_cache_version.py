@@ -0,0 +1,28 @@
+"""Add cache version
+
+Revision ID: c3a7e9d2b614
+Revises: 8d4f1a6c3e20
+Create Date: 2026-10-17 22:10:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a7e9d2b614'
+down_revision = '8d4f1a6c3e20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
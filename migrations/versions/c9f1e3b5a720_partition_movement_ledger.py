@@ -0,0 +1,111 @@
+"""Partition movement ledger and add archive
+
+Revision ID: c9f1e3b5a720
+Revises: b4e6c8a1d957
+Create Date: 2026-10-18 01:12:48.207391
+
+"""
+from datetime import date, datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9f1e3b5a720'
+down_revision = 'b4e6c8a1d957'
+branch_labels = None
+depends_on = None
+
+PARTITIONS_AHEAD = 2
+
+
+def _add_months(period, months):
+    year, month = divmod(period.year * 12 + period.month - 1 + months, 12)
+    return date(year, month + 1, 1)
+
+
+def _partition_movements(bind):
+    """Range-partition inventory_movement by month, copying existing rows.
+
+    A default partition catches rows outside every month created here; the
+    id sequence is kept. The DDL is frozen here rather than imported from
+    ledger so later changes to the app cannot alter this revision.
+    """
+    partitioned = bind.exec_driver_sql(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'inventory_movement'::regclass").first()
+    if partitioned is not None:
+        return
+    op.execute("ALTER TABLE inventory_movement RENAME TO inventory_movement_flat")
+    op.execute("ALTER TABLE inventory_movement_flat RENAME CONSTRAINT inventory_movement_pkey TO inventory_movement_flat_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_inventory_movement_created_at_type")
+    op.execute("DROP INDEX IF EXISTS ix_inventory_movement_product_id")
+    op.execute("""
+        CREATE TABLE inventory_movement (
+            id INTEGER NOT NULL DEFAULT nextval('inventory_movement_id_seq'::regclass),
+            movement_type VARCHAR(20) NOT NULL,
+            quantity INTEGER NOT NULL,
+            previous_quantity INTEGER NOT NULL,
+            new_quantity INTEGER NOT NULL,
+            reference_id INTEGER,
+            reason VARCHAR(100),
+            notes TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            product_id INTEGER NOT NULL REFERENCES product (id),
+            employee_id INTEGER NOT NULL REFERENCES employee (id),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)""")
+    op.execute("ALTER SEQUENCE inventory_movement_id_seq OWNED BY inventory_movement.id")
+    op.execute("CREATE TABLE inventory_movement_default PARTITION OF inventory_movement DEFAULT")
+
+    # قسم لكل شهر من أقدم حركة حتى شهرين قادمين
+    now = datetime.utcnow()
+    oldest = bind.exec_driver_sql("SELECT min(created_at) FROM inventory_movement_flat").scalar() or now
+    period = date(oldest.year, oldest.month, 1)
+    last = _add_months(date(now.year, now.month, 1), PARTITIONS_AHEAD)
+    while period <= last:
+        end = _add_months(period, 1)
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS inventory_movement_p{period:%Y%m} PARTITION OF inventory_movement "
+            f"FOR VALUES FROM ('{period.isoformat()}') TO ('{end.isoformat()}')")
+        period = end
+
+    columns = ('id, movement_type, quantity, previous_quantity, new_quantity, reference_id, '
+               'reason, notes, product_id, employee_id')
+    op.execute(
+        f"INSERT INTO inventory_movement ({columns}, created_at) "
+        f"SELECT {columns}, coalesce(created_at, now() AT TIME ZONE 'utc') FROM inventory_movement_flat")
+    op.execute("DROP TABLE inventory_movement_flat")
+    op.execute("CREATE INDEX ix_inventory_movement_created_at_type ON inventory_movement (created_at, movement_type)")
+    op.execute("CREATE INDEX ix_inventory_movement_product_id ON inventory_movement (product_id)")
+
+
+def upgrade():
+    op.create_table('movement_archive',
+    sa.Column('period', sa.Date(), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('first_id', sa.Integer(), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('quantity_in', sa.BigInteger(), nullable=False),
+    sa.Column('quantity_out', sa.BigInteger(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('period')
+    )
+    op.create_table('movement_archive_chunk',
+    sa.Column('period', sa.Date(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['period'], ['movement_archive.period'], ),
+    sa.PrimaryKeyConstraint('period', 'seq')
+    )
+
+    # على Postgres يصبح السجل جدولاً مقسماً حسب الشهر؛ SQLite بلا أقسام أصلية
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        _partition_movements(bind)
+
+
+def downgrade():
+    # الأقسام تبقى على Postgres: الجدول المقسم يعمل بنفس الأعمدة
+    op.drop_table('movement_archive_chunk')
+    op.drop_table('movement_archive')
@@ -0,0 +1,44 @@
+"""Add stock checkpoints
+
+Revision ID: d2a8f6c4b193
+Revises: c9f1e3b5a720
+Create Date: 2026-10-18 02:03:15.774102
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a8f6c4b193'
+down_revision = 'c9f1e3b5a720'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_checkpoint',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.Column('last_movement_id', sa.Integer(), nullable=False),
+    sa.Column('product_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_checkpoint', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stock_checkpoint_taken_at'), ['taken_at'], unique=False)
+
+    op.create_table('stock_checkpoint_item',
+    sa.Column('checkpoint_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['checkpoint_id'], ['stock_checkpoint.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('checkpoint_id', 'product_id')
+    )
+
+
+def downgrade():
+    op.drop_table('stock_checkpoint_item')
+    with op.batch_alter_table('stock_checkpoint', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stock_checkpoint_taken_at'))
+
+    op.drop_table('stock_checkpoint')
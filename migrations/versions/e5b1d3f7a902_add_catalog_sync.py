@@ -0,0 +1,39 @@
+"""Add catalog sync
+
+Revision ID: e5b1d3f7a902
+Revises: c3a7e9d2b614
+Create Date: 2026-10-17 22:41:08.517230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1d3f7a902'
+down_revision = 'c3a7e9d2b614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_tombstone',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    with op.batch_alter_table('product_tombstone', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_product_tombstone_deleted_at'), ['deleted_at'], unique=False)
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_updated_at_id', ['updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_updated_at_id')
+
+    with op.batch_alter_table('product_tombstone', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_product_tombstone_deleted_at'))
+
+    op.drop_table('product_tombstone')
@@ -0,0 +1,28 @@
+"""Add sale client key
+
+Revision ID: f2c8a4e6b1d3
+Revises: e5b1d3f7a902
+Create Date: 2026-10-17 23:05:42.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8a4e6b1d3'
+down_revision = 'e5b1d3f7a902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sale', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('client_key', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_sale_client_key', ['client_key'])
+
+
+def downgrade():
+    with op.batch_alter_table('sale', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_sale_client_key', type_='unique')
+        batch_op.drop_column('client_key')
@@ -2,6 +2,19 @@ from app import db
 from flask_login import UserMixin
 from datetime import datetime
 
+# صلاحيات كل دور، تُبنى مرة واحدة عند الاستيراد
+ROLE_PERMISSIONS = {
+    'admin': frozenset(['manage_employees', 'manage_inventory', 'view_reports', 'make_sales', 'manage_products']),
+    'manager': frozenset(['manage_inventory', 'view_reports', 'edit_products', 'make_sales', 'manage_products']),
+    'cashier': frozenset(['make_sales']),
+}
+NO_PERMISSIONS = frozenset()
+
+# أنواع الحركات التي تغيّر الكمية فعلاً؛ حركات 'update' تسجل تعديل السعر
+# أو الحالة أو التصنيف في أعمدة الكمية نفسها
+STOCK_MOVEMENT_TYPES = ('in', 'out', 'adjustment', 'deleted')
+
+
 # ==========================
 # نموذج الموظف
 # ==========================
@@ -20,12 +33,33 @@ class Employee(UserMixin, db.Model):
     inventory_movements = db.relationship('InventoryMovement', backref='employee', lazy=True)
 
     def has_permission(self, permission):
-        permissions = {
-            'admin': ['manage_employees', 'manage_inventory', 'view_reports', 'make_sales', 'manage_products'],
-            'manager': ['manage_inventory', 'view_reports', 'edit_products', 'make_sales', 'manage_products'],
-            'cashier': ['make_sales']
-        }
-        return permission in permissions.get(self.role, [])
+        return permission in ROLE_PERMISSIONS.get(self.role, NO_PERMISSIONS)
+
+
+class Principal:
+    """Detached, read-only view of an Employee for Flask-Login.
+
+    Carries only what requests need (id, role, active flag, display name),
+    so it can be cached per process without holding a session object.
+    """
+
+    __slots__ = ('id', 'role', 'is_active', 'full_name', 'permissions')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, employee):
+        self.id = employee.id
+        self.role = employee.role
+        self.is_active = bool(employee.is_active)
+        self.full_name = employee.full_name
+        self.permissions = ROLE_PERMISSIONS.get(employee.role, NO_PERMISSIONS)
+
+    def get_id(self):
+        return str(self.id)
+
+    def has_permission(self, permission):
+        return permission in self.permissions
 
 
 # ==========================
@@ -68,10 +102,34 @@ class Product(db.Model):
     sale_items = db.relationship('SaleItem', backref='product', lazy=True)
     inventory_movements = db.relationship('InventoryMovement', backref='product', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_product_is_active_name_ar', 'is_active', 'name_ar'),
+        db.Index('ix_product_updated_at_id', 'updated_at', 'id'),
+        # فهرس جزئي لا يضم إلا المنتجات منخفضة المخزون، مرتبة حسب العجز؛
+        # قاعدة البيانات تحدّثه مع كل تغيير في الكمية أياً كان مصدره
+        db.Index('ix_product_low_stock', is_active, quantity - min_quantity, id,
+                 sqlite_where=quantity <= min_quantity,
+                 postgresql_where=quantity <= min_quantity),
+    )
+
     @property
     def is_low_stock(self):
         return self.quantity <= self.min_quantity
 
+    @classmethod
+    def low_stock(cls):
+        """Active low-stock products, largest shortfall first; answered from ix_product_low_stock"""
+        return cls.query.filter(cls.is_active == True, cls.quantity <= cls.min_quantity) \
+            .order_by(cls.quantity - cls.min_quantity, cls.id)
+
+
+# ==========================
+# المنتجات المحذوفة (لمزامنة كتالوج نقاط البيع)
+# ==========================
+class ProductTombstone(db.Model):
+    product_id = db.Column(db.Integer, primary_key=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
 
 # ==========================
 # نموذج البيع
@@ -86,7 +144,9 @@ class Sale(db.Model):
     customer_name = db.Column(db.String(100))
     customer_phone = db.Column(db.String(20))
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # مفتاح تولده الطرفية لكل عملية بيع حتى لا تتكرر عند إعادة الإرسال
+    client_key = db.Column(db.String(64), unique=True)
 
     # Foreign Key
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
@@ -110,8 +170,8 @@ class SaleItem(db.Model):
     product_sku = db.Column(db.String(50))
 
     # Foreign Keys
-    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
 
 
 # ==========================
@@ -129,9 +189,90 @@ class InventoryMovement(db.Model):
     
     reference_id = db.Column(db.Integer)  # مثلاً رقم البيع أو فاتورة المشتريات
 
+    reason = db.Column(db.String(100))
+
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Foreign Keys
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_inventory_movement_created_at_type', 'created_at', 'movement_type'),
+    )
+
+
+# ==========================
+# ملخص المبيعات (يومي / ساعي)
+# ==========================
+class SalesRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+
+    # day أو hour
+    granularity = db.Column(db.String(10), nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    transactions = db.Column(db.Integer, nullable=False, default=0)
+    discount_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    tax_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'period_start', name='uq_sales_rollup_period'),
+    )
+
+
+# ==========================
+# أرشيف سجل الحركات: صف ملخص لكل شهر مؤرشف وأجزاء مضغوطة من صفوفه
+# ==========================
+class MovementArchive(db.Model):
+    period = db.Column(db.Date, primary_key=True)  # أول يوم في الشهر
+    row_count = db.Column(db.Integer, nullable=False)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    quantity_in = db.Column(db.BigInteger, nullable=False)
+    quantity_out = db.Column(db.BigInteger, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class MovementArchiveChunk(db.Model):
+    period = db.Column(db.Date, db.ForeignKey('movement_archive.period'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    row_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)  # JSON مضغوط بـ zlib
+
+
+# ==========================
+# لقطات المخزون: كمية كل منتج لحظة أخذ اللقطة
+# ==========================
+class StockCheckpoint(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # آخر حركة داخلة في اللقطة؛ ما بعدها يُعاد تطبيقه
+    last_movement_id = db.Column(db.Integer, nullable=False, default=0)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StockCheckpointItem(db.Model):
+    checkpoint_id = db.Column(db.Integer, db.ForeignKey('stock_checkpoint.id', ondelete='CASCADE'),
+                              primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+
+
+# ==========================
+# أرقام إصدارات الكاشات المشتركة بين العمال
+# ==========================
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ==========================
+# عدادات الأرقام المتسلسلة (أرقام الفواتير)
+# ==========================
+class InvoiceSequence(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    # أول رقم لم يُحجز بعد لأي عامل
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)
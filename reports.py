@@ -0,0 +1,136 @@
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import select, and_, or_
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from models import Sale, SaleItem, Employee
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = [
+    'رقم الفاتورة', 'التاريخ', 'الكاشير', 'العميل', 'الهاتف', 'طريقة الدفع',
+    'إجمالي الفاتورة', 'خصم الفاتورة', 'المنتج', 'SKU', 'الكمية', 'سعر الوحدة', 'إجمالي البند',
+]
+
+
+def sale_details():
+    """Loader options for everything an invoice or sale detail view shows.
+
+    The cashier comes in the same query and the items with their
+    products in one extra query per page, instead of one per sale.
+    """
+    return (
+        joinedload(Sale.employee),
+        selectinload(Sale.items).joinedload(SaleItem.product),
+    )
+
+
+def encode_cursor(sale):
+    return f'{sale.created_at.isoformat()}_{sale.id}'
+
+
+def decode_cursor(cursor):
+    """Parse a `<created_at>_<id>` page cursor, returning None when malformed"""
+    try:
+        created_at, sale_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(sale_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def sales_page(start, end, cursor=None, per_page=50):
+    """One page of sales in [start, end), newest first, using keyset pagination.
+
+    Seeks past the (created_at, id) of the last row shown instead of
+    using OFFSET, so page 500 costs the same as page 1.
+    Returns (sales, next_cursor).
+    """
+    query = Sale.query.options(*sale_details()).filter(Sale.created_at >= start, Sale.created_at < end)
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, sale_id = position
+        query = query.filter(or_(
+            Sale.created_at < created_at,
+            and_(Sale.created_at == created_at, Sale.id < sale_id)
+        ))
+    sales = query.order_by(Sale.created_at.desc(), Sale.id.desc()).limit(per_page + 1).all()
+    next_cursor = encode_cursor(sales[per_page - 1]) if len(sales) > per_page else None
+    return sales[:per_page], next_cursor
+
+
+def export_rows(start, end):
+    """Yield one flat row per sale item, streamed from a server-side cursor"""
+    stmt = (
+        select(Sale.invoice_number, Sale.created_at, Employee.full_name, Sale.customer_name,
+               Sale.customer_phone, Sale.payment_method, Sale.total_amount, Sale.discount_amount,
+               SaleItem.product_name, SaleItem.product_sku, SaleItem.quantity,
+               SaleItem.unit_price, SaleItem.total_price)
+        .join(SaleItem, SaleItem.sale_id == Sale.id)
+        .outerjoin(Employee, Employee.id == Sale.employee_id)
+        .where(Sale.created_at >= start, Sale.created_at < end)
+        .order_by(Sale.created_at, Sale.id, SaleItem.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for row in db.session.execute(stmt):
+        yield [
+            row.invoice_number,
+            row.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            row.full_name or '',
+            row.customer_name or '',
+            row.customer_phone or '',
+            row.payment_method or '',
+            row.total_amount,
+            row.discount_amount or 0,
+            row.product_name or '',
+            row.product_sku or '',
+            row.quantity,
+            row.unit_price,
+            row.total_price,
+        ]
+
+
+def stream_csv(rows):
+    """Encode rows as CSV chunks; the BOM lets Excel detect UTF-8 Arabic text"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def stream_xlsx(rows):
+    """Write rows with openpyxl's write-only mode and stream the finished file.
+
+    Rows go straight to a temporary file, so memory stays flat; the
+    download starts once the workbook is complete because XLSX is a zip.
+    Raises ImportError when openpyxl is not installed.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('تقرير المبيعات')
+    sheet.append(EXPORT_COLUMNS)
+
+    def generate():
+        handle, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(handle)
+        try:
+            for row in rows:
+                sheet.append([float(value) if isinstance(value, Decimal) else value for value in row])
+            workbook.save(path)
+            with open(path, 'rb') as exported:
+                while chunk := exported.read(64 * 1024):
+                    yield chunk
+        finally:
+            os.remove(path)
+
+    return generate()
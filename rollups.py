@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+import click
+from sqlalchemy import func, delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from app import app, db
+from models import Sale, SalesRollup
+
+GRANULARITIES = {
+    'day': lambda moment: moment.replace(hour=0, minute=0, second=0, microsecond=0),
+    'hour': lambda moment: moment.replace(minute=0, second=0, microsecond=0),
+}
+
+
+def _upsert(rows):
+    """Add rows onto existing rollup buckets in a single statement"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(SalesRollup)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(SalesRollup)
+    else:
+        raise NotImplementedError(f'لا يوجد دعم لملخص المبيعات على {dialect}')
+
+    stmt = stmt.values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SalesRollup.granularity, SalesRollup.period_start],
+        set_={
+            'revenue': SalesRollup.revenue + stmt.excluded.revenue,
+            'transactions': SalesRollup.transactions + stmt.excluded.transactions,
+            'discount_amount': SalesRollup.discount_amount + stmt.excluded.discount_amount,
+            'tax_amount': SalesRollup.tax_amount + stmt.excluded.tax_amount,
+        }
+    )
+    db.session.execute(stmt)
+
+
+def record_sale(sale):
+    """Fold a new sale into its day and hour buckets inside the current transaction"""
+    record_sales([{
+        'created_at': sale.created_at,
+        'total_amount': sale.total_amount,
+        'discount_amount': sale.discount_amount,
+        'tax_amount': sale.tax_amount,
+    }])
+
+
+def record_sales(sales):
+    """Fold many new sales (mappings of sale columns) into their buckets with one statement"""
+    buckets = {}
+    for sale in sales:
+        for granularity, truncate in GRANULARITIES.items():
+            key = (granularity, truncate(sale['created_at']))
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {
+                    'granularity': granularity,
+                    'period_start': key[1],
+                    'revenue': Decimal('0.00'),
+                    'transactions': 0,
+                    'discount_amount': Decimal('0.00'),
+                    'tax_amount': Decimal('0.00'),
+                }
+            bucket['revenue'] += sale['total_amount']
+            bucket['transactions'] += 1
+            bucket['discount_amount'] += sale['discount_amount'] or 0
+            bucket['tax_amount'] += sale['tax_amount'] or 0
+    if buckets:
+        _upsert(list(buckets.values()))
+
+
+def totals(start, end):
+    """Revenue, transaction count, discount and tax for sales in [start, end).
+
+    Reads the day buckets, so the cost grows with the number of days in
+    the range rather than the number of sales. `start` and `end` are
+    expected to fall on day boundaries.
+    """
+    row = db.session.query(
+        func.coalesce(func.sum(SalesRollup.revenue), 0),
+        func.coalesce(func.sum(SalesRollup.transactions), 0),
+        func.coalesce(func.sum(SalesRollup.discount_amount), 0),
+        func.coalesce(func.sum(SalesRollup.tax_amount), 0),
+    ).filter(
+        SalesRollup.granularity == 'day',
+        SalesRollup.period_start >= start,
+        SalesRollup.period_start < end
+    ).one()
+    revenue, transactions, discount_amount, tax_amount = row
+    return {
+        'revenue': Decimal(revenue),
+        'transactions': int(transactions),
+        'discount_amount': Decimal(discount_amount),
+        'tax_amount': Decimal(tax_amount),
+    }
+
+
+def hourly(start, end):
+    """Hour buckets in [start, end) ordered by time"""
+    return SalesRollup.query.filter(
+        SalesRollup.granularity == 'hour',
+        SalesRollup.period_start >= start,
+        SalesRollup.period_start < end
+    ).order_by(SalesRollup.period_start).all()
+
+
+def rebuild(batch_size=5000):
+    """Recompute every bucket from the sales history"""
+    buckets = {}
+    query = db.session.query(
+        Sale.created_at, Sale.total_amount, Sale.discount_amount, Sale.tax_amount
+    ).filter(Sale.created_at.isnot(None)).execution_options(yield_per=batch_size)
+
+    for created_at, total_amount, discount_amount, tax_amount in query:
+        for granularity, truncate in GRANULARITIES.items():
+            bucket = buckets.setdefault((granularity, truncate(created_at)),
+                                        [Decimal('0'), 0, Decimal('0'), Decimal('0')])
+            bucket[0] += total_amount or 0
+            bucket[1] += 1
+            bucket[2] += discount_amount or 0
+            bucket[3] += tax_amount or 0
+
+    db.session.execute(delete(SalesRollup))
+    rows = [{
+        'granularity': granularity,
+        'period_start': period_start,
+        'revenue': revenue,
+        'transactions': transactions,
+        'discount_amount': discount_amount,
+        'tax_amount': tax_amount,
+    } for (granularity, period_start), (revenue, transactions, discount_amount, tax_amount)
+        in buckets.items()]
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(insert(SalesRollup), rows[offset:offset + batch_size])
+    return len(rows)
+
+
+def day_range(first_day, last_day):
+    """Half-open datetime bounds covering whole calendar days"""
+    start = datetime.combine(first_day, datetime.min.time())
+    end = datetime.combine(last_day, datetime.min.time()) + timedelta(days=1)
+    return start, end
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Backfill the daily and hourly sales rollups from history."""
+    count = rebuild()
+    db.session.commit()
+    click.echo(f'تم إعادة بناء {count} من ملخصات المبيعات')
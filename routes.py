@@ -1,14 +1,29 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 from app import app, db
 from models import Employee, Product, Category, Sale, SaleItem, InventoryMovement
 from forms import LoginForm, ProductForm, EmployeeForm
-from utils import allowed_file, generate_invoice_number, create_invoice_pdf
+from utils import allowed_file, open_invoice_pdf
+from checkout import (checkout, CheckoutError, InsufficientStock, ingest_sales, find_sale_by_key,
+                      parse_client_key, sale_result, MAX_BATCH_SALES)
+import rollups
+import reports
+import importer
+import ledger
+from search_index import product_index
+from images import save_upload
+from instrumentation import timed
+from caches import (MISSING, barcode_cache, cached_barcode, cache_barcode, invalidate_barcodes, product_payload,
+                    invalidate_employee, category_index, category_by_name, invalidate_categories)
+from http_cache import conditional_view, conditional_body, product_version
 import os
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
 from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, contains_eager
 
 # =========================
 # صفحات تسجيل الدخول والخروج
@@ -54,20 +69,20 @@ def logout():
 @login_required
 def dashboard():
     today = datetime.utcnow().date()
-    today_sales = Sale.query.filter(func.date(Sale.created_at) == today).all()
-    today_revenue = sum(sale.total_amount for sale in today_sales)
-    today_transactions = len(today_sales)
+    today_totals = rollups.totals(*rollups.day_range(today, today))
+    today_revenue = today_totals['revenue']
+    today_transactions = today_totals['transactions']
     
     week_start = today - timedelta(days=today.weekday())
-    week_sales = Sale.query.filter(Sale.created_at >= week_start).all()
-    week_revenue = sum(sale.total_amount for sale in week_sales)
+    week_revenue = rollups.totals(*rollups.day_range(week_start, today))['revenue']
     
-    low_stock_products = Product.query.filter(
-        Product.quantity <= Product.min_quantity,
-        Product.is_active == True
-    ).all()
+    # العدد وأول عشرة فقط، وكلاهما من الفهرس الجزئي للمخزون المنخفض
+    low_stock = Product.low_stock()
+    low_stock_count = low_stock.order_by(None).count()
+    low_stock_products = low_stock.limit(10).all() if low_stock_count else []
     
-    recent_sales = Sale.query.order_by(Sale.created_at.desc()).limit(10).all()
+    recent_sales = Sale.query.options(joinedload(Sale.employee)) \
+        .order_by(Sale.created_at.desc()).limit(10).all()
     
     total_products = Product.query.filter_by(is_active=True).count()
     
@@ -76,8 +91,11 @@ def dashboard():
                          today_transactions=today_transactions,
                          week_revenue=week_revenue,
                          low_stock_products=low_stock_products,
+                         low_stock_count=low_stock_count,
                          recent_sales=recent_sales,
-                         total_products=total_products)
+                         total_products=total_products,
+                         today=today,
+                         week_start=week_start)
 
 # =========================
 # سجل الأنشطة / المخزون
@@ -92,8 +110,29 @@ def logs():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str).strip()
     movement_type = request.args.get('movement_type', '', type=str).strip()
+    month = request.args.get('month', '', type=str).strip()
+    try:
+        period = ledger.parse_period(month) if month else None
+    except ValueError:
+        flash('صيغة الشهر غير صحيحة', 'error')
+        period, month = None, ''
+    
+    # الشهر المؤرشف يُقرأ من الأرشيف المضغوط
+    if period is not None and ledger.is_archived(period):
+        logs_paginated = ledger.ArchivePagination(page=page, per_page=20, period=period,
+                                                  search=search, movement_type=movement_type)
+        return render_template(
+            'logs.html',
+            logs=logs_paginated,
+            search=search,
+            selected_type=movement_type,
+            month=month,
+            hot_since=ledger.hot_since()
+        )
     
-    query = InventoryMovement.query.join(Product, isouter=True).join(Employee, isouter=True)
+    # الصفوف تُملأ من نفس الـ JOIN المستخدم في البحث بدل استعلام لكل حركة
+    query = InventoryMovement.query.join(Product, isouter=True).join(Employee, isouter=True) \
+        .options(contains_eager(InventoryMovement.product), contains_eager(InventoryMovement.employee))
     
     if search:
         query = query.filter(
@@ -107,13 +146,22 @@ def logs():
     if movement_type:
         query = query.filter(InventoryMovement.movement_type == movement_type)
     
+    # بدون شهر محدد لا يُقرأ إلا الأشهر الساخنة
+    if period is not None:
+        start, end = ledger.month_bounds(period)
+        query = query.filter(InventoryMovement.created_at >= start, InventoryMovement.created_at < end)
+    else:
+        query = query.filter(InventoryMovement.created_at >= ledger.hot_since())
+    
     logs_paginated = query.order_by(InventoryMovement.created_at.desc()).paginate(page=page, per_page=20)
     
     return render_template(
         'logs.html',
         logs=logs_paginated,
         search=search,
-        selected_type=movement_type
+        selected_type=movement_type,
+        month=month,
+        hot_since=ledger.hot_since()
     )
 
 # =========================
@@ -126,53 +174,76 @@ def pos():
         flash('ليس لديك صلاحية للوصول لهذه الصفحة', 'error')
         return redirect(url_for('dashboard'))
     
-    categories = Category.query.all()
-    return render_template('pos.html', categories=categories)
+    return render_template('pos.html', categories=category_index().all)
 
 @app.route('/api/search_products')
 @login_required
+@conditional_view(product_version, 'private, max-age=5')
 def search_products():
     query = request.args.get('q', '').strip()
     if len(query) < 2:
         return jsonify([])
     
-    products = Product.query.filter(
-        Product.is_active == True,
-        or_(
-            Product.name_ar.contains(query),
-            Product.name.contains(query),
-            Product.barcode.contains(query),
-            Product.sku.contains(query)
-        )
-    ).limit(20).all()
-    
-    return jsonify([{
-        'id': product.id,
-        'name': product.name_ar,
-        'name_en': product.name,
-        'barcode': product.barcode,
-        'sku': product.sku,
-        'price': float(product.price),
-        'quantity': product.quantity,
-        'image_url': product.image_url
-    } for product in products])
+    with timed('index_refresh'):
+        product_index.refresh()
+    with timed('index_search'):
+        product_ids = product_index.search(query, limit=20)
+    if not product_ids:
+        return jsonify([])
+    
+    # الكميات والحالة تُقرأ من قاعدة البيانات لأنها تتغير مع كل عملية بيع
+    with timed('db_fetch'):
+        found = {product.id: product for product in Product.query.filter(
+            Product.id.in_(product_ids),
+            Product.is_active == True
+        )}
+    products = [found[product_id] for product_id in product_ids if product_id in found]
+    
+    return jsonify([product_payload(product) for product in products])
 
 @app.route('/api/get_product_by_barcode/<barcode>')
 @login_required
 def get_product_by_barcode(barcode):
-    product = Product.query.filter_by(barcode=barcode, is_active=True).first()
-    if product:
-        return jsonify({
+    with timed('cache_lookup'):
+        cached = cached_barcode(barcode)
+    if cached is MISSING:
+        with timed('db_lookup'):
+            product = Product.query.filter_by(barcode=barcode, is_active=True).first()
+            cached = cache_barcode(barcode, product_payload(product) if product else None)
+    
+    if cached:
+        return conditional_body(app.response_class(cached[1], mimetype='application/json'),
+                                'private, max-age=5')
+    return jsonify({'error': 'المنتج غير موجود'}), 404
+
+@app.route('/api/cache_stats')
+@login_required
+def cache_stats():
+    if not current_user.has_permission('view_reports'):
+        return jsonify({'error': 'ليس لديك صلاحية'}), 403
+    return jsonify({'barcode': barcode_cache.stats()})
+
+@app.route('/api/low_stock')
+@login_required
+def low_stock_report():
+    """Active products at or below their minimum quantity, largest shortfall first"""
+    page = request.args.get('page', 1, type=int)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    products = Product.low_stock().paginate(page=page, per_page=per_page, error_out=False)
+    return jsonify({
+        'products': [{
             'id': product.id,
             'name': product.name_ar,
-            'name_en': product.name,
-            'barcode': product.barcode,
             'sku': product.sku,
-            'price': float(product.price),
+            'barcode': product.barcode,
             'quantity': product.quantity,
-            'image_url': product.image_url
-        })
-    return jsonify({'error': 'المنتج غير موجود'}), 404
+            'min_quantity': product.min_quantity,
+            'shortfall': product.min_quantity - product.quantity,
+        } for product in products.items],
+        'total': products.total,
+        'page': products.page,
+        'pages': products.pages,
+    })
 
 @app.route('/api/process_sale', methods=['POST'])
 @login_required
@@ -180,88 +251,65 @@ def process_sale():
     if not current_user.has_permission('make_sales'):
         return jsonify({'error': 'ليس لديك صلاحية لإجراء المبيعات'}), 403
     
-    data = request.json
-    items = data.get('items', [])
-    payment_method = data.get('payment_method', 'cash')
-    customer_name = data.get('customer_name', '')
-    customer_phone = data.get('customer_phone', '')
-    discount_amount = float(data.get('discount_amount', 0))
-    
-    if not items:
-        return jsonify({'error': 'لا يوجد منتجات في السلة'}), 400
-    
+    data = request.json or {}
+
     try:
-        sale = Sale(
-            invoice_number=generate_invoice_number(),
-            total_amount=0,
-            discount_amount=discount_amount,
-            payment_method=payment_method,
-            customer_name=customer_name,
-            customer_phone=customer_phone,
-            employee_id=current_user.id
+        # إعادة إرسال نفس العملية بعد انقطاع الاتصال ترجع البيع الأصلي
+        client_key = parse_client_key(data.get('client_key'))
+        existing = find_sale_by_key(client_key)
+        if existing is not None:
+            return jsonify(dict(sale_result(existing, 'duplicate'), success=True))
+
+        sale = checkout(
+            data.get('items', []),
+            employee_id=current_user.id,
+            payment_method=data.get('payment_method', 'cash'),
+            customer_name=data.get('customer_name', ''),
+            customer_phone=data.get('customer_phone', ''),
+            discount_amount=data.get('discount_amount', 0),
+            client_key=client_key
         )
+        with timed('commit'):
+            db.session.commit()
         
-        total_amount = 0
-        sale_items = []
-        
-        for item_data in items:
-            product = Product.query.get(item_data['product_id'])
-            if not product:
-                return jsonify({'error': f'المنتج غير موجود: {item_data["product_id"]}'}), 400
-            
-            quantity = int(item_data['quantity'])
-            if product.quantity < quantity:
-                return jsonify({'error': f'الكمية المطلوبة غير متوفرة للمنتج: {product.name_ar}'}), 400
-            
-            unit_price = float(item_data['price'])
-            item_total = unit_price * quantity
-            total_amount += item_total
-            
-            # حفظ نسخة من بيانات المنتج
-            sale_item = SaleItem(
-                quantity=quantity,
-                unit_price=unit_price,
-                total_price=item_total,
-                product_id=product.id,
-                product_name=product.name_ar,
-                product_sku=product.sku
-            )
-            sale_items.append(sale_item)
-            
-            product.quantity -= quantity
-            
-            movement = InventoryMovement(
-                movement_type='out',
-                quantity=quantity,
-                previous_quantity=product.quantity + quantity,
-                new_quantity=product.quantity,
-                reason='sale',
-                product_id=product.id,
-                employee_id=current_user.id
-            )
-            db.session.add(movement)
-        
-        sale.total_amount = total_amount - discount_amount
-        db.session.add(sale)
-        db.session.flush()
-        
-        for sale_item in sale_items:
-            sale_item.sale_id = sale.id
-            db.session.add(sale_item)
-        
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'sale_id': sale.id,
-            'invoice_number': sale.invoice_number,
-            'total_amount': float(sale.total_amount)
-        })
+        return jsonify(dict(sale_result(sale, 'created'), success=True))
         
+    except IntegrityError:
+        db.session.rollback()
+        existing = find_sale_by_key(client_key)
+        if existing is None:
+            return jsonify({'error': 'تعذر حفظ عملية البيع، أعد المحاولة'}), 409
+        return jsonify(dict(sale_result(existing, 'duplicate'), success=True))
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'error': e.message, 'lines': e.lines}), e.status
+    except CheckoutError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'حدث خطأ في معالجة البيع: {str(e)}'}), 500
 
+@app.route('/api/sales/batch', methods=['POST'])
+@login_required
+def ingest_sales_batch():
+    """Replay a terminal's queued sales; answers with one result per sale, in order"""
+    if not current_user.has_permission('make_sales'):
+        return jsonify({'error': 'ليس لديك صلاحية لإجراء المبيعات'}), 403
+
+    sales = (request.get_json(silent=True) or {}).get('sales')
+    if not isinstance(sales, list) or not sales:
+        return jsonify({'error': 'لا توجد مبيعات في الطلب'}), 400
+    if len(sales) > MAX_BATCH_SALES:
+        return jsonify({'error': f'الحد الأقصى {MAX_BATCH_SALES} عملية في الطلب الواحد'}), 413
+
+    try:
+        results = ingest_sales(sales, employee_id=current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'حدث خطأ في معالجة المبيعات: {str(e)}'}), 500
+    return jsonify({'results': results})
+
 # =========================
 # إدارة المنتجات والمخزون
 
@@ -286,6 +334,7 @@ def search_product():
 # =========================
 @app.route('/inventory')
 @login_required
+@conditional_view(product_version)
 def inventory():
     if not current_user.has_permission('manage_inventory'):
         flash('ليس لديك صلاحية للوصول لهذه الصفحة', 'error')
@@ -314,34 +363,45 @@ def inventory():
         page=page, per_page=20, error_out=False
     )
     
-    categories = Category.query.all()
+    categories = category_index()
     
     return render_template('inventory.html', 
                          products=products, 
-                         categories=categories,
+                         categories=categories.all,
+                         category_names=categories.names,
                          search=search,
                          selected_category=category_id)
 
 @app.route('/invoice/<int:sale_id>')
 @login_required
 def view_invoice(sale_id):
-    sale = Sale.query.get_or_404(sale_id)
+    sale = Sale.query.options(*reports.sale_details()).get_or_404(sale_id)
     return render_template('invoice.html', sale=sale)
 
 @app.route('/print_invoice/<int:sale_id>')
 @login_required
 def print_invoice(sale_id):
-    sale = Sale.query.get_or_404(sale_id)
-    # إذا أردت طباعة PDF استخدم الدالة create_invoice_pdf
-    pdf_path = create_invoice_pdf(sale)  # دالة توليد PDF موجودة في utils.py
+    sale = Sale.query.options(*reports.sale_details()).get_or_404(sale_id)
+    try:
+        pdf = open_invoice_pdf(
+            sale,
+            workers=app.config['INVOICE_RENDER_WORKERS'],
+            timeout=app.config['INVOICE_RENDER_TIMEOUT'],
+            max_bytes=app.config['INVOICE_STORE_MAX_BYTES']
+        )
+    except FuturesTimeoutError:
+        flash('جاري تجهيز الفاتورة، حاول الطباعة مرة أخرى بعد لحظات', 'info')
+        return redirect(url_for('view_invoice', sale_id=sale_id))
     return send_file(
-        pdf_path,
+        pdf,
+        mimetype='application/pdf',
         as_attachment=True,
         download_name=f"invoice_{sale.invoice_number}.pdf"
     )
 
 @app.route('/products')
 @login_required
+@conditional_view(product_version)
 def products():
     if not current_user.has_permission('manage_products'):
         flash('ليس لديك صلاحية للوصول لهذه الصفحة', 'error')
@@ -367,10 +427,10 @@ def products():
         query = query.filter_by(category_id=category_id)
     
     products = query.order_by(Product.name_ar).paginate(page=page, per_page=20, error_out=False)
-    categories = Category.query.all()
+    categories = category_index()
     
-    return render_template('products.html', products=products, categories=categories,
-                           search=search, selected_category=category_id)
+    return render_template('products.html', products=products, categories=categories.all,
+                           category_names=categories.names, search=search, selected_category=category_id)
 
 
 # =========================
@@ -387,22 +447,18 @@ def add_product():
     
     if form.validate_on_submit():
         category_name = form.category_name.data.strip()
-        category = Category.query.filter_by(name_ar=category_name).first()
+        category = category_by_name(category_name)
         if not category:
             category = Category(name=category_name, name_ar=category_name)
             db.session.add(category)
+            invalidate_categories(db.session)
             db.session.commit()
         
         image_url = None
         if form.image.data:
             file = form.image.data
             if allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                file.save(file_path)
-                image_url = f"/static/uploads/{filename}"
+                image_url = save_upload(file)
         
         product = Product(
             name=form.name.data,
@@ -434,7 +490,9 @@ def add_product():
                 employee_id=current_user.id
             )
             db.session.add(movement)
+            invalidate_barcodes(db.session, product.barcode)
             db.session.commit()
+            product_index.upsert_product(product)
             
             flash(f'تم إضافة المنتج {product.name_ar} بنجاح', 'success')
             return redirect(url_for('products'))
@@ -454,7 +512,7 @@ def edit_product(product_id):
     
     product = Product.query.get_or_404(product_id)
     form = ProductForm(obj=product)
-    form.category_name.data = product.category.name_ar if product.category else ''
+    form.category_name.data = category_index().names.get(product.category_id, '')
     
     if form.validate_on_submit():
         old_quantity = product.quantity
@@ -462,24 +520,21 @@ def edit_product(product_id):
         old_name = product.name_ar
         old_status = product.is_active
         old_category_id = product.category_id
+        old_barcode = product.barcode
         
         category_name = form.category_name.data.strip()
-        category = Category.query.filter_by(name_ar=category_name).first()
+        category = category_by_name(category_name)
         if not category:
             category = Category(name=category_name, name_ar=category_name)
             db.session.add(category)
+            invalidate_categories(db.session)
             db.session.commit()
         product.category_id = category.id
         
         if form.image.data:
             file = form.image.data
             if allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                file.save(file_path)
-                product.image_url = f"/static/uploads/{filename}"
+                product.image_url = save_upload(file)
         
         form.populate_obj(product)
         product.is_active = True if form.is_active.data == '1' else False
@@ -555,7 +610,9 @@ def edit_product(product_id):
                 )
                 db.session.add(movement)
 
+            invalidate_barcodes(db.session, old_barcode, product.barcode)
             db.session.commit()
+            product_index.upsert_product(product)
             
             flash(f'تم تحديث المنتج {product.name_ar} بنجاح', 'success')
             return redirect(url_for('products'))
@@ -594,7 +651,9 @@ def delete_product(product_id):
         db.session.commit()
 
         db.session.delete(product)
+        invalidate_barcodes(db.session, product.barcode)
         db.session.commit()
+        product_index.remove(product_id)
         flash(f'تم حذف المنتج {product.name_ar} بنجاح', 'success')
     except Exception as e:
         db.session.rollback()
@@ -602,6 +661,28 @@ def delete_product(product_id):
     
     return redirect(url_for('products'))
 
+@app.route('/api/import_products', methods=['POST'])
+@login_required
+def import_products():
+    """Bulk upsert from an uploaded CSV/JSON file (field `file`) or a raw request body."""
+    if not current_user.has_permission('manage_products'):
+        return jsonify({'error': 'ليس لديك صلاحية لاستيراد المنتجات'}), 403
+
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, filename = upload.stream, upload.filename
+    else:
+        stream, filename = request.stream, ''
+    default = 'json' if request.mimetype in ('application/json', 'application/x-ndjson') else 'csv'
+    fmt = request.args.get('format') or importer.detect_format(filename, default)
+
+    try:
+        report = importer.import_products(importer.read_rows(stream, fmt), current_user.id)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report.to_dict())
+
 
 # =========================
 # تقارير المبيعات
@@ -613,6 +694,56 @@ def sales_report():
         flash('ليس لديك صلاحية لعرض التقارير', 'error')
         return redirect(url_for('dashboard'))
     
+    start_date, end_date = report_dates()
+    range_start, range_end = rollups.day_range(start_date, end_date)
+    cursor = request.args.get('cursor')
+    sales, next_cursor = reports.sales_page(range_start, range_end, cursor=cursor)
+    
+    report_totals = rollups.totals(range_start, range_end)
+    total_revenue = report_totals['revenue']
+    total_transactions = report_totals['transactions']
+    
+    return render_template('sales_report.html',
+                           sales=sales,
+                           total_revenue=total_revenue,
+                           total_transactions=total_transactions,
+                           start_date=start_date,
+                           end_date=end_date,
+                           cursor=cursor,
+                           next_cursor=next_cursor)
+
+@app.route('/sales_report/export')
+@login_required
+def export_sales_report():
+    if not current_user.has_permission('view_reports'):
+        flash('ليس لديك صلاحية لعرض التقارير', 'error')
+        return redirect(url_for('dashboard'))
+    
+    start_date, end_date = report_dates()
+    rows = reports.export_rows(*rollups.day_range(start_date, end_date))
+    filename = f'sales_{start_date}_{end_date}'
+    
+    if request.args.get('format') == 'xlsx':
+        try:
+            body = reports.stream_xlsx(rows)
+        except ImportError:
+            flash('تصدير Excel يتطلب تثبيت مكتبة openpyxl', 'error')
+            return redirect(url_for('sales_report', start_date=start_date, end_date=end_date))
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filename += '.xlsx'
+    else:
+        body = reports.stream_csv(rows)
+        mimetype = 'text/csv; charset=utf-8'
+        filename += '.csv'
+    
+    return app.response_class(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+def report_dates():
+    """Parse start_date/end_date query args, defaulting to today"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
@@ -626,20 +757,7 @@ def sales_report():
     else:
         end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
     
-    sales = Sale.query.filter(
-        func.date(Sale.created_at) >= start_date,
-        func.date(Sale.created_at) <= end_date
-    ).order_by(Sale.created_at.desc()).all()
-    
-    total_revenue = sum(sale.total_amount for sale in sales)
-    total_transactions = len(sales)
-    
-    return render_template('sales_report.html',
-                           sales=sales,
-                           total_revenue=total_revenue,
-                           total_transactions=total_transactions,
-                           start_date=start_date,
-                           end_date=end_date)
+    return start_date, end_date
 
 # =========================
 # إدارة الموظفين
@@ -697,6 +815,7 @@ def edit_employee(employee_id):
         employee.password_hash = generate_password_hash(new_password)
 
     try:
+        invalidate_employee(db.session, employee.id)
         db.session.commit()
         flash('تم تعديل بيانات الموظف بنجاح ✅', 'success')
     except Exception as e:
@@ -719,6 +838,7 @@ def delete_employee(employee_id):
         return redirect(url_for('employees'))
     
     db.session.delete(employee)
+    invalidate_employee(db.session, employee.id)
     db.session.commit()
     flash("تم حذف الموظف بنجاح", "success")
     return redirect(url_for('employees'))
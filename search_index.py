@@ -0,0 +1,234 @@
+import re
+import time
+import threading
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app import app, db
+from models import Product
+
+# التشكيل والتطويل
+_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_LETTER_FORMS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+})
+_SPACES = re.compile(r'\s+')
+# مثل الكتالوج: التعديلات الأحدث من هذا تُقرأ في التحديث التالي، حتى لا
+# تفوتنا معاملة بدأت قبل العلامة ولم تُحفظ إلا بعدها
+SEARCH_SETTLE_SECONDS = 2
+
+def normalize(text):
+    """Fold the spelling variants cashiers type interchangeably.
+
+    Strips diacritics and tatweel, unifies hamza/alef forms, taa marbuta
+    and alef maqsura, maps Arabic-Indic digits and lowercases Latin text.
+    """
+    if not text:
+        return ''
+    text = _DIACRITICS.sub('', text).translate(_LETTER_FORMS).lower()
+    return _SPACES.sub(' ', text).strip()
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _Document:
+    __slots__ = ('name_ar', 'codes', 'haystack', 'starts')
+
+    def __init__(self, name_ar, name, barcode, sku):
+        self.name_ar = name_ar or ''
+        self.codes = {normalize(barcode), normalize(sku)} - {''}
+        fields = [field for field in (normalize(name_ar), normalize(name),
+                                      normalize(barcode), normalize(sku)) if field]
+        # كل حقل يبدأ بفاصل لا يظهر في النصوص، فيصبح فحص بداية الكلمة
+        # بحثاً عن ' ' + q أو '\x00' + q داخل نص واحد
+        self.haystack = '\x00' + '\x00'.join(fields)
+        self.starts = {token[:3] for field in fields for token in field.split(' ') if len(token) >= 2}
+
+    def is_prefix(self, query):
+        return '\x00' + query in self.haystack or ' ' + query in self.haystack
+
+
+class ProductSearchIndex:
+    """In-process trigram index over the active catalog.
+
+    Posting lists are compact int arrays: trigrams of every field for
+    substring matches, and the first two/three letters of every word for
+    prefix matches. A removed or edited product simply leaves stale ids
+    behind, which candidate verification skips and `compact()` drops once
+    they pile up.
+    """
+
+    def __init__(self, refresh_interval=5):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._postings = {}
+        self._prefixes = {}
+        self._codes = {}
+        self._stale = 0
+        self._built = False
+        self._watermark = None
+        self._checked_at = 0.0
+
+    def _add_postings(self, product_id, doc):
+        for gram in _trigrams(doc.haystack):
+            self._postings.setdefault(gram, array('i')).append(product_id)
+        for start in doc.starts | {start[:2] for start in doc.starts}:
+            self._prefixes.setdefault(start, array('i')).append(product_id)
+        for code in doc.codes:
+            self._codes[code] = product_id
+
+    def upsert(self, product_id, name_ar, name, barcode, sku, is_active=True):
+        """Index a product, or drop it when it is no longer active"""
+        if not is_active:
+            self.remove(product_id)
+            return
+        doc = _Document(name_ar, name, barcode, sku)
+        with self._lock:
+            current = self._docs.get(product_id)
+            if current is not None and current.haystack == doc.haystack:
+                current.name_ar = doc.name_ar
+                return
+            if current is not None:
+                self._stale += 1
+                self._drop_codes(product_id, current)
+            self._docs[product_id] = doc
+            self._add_postings(product_id, doc)
+            self._maybe_compact()
+
+    def upsert_product(self, product):
+        self.upsert(product.id, product.name_ar, product.name, product.barcode,
+                    product.sku, product.is_active)
+
+    def remove(self, product_id):
+        with self._lock:
+            doc = self._docs.pop(product_id, None)
+            if doc is not None:
+                self._stale += 1
+                self._drop_codes(product_id, doc)
+                self._maybe_compact()
+
+    def _drop_codes(self, product_id, doc):
+        for code in doc.codes:
+            if self._codes.get(code) == product_id:
+                del self._codes[code]
+
+    def _maybe_compact(self):
+        if self._stale > max(1000, len(self._docs) // 5):
+            self.compact()
+
+    def compact(self):
+        """Rebuild posting lists from the live documents"""
+        with self._lock:
+            self._postings = {}
+            self._prefixes = {}
+            self._codes = {}
+            for product_id, doc in self._docs.items():
+                self._add_postings(product_id, doc)
+            self._stale = 0
+
+    def build(self):
+        """Load every active product in one streamed query"""
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            self._prefixes = {}
+            self._codes = {}
+            self._stale = 0
+            # ما تغيّر خلال مهلة الاستقرار يُقرأ مجدداً في أول تحديث
+            self._watermark = datetime.utcnow() - timedelta(seconds=SEARCH_SETTLE_SECONDS)
+            self._load(select(Product.id, Product.name_ar, Product.name, Product.barcode,
+                              Product.sku, Product.is_active)
+                       .where(Product.is_active == True))
+            self._built = True
+            self._checked_at = time.monotonic()
+
+    def _load(self, stmt):
+        for row in db.session.execute(stmt.execution_options(yield_per=5000)):
+            self.upsert(row.id, row.name_ar, row.name, row.barcode, row.sku, row.is_active)
+
+    def refresh(self):
+        """Pick up products other workers changed since the last check.
+
+        Reads products whose updated_at falls between the last check and
+        SEARCH_SETTLE_SECONDS ago, so an edit whose transaction commits
+        after a newer one is still in the window next time. Deletions are
+        not visible here; callers re-read search hits from the database,
+        which filters them out.
+        """
+        if not self._built:
+            self.build()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            settled = datetime.utcnow() - timedelta(seconds=SEARCH_SETTLE_SECONDS)
+            self._load(select(Product.id, Product.name_ar, Product.name, Product.barcode,
+                              Product.sku, Product.is_active)
+                       .where(Product.updated_at > self._watermark, Product.updated_at <= settled))
+            self._watermark = settled
+
+    def _scan(self, postings, matches, found, limit):
+        """Append verified hits from a posting list until `limit` is reached"""
+        for product_id in postings:
+            if product_id in found:
+                continue
+            doc = self._docs.get(product_id)
+            if doc is not None and matches(doc):
+                found[product_id] = doc
+                if len(found) >= limit:
+                    return True
+        return False
+
+    def search(self, text, limit=20):
+        """Return product ids ranked exact code, then prefix, then substring.
+
+        Each tier is scanned only until `limit` hits are collected, so a
+        very common word costs no more than a rare one.
+        """
+        query = normalize(text)
+        if len(query) < 2:
+            return []
+        with self._lock:
+            found = {}
+            exact = self._codes.get(query)
+            if exact is not None and exact in self._docs:
+                found[exact] = self._docs[exact]
+
+            # كل منتج يطابق الاستعلام يظهر في جميع قوائم ثلاثياته، فأقصرها يكفي
+            grams = [self._postings.get(gram, ()) for gram in _trigrams(query)]
+            shortest = min(grams, key=len) if grams else None
+
+            tiers = [len(found)]
+            prefixes = self._prefixes.get(query[:3], ())
+            if shortest is not None and len(shortest) < len(prefixes):
+                prefixes = shortest
+            done = len(found) >= limit or self._scan(
+                prefixes, lambda doc: doc.is_prefix(query), found, limit)
+            tiers.append(len(found))
+
+            if not done and shortest:
+                self._scan(shortest, lambda doc: query in doc.haystack, found, limit)
+
+        hits = list(found.items())
+        bounds = [0, *tiers, len(hits)]
+        # الترتيب داخل كل مستوى حسب طول الاسم ثم الاسم
+        ranked = []
+        for low, high in zip(bounds, bounds[1:]):
+            ranked.extend(sorted(hits[low:high], key=lambda hit: (len(hit[1].name_ar), hit[1].name_ar)))
+        return [product_id for product_id, _ in ranked]
+
+    def __len__(self):
+        return len(self._docs)
+
+
+product_index = ProductSearchIndex(refresh_interval=app.config.get('SEARCH_INDEX_REFRESH_SECONDS', 5))
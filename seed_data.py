@@ -0,0 +1,213 @@
+import time
+import random
+import click
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import func, insert, update, bindparam
+from werkzeug.security import generate_password_hash
+from app import app, db
+from models import Employee, Category, Product, Sale, SaleItem, InventoryMovement
+from benchmarks import ARABIC_WORDS, ENGLISH_WORDS
+import rollups
+from caches import invalidate_categories
+
+SEED_SKU_PREFIX = 'SEED-'
+SEED_BATCH_SIZE = 10_000
+CATEGORY_NAMES = [('Groceries', 'بقالة'), ('Beverages', 'مشروبات'), ('Dairy', 'ألبان'),
+                  ('Cleaning', 'منظفات'), ('Personal care', 'عناية شخصية'), ('Snacks', 'تسالي'),
+                  ('Bakery', 'مخبوزات'), ('Meat', 'لحوم'), ('Frozen', 'مجمدات'), ('Household', 'أدوات منزلية')]
+UNITS = ['كيلو', 'لتر', 'نصف كيلو', 'عبوة', 'كرتونة', '250 جرام', '500 مل', 'قطعة']
+PAYMENT_METHODS = ['cash'] * 7 + ['card'] * 3
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _flush(model, rows):
+    if rows:
+        db.session.execute(insert(model.__table__), rows)
+        rows.clear()
+
+
+def _seed_staff(rng, cashiers):
+    employee_ids = []
+    password_hash = generate_password_hash('seed-password')
+    for n in range(cashiers):
+        username = f'seed-cashier-{n}'
+        employee = Employee.query.filter_by(username=username).first()
+        if employee is None:
+            employee = Employee(username=username, email=f'{username}@seed.local',
+                                full_name=f'كاشير {rng.choice(ARABIC_WORDS)} {n}',
+                                password_hash=password_hash, role='cashier')
+            db.session.add(employee)
+            db.session.flush()
+        employee_ids.append(employee.id)
+
+    category_ids = []
+    for name, name_ar in CATEGORY_NAMES:
+        category = Category.query.filter_by(name_ar=name_ar).first()
+        if category is None:
+            category = Category(name=name, name_ar=name_ar)
+            db.session.add(category)
+            db.session.flush()
+            invalidate_categories(db.session)
+        category_ids.append(category.id)
+    return employee_ids, category_ids
+
+
+def _seed_products(rng, count, category_ids, created_at):
+    """Insert the catalog; returns (first_id, names, prices, stock) indexed from first_id"""
+    first_id = _next_id(Product)
+    names = []
+    prices = []
+    stock = []
+    rows = []
+    for n in range(count):
+        price = Decimal(rng.choice([rng.randint(3, 60), rng.randint(60, 400)])) + Decimal('0.50') * rng.randint(0, 1)
+        quantity = rng.randint(2_000, 20_000)
+        prices.append(price)
+        stock.append(quantity)
+        words = rng.sample(ARABIC_WORDS, rng.randint(2, 3))
+        names.append(f'{" ".join(words)} {rng.choice(UNITS)}')
+        rows.append({
+            'id': first_id + n,
+            'name': ' '.join(rng.sample(ENGLISH_WORDS, 2)).title(),
+            'name_ar': names[-1],
+            'barcode': f'628{first_id + n:010d}',
+            'sku': f'{SEED_SKU_PREFIX}{first_id + n:07d}',
+            'price': price,
+            'cost_price': (price * Decimal('0.75')).quantize(Decimal('0.01')),
+            'quantity': quantity,
+            'min_quantity': rng.choice([5, 10, 20]),
+            'is_active': rng.random() > 0.02,
+            'category_id': rng.choice(category_ids),
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+        if len(rows) >= SEED_BATCH_SIZE:
+            _flush(Product, rows)
+    _flush(Product, rows)
+    return first_id, names, prices, stock
+
+
+@app.cli.command('seed-data')
+@click.option('--products', 'product_count', default=200_000, help='عدد المنتجات')
+@click.option('--sales', 'sale_count', default=2_000_000, help='عدد عمليات البيع')
+@click.option('--items', 'items_per_sale', default=5, help='متوسط عدد البنود في كل بيع')
+@click.option('--days', default=365, help='عدد الأيام التي تتوزع عليها المبيعات')
+@click.option('--cashiers', default=20, help='عدد الكاشيرات')
+@click.option('--seed', default=1, help='بذرة التوليد؛ نفس البذرة تعطي نفس البيانات')
+@click.option('--yes', is_flag=True, help='تخطي التأكيد')
+def seed_data(product_count, sale_count, items_per_sale, days, cashiers, seed, yes):
+    """Fill a scratch database with a realistic, reproducible catalog and history.
+
+    Defaults give 200k products, 2M sales and about 10M sale items with one
+    inventory movement each. Rows are written in chronological order with
+    running stock, so the movement ledger is consistent with the final
+    product quantities. Rollups are rebuilt at the end.
+    """
+    if Product.query.filter(Product.sku.like(f'{SEED_SKU_PREFIX}%')).first() is not None:
+        raise click.ClickException('البيانات التجريبية موجودة بالفعل في قاعدة البيانات')
+    if not yes:
+        click.confirm(f'سيتم إنشاء بيانات تجريبية في {db.engine.url.render_as_string()}، متابعة؟',
+                      abort=True)
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+
+    employee_ids, category_ids = _seed_staff(rng, cashiers)
+    admin_id = employee_ids[0]
+    first_product_id, names, prices, stock = _seed_products(rng, product_count, category_ids, start)
+    db.session.execute(insert(InventoryMovement.__table__), [{
+        'movement_type': 'in', 'quantity': quantity, 'previous_quantity': 0,
+        'new_quantity': quantity, 'reason': 'initial_stock',
+        'product_id': first_product_id + n, 'employee_id': admin_id, 'created_at': start,
+    } for n, quantity in enumerate(stock)])
+    db.session.commit()
+    click.echo(f'{product_count} products in {time.perf_counter() - started:.0f}s')
+
+    # الطلب على المنتجات غير متساوٍ: قلة من المنتجات تصنع معظم المبيعات
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(product_count)]
+    popular = list(range(product_count))
+    rng.shuffle(popular)
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    first_sale_id = _next_id(Sale)
+    step = (end - start).total_seconds() / max(sale_count, 1)
+    sales, items, movements = [], [], []
+    for n in range(sale_count):
+        sale_id = first_sale_id + n
+        created_at = start + timedelta(seconds=(n + rng.random()) * step)
+        employee_id = rng.choice(employee_ids)
+        line_count = max(1, min(items_per_sale * 3, int(rng.expovariate(1 / items_per_sale)) + 1))
+        chosen = {popular[index] for index in
+                  (min(product_count - 1, bisect_left(cumulative, rng.random() * total))
+                   for _ in range(line_count))}
+        subtotal = Decimal('0.00')
+        for index in chosen:
+            quantity = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+            product_id = first_product_id + index
+            if stock[index] < quantity:
+                # المنتجات الأكثر مبيعاً تنفد خلال السنة فيُعاد توريدها
+                restock = rng.randint(2_000, 20_000)
+                movements.append({
+                    'movement_type': 'in', 'quantity': restock,
+                    'previous_quantity': stock[index], 'new_quantity': stock[index] + restock,
+                    'reason': 'restock', 'reference_id': None, 'product_id': product_id,
+                    'employee_id': admin_id, 'created_at': created_at,
+                })
+                stock[index] += restock
+            previous_quantity = stock[index]
+            stock[index] = previous_quantity - quantity
+            item_total = prices[index] * quantity
+            subtotal += item_total
+            items.append({
+                'sale_id': sale_id, 'product_id': product_id, 'quantity': quantity,
+                'unit_price': prices[index], 'total_price': item_total,
+                'product_name': names[index], 'product_sku': f'{SEED_SKU_PREFIX}{product_id:07d}',
+            })
+            movements.append({
+                'movement_type': 'out', 'quantity': quantity,
+                'previous_quantity': previous_quantity, 'new_quantity': stock[index],
+                'reason': 'sale', 'reference_id': sale_id, 'product_id': product_id,
+                'employee_id': employee_id, 'created_at': created_at,
+            })
+        discount = Decimal(rng.choice([0, 0, 0, 0, 5, 10])) if subtotal > 50 else Decimal('0.00')
+        sales.append({
+            'id': sale_id, 'invoice_number': f'INV-SEED-{sale_id:08d}',
+            'total_amount': subtotal - discount, 'discount_amount': discount, 'tax_amount': 0,
+            'payment_method': rng.choice(PAYMENT_METHODS), 'employee_id': employee_id,
+            'created_at': created_at,
+        })
+        if len(items) >= SEED_BATCH_SIZE:
+            _flush(Sale, sales)
+            _flush(SaleItem, items)
+            _flush(InventoryMovement, movements)
+            db.session.commit()
+        if (n + 1) % 100_000 == 0:
+            click.echo(f'  {n + 1} sales, {time.perf_counter() - started:.0f}s')
+    _flush(Sale, sales)
+    _flush(SaleItem, items)
+    _flush(InventoryMovement, movements)
+
+    # الكميات النهائية بعد كل المبيعات
+    stmt = update(Product).where(Product.id == bindparam('product_id')) \
+        .values(quantity=bindparam('remaining'))
+    updates = [{'product_id': first_product_id + n, 'remaining': quantity}
+               for n, quantity in enumerate(stock)]
+    for offset in range(0, len(updates), SEED_BATCH_SIZE):
+        db.session.connection().execute(stmt, updates[offset:offset + SEED_BATCH_SIZE])
+    db.session.commit()
+
+    buckets = rollups.rebuild()
+    db.session.commit()
+    click.echo(f'{sale_count} sales, {buckets} rollup buckets in {time.perf_counter() - started:.0f}s')
+
@@ -0,0 +1,74 @@
+import os
+import threading
+from sqlalchemy import update, insert
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+from models import InvoiceSequence
+
+
+class BlockSequence:
+    """Unique, increasing numbers handed out from leased blocks.
+
+    Each process leases `block_size` numbers at a time with one UPDATE on
+    its row in invoice_sequence, committed on its own connection, and
+    then serves them from memory. Numbers rise within a process and
+    never repeat across processes; blocks left unused when a worker
+    stops are skipped, so the series can have gaps.
+
+    On SQLite the lease cannot wait behind the caller's own write
+    transaction, so callers `reserve()` every number they will need
+    before their first write and pass those down.
+    """
+
+    def __init__(self, name, block_size=100):
+        self.name = name
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        # نسخة العامل من الكتلة قد تكون نفس نسخة العملية الأم
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def _lease(self, size):
+        table = InvoiceSequence.__table__
+        while True:
+            with db.engine.begin() as connection:
+                end = connection.execute(
+                    update(table).where(table.c.name == self.name)
+                    .values(next_value=table.c.next_value + size)
+                    .returning(table.c.next_value)
+                ).scalar()
+            if end is not None:
+                break
+            # أول كتلة لهذا الاسم؛ إن سبقتنا عملية أخرى نعيد المحاولة
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(insert(table).values(name=self.name, next_value=1))
+            except IntegrityError:
+                pass
+        self._next, self._end = end - size, end
+
+    def reserve(self, count=1):
+        """Hand out the next `count` numbers; no other caller can get them"""
+        with self._lock:
+            if self._end - self._next < count:
+                self._lease(max(self.block_size, count))
+            first = self._next
+            self._next += count
+        return range(first, first + count)
+
+
+# ==========================
+# أرقام الفواتير
+# ==========================
+invoice_sequence = BlockSequence(f"invoice:{app.config['STORE_CODE']}",
+                                 block_size=app.config['INVOICE_BLOCK_SIZE'])
+
+
+def invoice_numbers(count=1):
+    """`count` new invoice numbers such as INV-01-00001234; take them before the first write"""
+    return [f"INV-{app.config['STORE_CODE']}-{n:08d}" for n in invoice_sequence.reserve(count)]
@@ -99,6 +99,13 @@ function processScannedBarcode(barcode) {
         }
     }
 
+    // Resolve the scan locally when the catalog has it
+    const local = typeof posCatalog !== 'undefined' ? posCatalog.byBarcode(barcode) : null;
+    if (local) {
+        showProductFound(local);
+        return;
+    }
+
     // Show loading
     showToast('جاري البحث عن المنتج...', 'info');
 
@@ -109,13 +116,7 @@ function processScannedBarcode(barcode) {
             if (data.error) {
                 showToast('المنتج غير موجود: ' + barcode, 'warning');
             } else {
-                showToast(`تم العثور على المنتج: ${data.name}`, 'success');
-
-                if (window.location.pathname.includes('pos') && typeof addToCart === 'function') {
-                    addToCart(data);
-                } else {
-                    displayProductInfo(data);
-                }
+                showProductFound(data);
             }
         })
         .catch(error => {
@@ -124,6 +125,16 @@ function processScannedBarcode(barcode) {
         });
 }
 
+function showProductFound(product) {
+    showToast(`تم العثور على المنتج: ${product.name}`, 'success');
+
+    if (window.location.pathname.includes('pos') && typeof addToCart === 'function') {
+        addToCart(product);
+    } else {
+        displayProductInfo(product);
+    }
+}
+
 function showScannerError(message) {
     const qrReader = document.getElementById('qr-reader');
     qrReader.innerHTML = `
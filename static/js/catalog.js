@@ -0,0 +1,165 @@
+// Local product catalog for POS terminals
+// Keeps a copy of /api/catalog in IndexedDB so searches and scans are answered
+// without a round trip; only changed rows are fetched after the first load.
+
+const posCatalog = (function() {
+    const DB_NAME = 'pos-catalog';
+    const SYNC_INTERVAL = 30000;
+
+    const byId = new Map();
+    const byBarcode = new Map();
+    let cursor = null;
+    let syncing = null;
+    let database = null;
+
+    const catalog = {ready: false, size: 0};
+
+    function openDatabase() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore('products', {keyPath: 'id'});
+                request.result.createObjectStore('meta');
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    function transactionDone(tx) {
+        return new Promise((resolve, reject) => {
+            tx.oncomplete = resolve;
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function remember(product) {
+        const previous = byId.get(product.id);
+        if (previous && previous.barcode) byBarcode.delete(previous.barcode);
+        product.search = `${product.name} ${product.name_en || ''} ${product.sku} ${product.barcode || ''}`.toLowerCase();
+        byId.set(product.id, product);
+        if (product.barcode) byBarcode.set(product.barcode, product);
+    }
+
+    function forget(id) {
+        const previous = byId.get(id);
+        if (previous && previous.barcode) byBarcode.delete(previous.barcode);
+        byId.delete(id);
+    }
+
+    function clearMemory() {
+        byId.clear();
+        byBarcode.clear();
+    }
+
+    async function loadStored() {
+        const tx = database.transaction(['products', 'meta']);
+        const products = tx.objectStore('products').getAll();
+        const stored = tx.objectStore('meta').get('cursor');
+        await transactionDone(tx);
+        products.result.forEach(remember);
+        cursor = stored.result || null;
+    }
+
+    async function applyPage(page) {
+        const tx = database.transaction(['products', 'meta'], 'readwrite');
+        const store = tx.objectStore('products');
+        if (page.full) {
+            store.clear();
+            clearMemory();
+        }
+        // الحذف أولاً ثم التحديث، كما يضمن الخادم
+        page.deleted.forEach(id => {
+            store.delete(id);
+            forget(id);
+        });
+        page.products.forEach(row => {
+            const product = {};
+            page.fields.forEach((field, index) => product[field] = row[index]);
+            if (product.active) {
+                store.put(product);
+                remember(product);
+            } else {
+                store.delete(product.id);
+                forget(product.id);
+            }
+        });
+        tx.objectStore('meta').put(page.cursor, 'cursor');
+        await transactionDone(tx);
+        cursor = page.cursor;
+    }
+
+    async function pull() {
+        let more = true;
+        while (more) {
+            const url = cursor ? `/api/catalog?since=${encodeURIComponent(cursor)}` : '/api/catalog';
+            const response = await fetch(url, {cache: 'no-cache'});
+            if (response.status === 304) return;
+            if (!response.ok) throw new Error(`catalog sync failed: ${response.status}`);
+            const page = await response.json();
+            await applyPage(page);
+            more = page.more;
+        }
+    }
+
+    catalog.sync = function() {
+        if (!database) return Promise.resolve();
+        if (!syncing) {
+            syncing = pull()
+                .then(() => {
+                    catalog.ready = true;
+                    catalog.size = byId.size;
+                })
+                .catch(error => console.warn('Catalog sync error:', error))
+                .finally(() => syncing = null);
+        }
+        return syncing;
+    };
+
+    catalog.byBarcode = function(barcode) {
+        return byBarcode.get(barcode) || null;
+    };
+
+    // المطابقة التامة للباركود أو SKU أولاً ثم المنتجات التي تحتوي النص
+    catalog.search = function(query, limit = 20) {
+        const text = query.trim().toLowerCase();
+        if (!text) return [];
+        const exact = byBarcode.get(query.trim());
+        const results = exact ? [exact] : [];
+        for (const product of byId.values()) {
+            if (results.length >= limit) break;
+            if (product !== exact && product.search.includes(text)) results.push(product);
+        }
+        return results;
+    };
+
+    // تحديث الكمية محلياً بعد البيع حتى تصل المزامنة التالية
+    catalog.adjustQuantity = function(id, delta) {
+        const product = byId.get(id);
+        if (product) product.quantity += delta;
+    };
+
+    catalog.start = async function() {
+        if (!('indexedDB' in window)) return;
+        try {
+            database = await openDatabase();
+            await loadStored();
+            catalog.ready = byId.size > 0;
+            catalog.size = byId.size;
+        } catch (error) {
+            console.warn('Local catalog unavailable:', error);
+            database = null;
+            return;
+        }
+        catalog.sync();
+        setInterval(catalog.sync, SYNC_INTERVAL);
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'visible') catalog.sync();
+        });
+    };
+
+    return catalog;
+})();
+
+document.addEventListener('DOMContentLoaded', posCatalog.start);
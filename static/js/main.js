@@ -210,27 +210,101 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Auto-refresh for real-time data (dashboard)
-    if (window.location.pathname.includes('dashboard')) {
-        setInterval(function() {
-            // Refresh low stock alerts
-            const lowStockSection = document.querySelector('.low-stock-alerts');
-            if (lowStockSection) {
-                // This would typically fetch updated data via AJAX
-                // For now, we'll just add a visual indicator
-                const lastUpdate = document.createElement('small');
-                lastUpdate.className = 'text-muted';
-                lastUpdate.textContent = 'آخر تحديث: ' + new Date().toLocaleTimeString('ar');
-                
-                const existingUpdate = lowStockSection.querySelector('.last-update');
-                if (existingUpdate) {
-                    existingUpdate.remove();
+    // Live dashboard updates over Server-Sent Events
+    const liveDashboard = document.getElementById('live-dashboard');
+    if (liveDashboard && window.EventSource) {
+        const today = liveDashboard.dataset.today;
+        const weekStart = liveDashboard.dataset.weekStart;
+
+        function addToCounter(id, delta, decimals) {
+            const el = document.getElementById(id);
+            if (!el) {
+                return;
+            }
+            const value = parseFloat(el.dataset.value || '0') + delta;
+            el.dataset.value = value;
+            el.textContent = decimals ? value.toFixed(decimals) : value;
+        }
+
+        function saleItem(sale) {
+            const item = document.createElement('div');
+            item.className = 'list-group-item px-0';
+            item.innerHTML = `
+                <div class="d-flex w-100 justify-content-between">
+                    <h6 class="mb-1"></h6>
+                    <small></small>
+                </div>
+                <p class="mb-1"><strong></strong> - <span></span></p>
+                <small class="text-muted"></small>
+            `;
+            item.querySelector('h6').textContent = 'فاتورة ' + sale.invoice_number;
+            item.querySelector('div small').textContent = sale.created_at.slice(11, 16);
+            item.querySelector('strong').textContent = sale.total_amount.toFixed(2) + ' جنيه';
+            item.querySelector('p span').textContent = sale.customer_name || 'عميل عادي';
+            item.querySelector('p + small').textContent = sale.employee_name || '';
+            return item;
+        }
+
+        function lowStockItem(product) {
+            const item = document.createElement('div');
+            item.className = 'list-group-item d-flex justify-content-between align-items-center px-0';
+            item.dataset.productId = product.id;
+            item.innerHTML = `
+                <div><strong></strong><br><small class="text-muted"></small></div>
+                <span class="badge bg-danger"><span class="quantity"></span> متبقي</span>
+            `;
+            item.querySelector('strong').textContent = product.name_ar;
+            item.querySelector('small').textContent = product.sku;
+            return item;
+        }
+
+        function applySales(update) {
+            Object.keys(update.days).forEach(function(day) {
+                const totals = update.days[day];
+                if (day === today) {
+                    addToCounter('today-revenue', totals.revenue, 2);
+                    addToCounter('today-transactions', totals.transactions, 0);
                 }
-                
-                lastUpdate.className += ' last-update';
-                lowStockSection.appendChild(lastUpdate);
+                if (day >= weekStart && day <= today) {
+                    addToCounter('week-revenue', totals.revenue, 2);
+                }
+            });
+
+            const recentSales = document.getElementById('recent-sales');
+            update.recent.slice().reverse().forEach(function(sale) {
+                recentSales.prepend(saleItem(sale));
+            });
+            while (recentSales.children.length > 10) {
+                recentSales.lastElementChild.remove();
             }
-        }, 30000); // Every 30 seconds
+            document.getElementById('recent-sales-empty').classList.toggle('d-none', recentSales.children.length > 0);
+
+            const lowStockList = document.getElementById('low-stock-list');
+            update.low_stock.forEach(function(product) {
+                let item = lowStockList.querySelector(`[data-product-id="${product.id}"]`);
+                if (!item && product.entered && lowStockList.children.length < 10) {
+                    item = lowStockItem(product);
+                    lowStockList.appendChild(item);
+                }
+                if (item) {
+                    item.querySelector('.quantity').textContent = product.quantity;
+                }
+            });
+            addToCounter('low-stock-count', update.low_stock_entered, 0);
+            const lowStockCount = parseInt(document.getElementById('low-stock-count').dataset.value, 10);
+            document.getElementById('low-stock-more').classList.toggle('d-none', lowStockCount <= 10);
+            document.getElementById('low-stock-empty').classList.toggle('d-none', lowStockList.children.length > 0);
+        }
+
+        const stream = new EventSource(liveDashboard.dataset.streamUrl);
+        stream.addEventListener('sales', function(e) {
+            applySales(JSON.parse(e.data));
+        });
+        // The server lost track of what this page has seen; start over from a fresh page
+        stream.addEventListener('reset', function() {
+            stream.close();
+            window.location.reload();
+        });
     }
 
     // Print functionality enhancement
@@ -74,6 +74,12 @@ function searchProducts() {
         return;
     }
     
+    // Answer from the local catalog when it is loaded
+    if (typeof posCatalog !== 'undefined' && posCatalog.ready) {
+        displaySearchResults(posCatalog.search(query, 20));
+        return;
+    }
+    
     // Show loading indicator
     const resultsContainer = document.getElementById('searchResults');
     resultsContainer.innerHTML = `
@@ -333,6 +339,8 @@ function processSale() {
     
     // Prepare sale data
     const saleData = {
+        client_key: newClientKey(),
+        sold_at: new Date().toISOString(),
         items: cart.map(item => ({
             product_id: item.id,
             quantity: item.quantity,
@@ -365,6 +373,12 @@ function processSale() {
             // Show sale summary modal
             showSaleSummary(data);
             
+            // Keep local stock in step until the next catalog sync
+            if (typeof posCatalog !== 'undefined') {
+                saleData.items.forEach(item => posCatalog.adjustQuantity(item.product_id, -item.quantity));
+                posCatalog.sync();
+            }
+            
             // Clear cart
             clearCart();
         } else {
@@ -372,8 +386,12 @@ function processSale() {
         }
     })
     .catch(error => {
+        // The server may or may not have the sale; the queue resends it
+        // with the same client_key, so it is never recorded twice
         console.error('Sale processing error:', error);
-        showToast('حدث خطأ في معالجة البيع', 'danger');
+        queueSale(saleData);
+        showToast('تعذر الاتصال بالخادم، تم حفظ البيع وسيُرسل تلقائياً', 'warning');
+        clearCart();
     })
     .finally(() => {
         // Reset checkout button
@@ -382,6 +400,62 @@ function processSale() {
     });
 }
 
+// Offline sale queue, replayed through /api/sales/batch
+const SALE_QUEUE_KEY = 'pendingSales';
+const SALE_BATCH_SIZE = 500;
+let flushingQueue = false;
+
+function newClientKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+function pendingSales() {
+    return JSON.parse(localStorage.getItem(SALE_QUEUE_KEY) || '[]');
+}
+
+function queueSale(saleData) {
+    const queue = pendingSales();
+    queue.push(saleData);
+    localStorage.setItem(SALE_QUEUE_KEY, JSON.stringify(queue));
+}
+
+async function flushSaleQueue() {
+    if (flushingQueue || !navigator.onLine) return;
+    flushingQueue = true;
+    try {
+        let queue = pendingSales();
+        while (queue.length > 0) {
+            const batch = queue.slice(0, SALE_BATCH_SIZE);
+            const response = await fetch('/api/sales/batch', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({sales: batch})
+            });
+            if (!response.ok) break;
+            const data = await response.json();
+            const failed = data.results.filter(result => result.status === 'error');
+            failed.forEach(result => showToast(`لم يتم تسجيل بيع مؤجل: ${result.error}`, 'danger'));
+
+            // Drop what the server answered for, keep anything queued meanwhile
+            const done = new Set(batch.map(sale => sale.client_key));
+            queue = pendingSales().filter(sale => !done.has(sale.client_key));
+            localStorage.setItem(SALE_QUEUE_KEY, JSON.stringify(queue));
+            if (batch.length > failed.length) {
+                showToast(`تم إرسال ${batch.length - failed.length} عملية بيع مؤجلة`, 'success');
+            }
+        }
+    } catch (error) {
+        console.warn('Sale queue flush failed:', error);
+    } finally {
+        flushingQueue = false;
+    }
+}
+
+window.addEventListener('online', flushSaleQueue);
+setInterval(flushSaleQueue, 30000);
+document.addEventListener('DOMContentLoaded', flushSaleQueue);
+
 function showSaleSummary(saleData) {
     const modal = document.createElement('div');
     modal.className = 'modal fade';
@@ -1,13 +1,14 @@
 // Service Worker for POS System
 // Basic service worker for caching static assets
 
-const CACHE_NAME = 'pos-system-v1';
+const CACHE_NAME = 'pos-system-v2';
 const urlsToCache = [
   '/',
   '/static/css/style.css',
   '/static/js/main.js',
   '/static/js/pos.js',
   '/static/js/barcode-scanner.js',
+  '/static/js/catalog.js',
   'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.rtl.min.css',
   'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
   'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
@@ -0,0 +1,337 @@
+from datetime import datetime, timedelta
+import click
+from flask import request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import select, insert, func, text, union_all
+from app import app, db
+from models import (Category, Product, InventoryMovement, MovementArchive, StockCheckpoint, StockCheckpointItem,
+                    STOCK_MOVEMENT_TYPES)
+import ledger
+
+# الكمية "في اللحظة T" هي حصيلة كل الحركات المسجلة قبل T
+# حركة قد تُسجل بوقت أسبق قليلاً من لقطة لم تشملها
+ARCHIVE_SLACK = timedelta(days=1)
+
+
+# ==========================
+# اللقطات
+# ==========================
+def take_checkpoint():
+    """Snapshot every product's quantity together with the last movement it includes.
+
+    Writers are held off while the snapshot runs (the write lock on
+    SQLite, a SHARE lock on product on Postgres), so the quantities and
+    last_movement_id describe the same instant.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        db.session.execute(text('LOCK TABLE product IN SHARE MODE'))
+    checkpoint = StockCheckpoint(taken_at=datetime.utcnow())
+    db.session.add(checkpoint)
+    db.session.flush()
+
+    table = InventoryMovement.__table__
+    checkpoint.last_movement_id = (db.session.scalar(select(func.max(table.c.id)))
+                                   or db.session.scalar(select(func.max(MovementArchive.last_id))) or 0)
+    result = db.session.execute(insert(StockCheckpointItem.__table__).from_select(
+        ['checkpoint_id', 'product_id', 'quantity'],
+        select(db.literal(checkpoint.id), Product.id, Product.quantity).where(Product.quantity != 0)))
+    checkpoint.product_count = result.rowcount
+    db.session.commit()
+    return checkpoint
+
+
+def backfill_checkpoints():
+    """Add a checkpoint at the start of every past month of the ledger that has none.
+
+    For installations with history from before checkpoints existed; each
+    month is rebuilt from the one before it, so the cost is one pass
+    over the ledger.
+    """
+    table = InventoryMovement.__table__
+    oldest = db.session.scalar(select(func.min(table.c.created_at)))
+    if oldest is None:
+        return []
+    taken = set(db.session.scalars(select(StockCheckpoint.taken_at)))
+    created = []
+    period = ledger.add_months(ledger.month_start(oldest), 1)
+    while period <= ledger.month_start(datetime.utcnow()):
+        at = ledger.month_bounds(period)[0]
+        if at not in taken:
+            quantities, _ = stock_as_of(at)
+            last_id = db.session.scalar(select(func.max(table.c.id)).where(table.c.created_at < at)) or 0
+            checkpoint = StockCheckpoint(taken_at=at, last_movement_id=last_id,
+                                         product_count=sum(1 for quantity in quantities.values() if quantity))
+            db.session.add(checkpoint)
+            db.session.flush()
+            db.session.execute(insert(StockCheckpointItem.__table__), [
+                {'checkpoint_id': checkpoint.id, 'product_id': product_id, 'quantity': quantity}
+                for product_id, quantity in quantities.items() if quantity])
+            db.session.commit()
+            created.append(checkpoint)
+        period = ledger.add_months(period, 1)
+    return created
+
+
+def _checkpoint_quantities(checkpoint, product_ids, category_id):
+    return dict(db.session.execute(
+        select(StockCheckpointItem.product_id, StockCheckpointItem.quantity)
+        .where(StockCheckpointItem.checkpoint_id == checkpoint.id,
+               *_product_filter(StockCheckpointItem.product_id, product_ids, category_id))).all())
+
+
+def _nearest_checkpoints(at):
+    before = StockCheckpoint.query.filter(StockCheckpoint.taken_at <= at) \
+        .order_by(StockCheckpoint.taken_at.desc()).first()
+    after = StockCheckpoint.query.filter(StockCheckpoint.taken_at > at) \
+        .order_by(StockCheckpoint.taken_at).first()
+    return before, after
+
+
+# ==========================
+# إعادة تطبيق الحركات
+# ==========================
+def _product_filter(column, product_ids, category_id):
+    if product_ids is not None:
+        return [column.in_(product_ids)]
+    if category_id is not None:
+        return [column.in_(select(Product.id).where(Product.category_id == category_id))]
+    return []
+
+
+def _live_deltas(conditions, product_ids, category_id):
+    table = InventoryMovement.__table__
+    group = table.c.product_id
+    if db.engine.dialect.name == 'sqlite':
+        # بدون "+" يفضّل SQLite مسح فهرس product_id كاملاً ليتجنب الترتيب،
+        # بدل نطاق المعرف أو التاريخ القصير
+        group = text('+inventory_movement.product_id')
+    rows = db.session.execute(
+        select(table.c.product_id, func.sum(table.c.new_quantity - table.c.previous_quantity))
+        .where(*conditions, table.c.movement_type.in_(STOCK_MOVEMENT_TYPES),
+               *_product_filter(table.c.product_id, product_ids, category_id))
+        .group_by(group))
+    return dict(rows.all())
+
+
+def _archived_deltas(window_start, window_end, keep, product_ids, category_id):
+    """Net change per product from archived months overlapping the window.
+
+    `keep(movement_id, created_at_text)` selects the movements to count.
+    """
+    periods = [period for period in ledger.archived_periods()
+               if ledger.month_bounds(period)[1] > window_start and ledger.month_bounds(period)[0] < window_end]
+    if not periods:
+        return {}
+    wanted = None
+    if product_ids is not None:
+        wanted = set(product_ids)
+    elif category_id is not None:
+        wanted = set(db.session.scalars(select(Product.id).where(Product.category_id == category_id)))
+    fields = ledger.ARCHIVE_FIELDS
+    id_at, created_at, product_at = fields.index('id'), fields.index('created_at'), fields.index('product_id')
+    previous_at, new_at = fields.index('previous_quantity'), fields.index('new_quantity')
+    type_at = fields.index('movement_type')
+    deltas = {}
+    for period in periods:
+        for row in ledger.iter_archived(period, newest_first=False):
+            product_id = row[product_at]
+            if row[type_at] not in STOCK_MOVEMENT_TYPES:
+                continue
+            if (wanted is None or product_id in wanted) and keep(row[id_at], row[created_at]):
+                deltas[product_id] = deltas.get(product_id, 0) + row[new_at] - row[previous_at]
+    return deltas
+
+
+def _merge(base, deltas, sign):
+    for product_id, change in deltas.items():
+        base[product_id] = base.get(product_id, 0) + sign * change
+    return base
+
+
+class _Replay:
+    """Where to start for a point in time and which movements to replay from there"""
+
+    def __init__(self, at):
+        now = datetime.utcnow()
+        before, after = _nearest_checkpoints(at)
+        after_at = after.taken_at if after else now
+        table = InventoryMovement.__table__
+        at_text = at.isoformat()
+        # الحركات بين اللقطتين المحيطتين فقط، فيبقى المسح في نطاق المعرفات القصير
+        after_id = before.last_movement_id if before else 0
+        upto_id = after.last_movement_id if after else None
+        conditions = [table.c.id > after_id]
+        if upto_id is not None:
+            conditions.append(table.c.id <= upto_id)
+
+        def between(movement_id):
+            return movement_id > after_id and (upto_id is None or movement_id <= upto_id)
+
+        if before is not None and at - before.taken_at <= after_at - at:
+            self.checkpoint, self.sign = before, 1
+            self.conditions = conditions + [table.c.created_at < at]
+            self.archive_window = (before.taken_at - ARCHIVE_SLACK, at)
+            self.keep = lambda movement_id, created_at: between(movement_id) and created_at < at_text
+        else:
+            self.checkpoint, self.sign = after, -1
+            self.conditions = conditions + [table.c.created_at >= at]
+            self.archive_window = (at, after_at + ARCHIVE_SLACK)
+            self.keep = lambda movement_id, created_at: between(movement_id) and created_at >= at_text
+        self.base = {
+            'checkpoint': self.checkpoint.id if self.checkpoint else None,
+            'taken_at': self.checkpoint.taken_at if self.checkpoint else now,
+            'direction': 'forward' if self.sign > 0 else 'backward',
+        }
+
+    def base_quantities(self, product_ids=None, category_id=None):
+        if self.checkpoint is not None:
+            return _checkpoint_quantities(self.checkpoint, product_ids, category_id)
+        return dict(db.session.execute(
+            select(Product.id, Product.quantity)
+            .where(*_product_filter(Product.id, product_ids, category_id))).all())
+
+    def archived_deltas(self, product_ids=None, category_id=None):
+        return _archived_deltas(*self.archive_window, self.keep, product_ids, category_id)
+
+
+def stock_as_of(at, product_ids=None, category_id=None):
+    """Quantities on hand just before `at`, as ({product_id: quantity}, base).
+
+    Starts from whichever is closest to `at`: the checkpoint before it
+    (replaying later movements forward), the checkpoint after it, or the
+    live quantities (undoing the movements in between). Only movements
+    between that base and `at` are read, from the live ledger and, for
+    archived months, from the archive. `base` describes what was used.
+    Restrict to `product_ids` or to the products now in `category_id`.
+    """
+    replay = _Replay(at)
+    quantities = replay.base_quantities(product_ids, category_id)
+    _merge(quantities, _live_deltas(replay.conditions, product_ids, category_id), replay.sign)
+    _merge(quantities, replay.archived_deltas(product_ids, category_id), replay.sign)
+    return quantities, replay.base
+
+
+def _report(categories):
+    names = dict(db.session.execute(select(Category.id, Category.name_ar)).all())
+    for category_id, bucket in categories.items():
+        bucket.update(id=category_id, name=names.get(category_id), value=round(bucket['value'], 2))
+    return {
+        'units': sum(bucket['units'] for bucket in categories.values()),
+        'value': round(sum(bucket['value'] for bucket in categories.values()), 2),
+        'categories': sorted(categories.values(), key=lambda bucket: -bucket['value']),
+    }
+
+
+def catalog_valuation(at):
+    """Units and value at current cost price per category for the whole catalog at `at`.
+
+    Same starting point as stock_as_of, but the base and the replayed
+    movements are summed per category in one query instead of being
+    brought back product by product.
+    """
+    replay = _Replay(at)
+    table = InventoryMovement.__table__
+    if replay.checkpoint is not None:
+        base = select(StockCheckpointItem.product_id, StockCheckpointItem.quantity.label('quantity')) \
+            .where(StockCheckpointItem.checkpoint_id == replay.checkpoint.id)
+    else:
+        base = select(Product.id.label('product_id'), Product.quantity.label('quantity'))
+    moved = select(table.c.product_id,
+                   (replay.sign * (table.c.new_quantity - table.c.previous_quantity)).label('quantity')) \
+        .where(*replay.conditions, table.c.movement_type.in_(STOCK_MOVEMENT_TYPES))
+    stock = union_all(base, moved).subquery()
+    cost = db.cast(Product.cost_price, db.Float)
+    rows = db.session.execute(
+        select(Product.category_id, func.sum(stock.c.quantity), func.sum(stock.c.quantity * cost))
+        .join(Product, Product.id == stock.c.product_id)
+        .group_by(Product.category_id))
+    categories = {category_id: {'units': units or 0, 'value': value or 0.0} for category_id, units, value in rows}
+
+    archived = replay.archived_deltas()
+    if archived:
+        for product in db.session.execute(
+                select(Product.id, Product.category_id, cost.label('cost_price'))
+                .where(Product.id.in_(list(archived)))):
+            change = replay.sign * archived[product.id]
+            bucket = categories.setdefault(product.category_id, {'units': 0, 'value': 0.0})
+            bucket['units'] += change
+            bucket['value'] += change * (product.cost_price or 0)
+    return dict(_report(categories), base=replay.base)
+
+
+def valuation(quantities):
+    """Units and value at current cost price per category and per product for a stock_as_of result"""
+    query = select(Product.id, Product.sku, Product.name_ar, Product.category_id,
+                   db.cast(Product.cost_price, db.Float).label('cost_price'))
+    if len(quantities) <= 1000:
+        query = query.where(Product.id.in_(list(quantities)))
+    categories, products = {}, []
+    for product in db.session.execute(query):
+        quantity = quantities.get(product.id)
+        if not quantity:
+            continue
+        value = (product.cost_price or 0) * quantity
+        products.append({'id': product.id, 'sku': product.sku, 'name': product.name_ar,
+                         'quantity': quantity, 'value': round(value, 2)})
+        bucket = categories.setdefault(product.category_id, {'units': 0, 'value': 0.0})
+        bucket['units'] += quantity
+        bucket['value'] += value
+    return dict(_report(categories), products=products)
+
+
+def parse_as_of(value):
+    """datetime for an ISO date or datetime; a bare date means the end of that day"""
+    at = datetime.fromisoformat(value)
+    if len(value) == 10:
+        at += timedelta(days=1)
+    return at
+
+
+# ==========================
+# نقطة /api/stock_as_of
+# ==========================
+@app.route('/api/stock_as_of')
+@login_required
+def stock_as_of_report():
+    """Stock on hand at `at` for one product (`sku`), a category (`category_id`) or the whole catalog"""
+    if not current_user.has_permission('view_reports'):
+        return jsonify({'error': 'ليس لديك صلاحية'}), 403
+    try:
+        at = parse_as_of(request.args.get('at', ''))
+    except ValueError:
+        return jsonify({'error': 'التاريخ غير صحيح'}), 400
+
+    sku = request.args.get('sku', '').strip()
+    category_id = request.args.get('category_id', type=int)
+    product_ids = None
+    if sku:
+        product = Product.query.filter_by(sku=sku).first()
+        if product is None:
+            return jsonify({'error': 'المنتج غير موجود'}), 404
+        product_ids = [product.id]
+
+    if product_ids is None and category_id is None:
+        # الكتالوج كاملاً: الإجماليات فقط، محسوبة في قاعدة البيانات
+        report = catalog_valuation(at)
+    else:
+        quantities, base = stock_as_of(at, product_ids=product_ids, category_id=category_id)
+        report = dict(valuation(quantities), base=base)
+    report['base']['taken_at'] = report['base']['taken_at'].isoformat()
+    return jsonify({'at': at.isoformat(), **report})
+
+
+# ==========================
+# أوامر اللقطات
+# ==========================
+@app.cli.command('stock-checkpoint')
+@click.option('--backfill', is_flag=True, help='إنشاء لقطات بداية كل شهر سابق من سجل الحركات')
+def stock_checkpoint(backfill):
+    """Snapshot current stock levels; run from cron, e.g. daily or at each month start."""
+    if backfill:
+        for checkpoint in backfill_checkpoints():
+            click.echo(f'checkpoint {checkpoint.id} at {checkpoint.taken_at:%Y-%m-%d}: '
+                       f'{checkpoint.product_count} products')
+    checkpoint = take_checkpoint()
+    click.echo(f'checkpoint {checkpoint.id} at {checkpoint.taken_at:%Y-%m-%d %H:%M:%S}: '
+               f'{checkpoint.product_count} products, movements up to #{checkpoint.last_movement_id}')
@@ -1,15 +1,16 @@
 import os
-import secrets
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from PIL import Image
+from functools import lru_cache
 from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+
+# Pillow و ReportLab يُستوردان عند أول استخدام: أغلب العمال يخدمون
+# الـ API فقط ولا يحتاجون أياً منهما
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -19,6 +20,7 @@ def allowed_file(filename):
 
 def resize_image(image_path, max_size=(800, 600)):
     """Resize image to maximum dimensions while maintaining aspect ratio"""
+    from PIL import Image
     try:
         with Image.open(image_path) as img:
             img.thumbnail(max_size, Image.Resampling.LANCZOS)
@@ -26,107 +28,272 @@ def resize_image(image_path, max_size=(800, 600)):
     except Exception as e:
         print(f"Error resizing image: {e}")
 
-def generate_invoice_number():
-    """Generate unique invoice number"""
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    random_suffix = secrets.token_hex(2).upper()
-    return f"INV-{timestamp}-{random_suffix}"
-
-def create_invoice_pdf(sale):
-    """Create PDF invoice for a sale"""
-    filename = f"invoice_{sale.invoice_number}.pdf"
-    filepath = os.path.join("static", "invoices", filename)
-    
-    # Create invoices directory if it doesn't exist
+
+# الأحجام المستخدمة في الواجهات: بطاقة نقطة البيع، صورة القوائم، صفحة التفاصيل
+IMAGE_VARIANTS = {
+    'tile': (300, 300),
+    'thumb': (96, 96),
+    'detail': (800, 800),
+}
+VARIANT_QUALITY = 80
+
+
+@lru_cache(maxsize=None)
+def variant_format():
+    """(format, extension) of sized copies: WebP when Pillow supports it, else JPEG"""
+    from PIL import features
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def variant_name(variant):
+    return f'{variant}.{variant_format()[1]}'
+
+
+def build_image_variants(original_path):
+    """Write every sized variant next to the original; runs inside the image pool"""
+    from PIL import Image, ImageOps
+    fmt = variant_format()[0]
+    directory = os.path.dirname(original_path)
+    with Image.open(original_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        if fmt == 'JPEG' and img.mode == 'RGBA':
+            img = img.convert('RGB')
+        for variant, size in IMAGE_VARIANTS.items():
+            resized = img.copy()
+            resized.thumbnail(size, Image.Resampling.LANCZOS)
+            target = os.path.join(directory, variant_name(variant))
+            partial = f'{target}.{os.getpid()}.tmp'
+            options = {'method': 4} if fmt == 'WEBP' else {'optimize': True}
+            resized.save(partial, fmt, quality=VARIANT_QUALITY, **options)
+            os.replace(partial, target)
+    return directory
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def process_pool(name, workers):
+    """A named process pool, created lazily once per process.
+
+    A forked gunicorn worker notices the pid change and builds its own.
+    Children are spawned, not forked, so they never inherit open
+    database connections or locks.
+    """
+    with _pools_lock:
+        pool, pid = _pools.get(name, (None, None))
+        if pool is None or pid != os.getpid():
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=multiprocessing.get_context('spawn'))
+            _pools[name] = (pool, os.getpid())
+        return pool
+
+
+# ==========================
+# فواتير PDF
+# ==========================
+INVOICE_DIR = os.path.join("static", "invoices")
+# ملف استُخدم خلال هذه المدة قد يكون في طريقه إلى send_file، فلا يُخلى
+INVOICE_EVICT_GRACE_SECONDS = 60
+_pending_renders = {}
+_pending_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _invoice_styles():
+    """ReportLab styles are immutable once built, so build them once per process"""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            spaceAfter=30,
+            alignment=1  # Center alignment
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=12,
+            alignment=1  # Center alignment
+        ),
+        'details_table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]),
+        'items_table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]),
+    }
+
+
+def invoice_data(sale):
+    """Snapshot everything the PDF shows as plain, picklable values"""
+    return {
+        'invoice_number': sale.invoice_number,
+        'created_at': sale.created_at.strftime('%Y-%m-%d %H:%M'),
+        'cashier': sale.employee.full_name,
+        'customer': sale.customer_name or 'عميل عادي',
+        'items': [
+            (item.product_name or item.product.name_ar, item.quantity,
+             f"{item.unit_price:.2f}", f"{item.total_price:.2f}")
+            for item in sale.items
+        ],
+        'subtotal': f"{sum(item.total_price for item in sale.items):.2f}",
+        'discount': f"{sale.discount_amount:.2f}" if sale.discount_amount > 0 else None,
+        'total': f"{sale.total_amount:.2f}",
+    }
+
+
+def invoice_path(data):
+    """Cache location for an invoice: its number plus a hash of its content"""
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(INVOICE_DIR, f"invoice_{data['invoice_number']}_{digest}.pdf")
+
+
+def render_invoice_pdf(data, filepath):
+    """Render an invoice snapshot to `filepath`; runs inside the render pool"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, Spacer
+    styles = _invoice_styles()
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    
-    # Create PDF document
-    doc = SimpleDocTemplate(filepath, pagesize=A4)
+
+    # الكتابة في ملف مؤقت ثم إعادة التسمية حتى لا يُقرأ ملف نصف مكتوب
+    partial = f"{filepath}.{os.getpid()}.tmp"
+    doc = SimpleDocTemplate(partial, pagesize=A4)
     story = []
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=1  # Center alignment
-    )
-    
+
     # Title
-    story.append(Paragraph("فاتورة مبيعات", title_style))
+    story.append(Paragraph("فاتورة مبيعات", styles['title']))
     story.append(Spacer(1, 12))
-    
+
     # Invoice details
-    invoice_data = [
-        ['رقم الفاتورة:', sale.invoice_number],
-        ['التاريخ:', sale.created_at.strftime('%Y-%m-%d %H:%M')],
-        ['الكاشير:', sale.employee.full_name],
-        ['العميل:', sale.customer_name or 'عميل عادي'],
-    ]
-    
-    invoice_table = Table(invoice_data, colWidths=[2*inch, 3*inch])
-    invoice_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
+    invoice_table = Table([
+        ['رقم الفاتورة:', data['invoice_number']],
+        ['التاريخ:', data['created_at']],
+        ['الكاشير:', data['cashier']],
+        ['العميل:', data['customer']],
+    ], colWidths=[2*inch, 3*inch])
+    invoice_table.setStyle(styles['details_table'])
+
     story.append(invoice_table)
     story.append(Spacer(1, 20))
-    
+
     # Items table
     items_data = [['المنتج', 'الكمية', 'سعر الوحدة', 'الإجمالي']]
-    
-    for item in sale.items:
-        items_data.append([
-            item.product.name_ar,
-            str(item.quantity),
-            f"{item.unit_price:.2f} جنية",
-            f"{item.total_price:.2f} جنية"
-        ])
-    
+    for name, quantity, unit_price, total_price in data['items']:
+        items_data.append([name, str(quantity), f"{unit_price} جنية", f"{total_price} جنية"])
+
     # Add totals
-    items_data.append(['', '', 'المجموع الفرعي:', f"{sum(item.total_price for item in sale.items):.2f} جنية"])
-    if sale.discount_amount > 0:
-        items_data.append(['', '', 'الخصم:', f"-{sale.discount_amount:.2f} جنية"])
-    items_data.append(['', '', 'الإجمالي النهائي:', f"{sale.total_amount:.2f} جنية"])
+    items_data.append(['', '', 'المجموع الفرعي:', f"{data['subtotal']} جنية"])
+    if data['discount']:
+        items_data.append(['', '', 'الخصم:', f"-{data['discount']} جنية"])
+    items_data.append(['', '', 'الإجمالي النهائي:', f"{data['total']} جنية"])
 
     items_table = Table(items_data, colWidths=[3*inch, 1*inch, 1.5*inch, 1.5*inch])
-    items_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
+    items_table.setStyle(styles['items_table'])
+
     story.append(items_table)
     story.append(Spacer(1, 20))
-    
+
     # Footer
-    footer_text = "شكراً لزيارتكم - نتمنى لكم يوماً سعيداً"
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=12,
-        alignment=1  # Center alignment
-    )
-    story.append(Paragraph(footer_text, footer_style))
-    
+    story.append(Paragraph("شكراً لزيارتكم - نتمنى لكم يوماً سعيداً", styles['footer']))
+
     # Build PDF
     doc.build(story)
-    
+    os.replace(partial, filepath)
     return filepath
 
+
+def evict_invoices(max_bytes):
+    """Delete least recently used invoice PDFs until the store fits in `max_bytes`.
+
+    Files used in the last INVOICE_EVICT_GRACE_SECONDS are kept even when
+    the store stays over its budget for a while.
+    """
+    try:
+        entries = [entry for entry in os.scandir(INVOICE_DIR)
+                   if entry.is_file() and entry.name.endswith('.pdf')]
+    except FileNotFoundError:
+        return
+    files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries))
+    total = sum(size for _, size, _ in files)
+    recent = time.time() - INVOICE_EVICT_GRACE_SECONDS
+    for mtime, size, path in files:
+        if total <= max_bytes or mtime > recent:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def create_invoice_pdf(sale, workers=2, timeout=None, max_bytes=200 * 1024 * 1024):
+    """Return the path of the PDF invoice for a sale, rendering it if needed.
+
+    PDFs are cached on disk by invoice number plus content hash, so any
+    edit to the sale produces a fresh file. Rendering happens in a
+    process pool; concurrent requests for the same invoice share one
+    render. Raises concurrent.futures.TimeoutError when the render takes
+    longer than `timeout` seconds; it keeps running and a retry picks
+    up the result.
+    """
+    data = invoice_data(sale)
+    filepath = invoice_path(data)
+
+    try:
+        # تحديث وقت التعديل ليعكس آخر استخدام في سياسة الإخلاء
+        os.utime(filepath)
+        return filepath
+    except FileNotFoundError:
+        pass
+
+    with _pending_lock:
+        future = _pending_renders.get(filepath)
+        if future is None:
+            future = process_pool('invoices', workers).submit(render_invoice_pdf, data, filepath)
+            _pending_renders[filepath] = future
+
+            def _finished(done, filepath=filepath):
+                with _pending_lock:
+                    _pending_renders.pop(filepath, None)
+                if done.exception() is None:
+                    evict_invoices(max_bytes)
+
+            future.add_done_callback(_finished)
+
+    return future.result(timeout=timeout)
+
+
+def open_invoice_pdf(sale, **options):
+    """create_invoice_pdf, opened for sending.
+
+    The open file survives an eviction that runs while it is being sent;
+    a file evicted before it could be opened is rendered again.
+    """
+    try:
+        return open(create_invoice_pdf(sale, **options), 'rb')
+    except FileNotFoundError:
+        return open(create_invoice_pdf(sale, **options), 'rb')
+
 def calculate_profit_margin(selling_price, cost_price):
     """Calculate profit margin percentage"""
     if not cost_price or cost_price == 0: